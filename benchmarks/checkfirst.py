@@ -0,0 +1,102 @@
+"""
+Round trips and time of create_all and drop_all with checkfirst, comparing the
+stock SQLAlchemy DDL runners, which query has_table once per table and send one
+statement per round trip, with the hawq runners. No database is needed: each
+round trip is simulated by a fixed latency.
+
+Usage:
+    python benchmarks/checkfirst.py --tables 1000 10000 --latency 0.001
+"""
+import argparse
+import contextlib
+import time
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text
+from sqlalchemy.sql import ddl as sqlalchemy_ddl
+
+from sqlalchemy_hawq import ddl
+from sqlalchemy_hawq.dialect import HawqDialect
+
+
+class Rows(list):
+    def first(self):
+        return self[0] if self else None
+
+
+class LatencyConnection:
+    """
+    Compiles what is executed and sleeps for the latency of each round trip. Either
+    all tables exist (to drop them) or none do (to create them)
+    """
+
+    def __init__(self, latency, exists):
+        self.dialect = HawqDialect()
+        self.dialect.default_schema_name = 'public'
+        self.latency = latency
+        self.exists = exists
+        self.round_trips = 0
+
+    @contextlib.contextmanager
+    def connect(self):
+        yield self
+
+    def get_execution_options(self):
+        return {}
+
+    def schema_for_object(self, obj):
+        return obj.schema
+
+    def execute(self, statement, *multiparams, **params):
+        self.round_trips += 1
+        time.sleep(self.latency)
+        if statement is ddl.EXISTING_TABLES_QUERY:
+            return Rows(('public', name) for name in params['names'] if self.exists)
+        if not isinstance(statement, str):
+            str(statement.compile(dialect=self.dialect))
+        return Rows([('exists',)] if self.exists else [])  # has_table
+
+
+def build_metadata(tables):
+    metadata = MetaData()
+    for i in range(tables):
+        Table(
+            'bench_checkfirst_{}'.format(i),
+            metadata,
+            Column('id', Integer),
+            Column('value', Text),
+            hawq_appendonly=True,
+            hawq_distributed_by='id',
+        )
+    return metadata
+
+
+def run(runner, metadata, latency, exists, **kwargs):
+    connection = LatencyConnection(latency, exists)
+    start = time.perf_counter()
+    runner(connection.dialect, connection, checkfirst=True, **kwargs).traverse_single(metadata)
+    return time.perf_counter() - start, connection.round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tables', type=int, nargs='+', default=[1000, 10000], help='tables per run')
+    parser.add_argument('--latency', type=float, default=0.001, help='seconds per round trip')
+    parser.add_argument('--batch-size', type=int, default=ddl.DDL_BATCH_SIZE, help='DDL statements per round trip')
+    args = parser.parse_args()
+
+    print('{:<8} {:<7} {:<6} {:>12} {:>10}'.format('tables', 'runner', 'ddl', 'round trips', 'seconds'))
+    for tables in args.tables:
+        metadata = build_metadata(tables)
+        runs = [
+            ('stock', 'create', sqlalchemy_ddl.SchemaGenerator, {}),
+            ('hawq', 'create', ddl.HawqSchemaGenerator, {'batch_size': args.batch_size}),
+            ('stock', 'drop', sqlalchemy_ddl.SchemaDropper, {}),
+            ('hawq', 'drop', ddl.HawqSchemaDropper, {'batch_size': args.batch_size}),
+        ]
+        for label, operation, runner, kwargs in runs:
+            elapsed, round_trips = run(runner, metadata, args.latency, operation == 'drop', **kwargs)
+            print('{:<8} {:<7} {:<6} {:>12} {:>10.3f}'.format(tables, label, operation, round_trips, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Time to compile the CREATE TABLE statements of a large model, with and without
+the compile cache of the WITH and PARTITION BY clauses. Tables cycle through a
+few storage options and partition plans, as in a model of many similar tables.
+
+Usage:
+    python benchmarks/ddl_compile.py --tables 5000
+"""
+from collections import OrderedDict
+import argparse
+import time
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text
+from sqlalchemy.schema import CreateTable
+
+from sqlalchemy_hawq import ddl
+from sqlalchemy_hawq.dialect import HawqDialect
+from sqlalchemy_hawq.partition import ListPartition, RangePartition, RangeSubpartition
+
+
+CHROMOSOMES = OrderedDict(('chr{}'.format(i), 'chr{}'.format(i)) for i in range(1, 23))
+
+OPTIONS = [
+    {'hawq_appendonly': True, 'hawq_orientation': 'parquet', 'hawq_compresstype': 'SNAPPY'},
+    {'hawq_appendonly': True, 'hawq_compresstype': 'ZLIB', 'hawq_compresslevel': 5},
+    {'hawq_appendonly': True, 'hawq_distributed_by': 'id', 'hawq_bucketnum': 16},
+]
+
+PLANS = [
+    None,
+    lambda: ListPartition('chrom', CHROMOSOMES, [RangeSubpartition('pos', 0, 250000000, 10000000)]),
+    lambda: RangePartition('pos', 0, 250000000, 1000000),
+]
+
+
+def build_metadata(tables):
+    metadata = MetaData()
+    for i in range(tables):
+        plan = PLANS[i % len(PLANS)]
+        Table(
+            'bench_ddl_{}'.format(i),
+            metadata,
+            Column('id', Integer),
+            Column('chrom', Text),
+            Column('pos', Integer),
+            Column('value', Text),
+            hawq_partition_by=plan() if plan else None,
+            **OPTIONS[i % len(OPTIONS)]
+        )
+    return metadata
+
+
+def compile_all(dialect, metadata):
+    start = time.perf_counter()
+    for table in metadata.sorted_tables:
+        str(CreateTable(table).compile(dialect=dialect))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tables', type=int, default=5000, help='tables compiled per run')
+    parser.add_argument('--repeat', type=int, default=3, help='runs, of which the fastest is reported')
+    args = parser.parse_args()
+
+    metadata = build_metadata(args.tables)
+    for label, cache in (('uncached', False), ('cached', True)):
+        dialect = HawqDialect(ddl_compile_cache=cache)
+        ddl.clear_compile_cache()
+        elapsed = min(compile_all(dialect, metadata) for _ in range(args.repeat))
+        print('{:<9} {:>8.3f}s {:>10.0f} tables/s'.format(label, elapsed, args.tables / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Serves pre-built rows through a real ResultProxy, for offline benchmarks of the
+client-side decoding cost without a database.
+"""
+from types import SimpleNamespace
+
+from sqlalchemy.engine.result import ResultProxy
+
+
+class MemoryCursor:
+    """
+    DBAPI cursor stand-in serving pre-built rows
+    """
+
+    def __init__(self, description, rows):
+        self.description = description
+        self.rows = rows
+        self.position = 0
+
+    def fetchmany(self, size):
+        batch = self.rows[self.position:self.position + size]
+        self.position += len(batch)
+        return batch
+
+    def fetchall(self):
+        return self.fetchmany(len(self.rows))
+
+    def fetchone(self):
+        batch = self.fetchmany(1)
+        return batch[0] if batch else None
+
+    def close(self):
+        pass
+
+
+def memory_result(dialect, compiled, description, rows):
+    """
+    A ResultProxy for the compiled query, fetching the given rows
+    """
+    context = SimpleNamespace(
+        dialect=dialect,
+        cursor=MemoryCursor(description, rows),
+        root_connection=SimpleNamespace(
+            _echo=False, _safe_close_cursor=lambda cursor: None, should_close_with_result=False
+        ),
+        compiled=compiled,
+        execution_options={},
+        result_column_struct=(
+            compiled._result_columns,
+            compiled._ordered_columns,
+            compiled._textual_ordered_columns,
+        ),
+        _translate_colname=None,
+        get_result_processor=lambda type_, colname, coltype: type_._cached_result_processor(
+            dialect, coltype
+        ),
+    )
+    return ResultProxy(context)
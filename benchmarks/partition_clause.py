@@ -0,0 +1,44 @@
+"""
+Time to render the PARTITION BY clause of list partitions with many values,
+with a range subpartition template, and count their leaf partitions.
+
+Usage:
+    python benchmarks/partition_clause.py --values 50000
+"""
+from collections import OrderedDict
+import argparse
+import time
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text
+
+from sqlalchemy_hawq.partition import ListPartition, RangeSubpartition
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--values', type=int, default=50000, help='values of the list partition')
+    parser.add_argument('--repeat', type=int, default=3, help='runs, of which the fastest is reported')
+    args = parser.parse_args()
+
+    table = Table('bench_partition', MetaData(), Column('chrom', Text), Column('pos', Integer))
+    plans = {
+        'text': ListPartition(
+            'chrom',
+            OrderedDict(('p{}'.format(i), 'v{}'.format(i)) for i in range(args.values)),
+            [RangeSubpartition('pos', 0, 100, 10)],
+        ),
+        'integer': ListPartition('pos', OrderedDict(('p{}'.format(i), i) for i in range(args.values))),
+    }
+    for label, plan in plans.items():
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            clause = plan.clause(table)
+            timings.append(time.perf_counter() - start)
+        print('{:<8} {:>8.3f}s {:>10} chars {:>10} leaf partitions'.format(
+            label, min(timings), len(clause), plan.leaf_count()
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Throughput of client-side partition routing: bucketing rows by leaf partition
+with the numpy-vectorized and the pure Python evaluation of the partition plan.
+
+Usage:
+    python benchmarks/partition_routing.py --rows 1000000
+"""
+from collections import OrderedDict
+import argparse
+import random
+import time
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text
+
+from sqlalchemy_hawq import partition, routing
+from sqlalchemy_hawq.partition import ListPartition, RangeSubpartition
+from sqlalchemy_hawq.routing import PartitionRouter
+
+
+REGIONS = OrderedDict(('region{}'.format(i), 'r{}'.format(i)) for i in range(20))
+
+
+def build_table():
+    return Table(
+        'bench_routing',
+        MetaData(),
+        Column('id', Integer, primary_key=True, autoincrement=False),
+        Column('region', Text),
+        Column('day', Integer),
+        hawq_partition_by=ListPartition('region', REGIONS, [RangeSubpartition('day', 0, 365, 7)]),
+    )
+
+
+def build_rows(rows):
+    codes = list(REGIONS.values()) + ['unknown']
+    return [
+        {'id': i, 'region': random.choice(codes), 'day': random.randrange(-10, 400)}
+        for i in range(rows)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000, help='rows bucketed per run')
+    args = parser.parse_args()
+
+    router = PartitionRouter(build_table())
+    rows = build_rows(args.rows)
+    numpy = partition.numpy
+
+    for label in ('numpy', 'python'):
+        if label == 'python':
+            partition.numpy = routing.numpy = None
+        elif numpy is None:
+            continue
+        start = time.perf_counter()
+        buckets = router.bucket(rows)
+        elapsed = time.perf_counter() - start
+        print('{:<8} {:>8.3f}s {:>12.0f} rows/s {:>6} partitions'.format(
+            label, elapsed, args.rows / elapsed, len(buckets)
+        ))
+
+
+if __name__ == '__main__':
+    main()
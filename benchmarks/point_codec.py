@@ -0,0 +1,72 @@
+"""
+Microbenchmarks for the Point bind/result conversion.
+
+Compares the original per-row implementation (str() and an uncompiled re.match)
+with the current per-value processors and the batch codec.
+
+Usage:
+    python benchmarks/point_codec.py --points 1000000
+"""
+import argparse
+import random
+import re
+import timeit
+
+from sqlalchemy_hawq.point import (
+    Point,
+    format_points,
+    parse_points,
+    points_to_array,
+)
+
+
+def legacy_bind(value):
+    if value is None:
+        return None
+    val1, val2 = value
+    if val1 is None or val2 is None:
+        return None
+    return str(value)
+
+
+def legacy_result(value):
+    if value is None:
+        return None
+    match = re.match(r'^\((?P<x>\d+(\.\d+)?),(?P<y>\d+(\.\d+)?)\)$', value)
+    return (float(match.group('x')), float(match.group('y')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, default=100000, help='points converted per run')
+    parser.add_argument('--repeat', type=int, default=3, help='best of this many runs')
+    args = parser.parse_args()
+
+    # non-negative, since the legacy pattern does not accept negative coordinates
+    points = [(random.uniform(0, 180), random.uniform(0, 90)) for _ in range(args.points)]
+    wire = ['({!r},{!r})'.format(x, y) for x, y in points]
+    bind = Point().bind_processor(None)
+    result = Point().result_processor(None, None)
+
+    cases = [
+        ('bind legacy', lambda: [legacy_bind(p) for p in points]),
+        ('bind processor', lambda: [bind(p) for p in points]),
+        ('bind batch', lambda: format_points(points)),
+        ('result legacy', lambda: [legacy_result(w) for w in wire]),
+        ('result processor', lambda: [result(w) for w in wire]),
+        ('result batch', lambda: parse_points(wire)),
+    ]
+    try:
+        import numpy  # noqa: F401 pylint: disable=import-outside-toplevel,unused-import
+
+        cases.append(('result array', lambda: points_to_array(wire)))
+    except ImportError:
+        pass
+
+    for label, func in cases:
+        elapsed = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print('{:<18} {:>8.3f}s {:>8.0f} ns/point'.format(label, elapsed, elapsed / args.points * 1e9))
+
+
+if __name__ == '__main__':
+    main()
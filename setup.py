@@ -12,6 +12,9 @@ DOCUMENTATION_REQS = []
 # Dependencies required only for running tests
 TEST_REQS = ['pytest>=4.4.0', 'pytest-cov', 'mock', 'pytest-xdist']
 
+# Optional dependencies for columnar result fetching
+NUMPY_REQS = ['numpy']
+
 # Dependencies required for deploying to an index server
 DEPLOYMENT_REQS = ['twine', 'wheel', 'm2r']
 
@@ -38,6 +41,7 @@ setup(
         'dev': TEST_REQS + DEPLOYMENT_REQS + DOCUMENTATION_REQS + DEVELOPMENT_REQS,
         'test': TEST_REQS,
         'deploy': DEPLOYMENT_REQS,
+        'numpy': NUMPY_REQS,
     },
     python_requires='>=3.6',
     author_email='creisle@bcgsc.ca',
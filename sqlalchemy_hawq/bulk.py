@@ -0,0 +1,294 @@
+'''
+Bulk loading support for the Apache Hawq database
+
+Converts executemany INSERT statements into a streamed COPY ... FROM STDIN,
+or into multi-row INSERT ... VALUES statements sized by a byte budget
+'''
+import datetime
+import decimal
+import logging
+import math
+import re
+import time
+import uuid
+
+from psycopg2.extensions import encodings
+
+
+logger = logging.getLogger(__name__)
+
+#: matches a single pyformat bound parameter, e.g. %(name)s
+BIND_PARAM_PATTERN = re.compile(r'%\((?P<name>[^)]+)\)s')
+
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+COPY_NULL = '\\N'
+
+
+class BulkNotSupported(Exception):
+    """
+    Raised when an executemany INSERT cannot use a bulk path and the regular
+    executemany path must be used instead
+    """
+
+
+class CopyNotSupported(BulkNotSupported):
+    """
+    Raised when an INSERT cannot be converted to COPY and the regular
+    executemany path must be used instead
+    """
+
+
+def copy_value(value):
+    '''
+    Format a single (already bind-processed) parameter value as a field of
+    the COPY text format
+
+    Args:
+        value: the DBAPI-level parameter value
+
+    Returns:
+        str: the escaped field
+
+    Raises:
+        CopyNotSupported: when the value has no unambiguous text representation
+    '''
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, str):
+        return value.translate(COPY_ESCAPES)
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return 'Infinity' if value > 0 else '-Infinity'
+        return repr(value)
+    if isinstance(value, (decimal.Decimal, datetime.date, datetime.time, uuid.UUID)):
+        # datetime.datetime is a subclass of datetime.date
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '\\\\x' + bytes(value).hex()
+    raise CopyNotSupported('no COPY text representation for ({})'.format(type(value)))
+
+
+class CopyRowError(ValueError):
+    """
+    Raised when a parameter set cannot be sent by a COPY that has already started.
+    The COPY has failed, and aborted the transaction, so there is no fallback to
+    the regular executemany path
+    """
+
+
+class CopyStream:
+    """
+    Read-only file-like object which renders parameter sets as COPY text
+    lazily, so that only one chunk is held in memory at a time. The chunks are
+    encoded in the client encoding, so that the bytes read are those sent.
+
+    Args:
+        parameters (list of dict): the executemany parameter sets
+        keys (list of str): the parameter names, in column order
+        chunk_size (int): approximate number of characters to render per read
+        encoding (str): the Python name of the client encoding
+    """
+
+    def __init__(self, parameters, keys, chunk_size=64 * 1024, encoding='utf8'):
+        self.parameters = iter(parameters)
+        self.keys = keys
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self.rows = 0
+        self.bytes = 0
+        self.error = None
+        self._buffer = ''
+
+    def _render(self, size):
+        lines = []
+        total = 0
+        keys = self.keys
+        for params in self.parameters:
+            try:
+                line = '\t'.join([copy_value(params[key]) for key in keys]) + '\n'
+            except CopyNotSupported as err:
+                self.error = CopyRowError('parameter set {} cannot be sent by COPY: {}'.format(self.rows, err))
+                raise self.error from err
+            lines.append(line)
+            total += len(line)
+            self.rows += 1
+            if total >= size:
+                break
+        return ''.join(lines)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.chunk_size
+        if len(self._buffer) < size:
+            self._buffer += self._render(max(size, self.chunk_size) - len(self._buffer))
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        chunk = chunk.encode(self.encoding)
+        self.bytes += len(chunk)
+        return chunk
+
+
+def copy_statement(statement, values_expr):
+    '''
+    Rewrite a compiled single-row INSERT into the equivalent COPY statement
+
+    Args:
+        statement (str): the compiled INSERT statement
+        values_expr (str): the compiled VALUES expression for a single row
+
+    Returns:
+        tuple of (str, list of str): the COPY statement and the parameter names
+            in column order
+
+    Raises:
+        CopyNotSupported: when the VALUES contain anything other than bound parameters
+    '''
+    values_clause = ' VALUES ({})'.format(values_expr)
+    if not statement.startswith('INSERT INTO ') or not statement.endswith(values_clause):
+        raise CopyNotSupported('statement is not a plain INSERT ... VALUES')
+
+    keys = BIND_PARAM_PATTERN.findall(values_expr)
+    if ', '.join('%({})s'.format(key) for key in keys) != values_expr:
+        raise CopyNotSupported('VALUES contains SQL expressions')
+
+    target = statement[len('INSERT INTO '):-len(values_clause)]
+    return 'COPY {} FROM STDIN'.format(target), keys
+
+
+def copy_executemany(cursor, statement, parameters, context):
+    '''
+    Execute an executemany INSERT as a single COPY ... FROM STDIN
+
+    Args:
+        cursor: the DBAPI cursor
+        statement (str): the compiled INSERT statement
+        parameters (list of dict): the bind-processed parameter sets
+        context: the execution context of the INSERT
+
+    Returns:
+        CopyStream: the exhausted stream, holding the row and byte counts
+
+    Raises:
+        CopyNotSupported: when the statement or its first parameter set cannot be sent
+            by COPY, before the COPY is started
+        CopyRowError: when a later parameter set cannot be sent by COPY, which fails
+            the COPY
+    '''
+    compiled = context.compiled if context is not None else None
+    if compiled is None or not context.isinsert or not compiled.insert_single_values_expr:
+        raise CopyNotSupported('not a compiled INSERT')
+    copy_sql, keys = copy_statement(statement, compiled.insert_single_values_expr)
+
+    # validate the first row up front so unsupported types fall back before any data is sent
+    if parameters:
+        for key in keys:
+            copy_value(parameters[0][key])
+
+    stream = CopyStream(parameters, keys, encoding=encodings[cursor.connection.encoding])
+    start = time.perf_counter()
+    try:
+        cursor.copy_expert(copy_sql, stream)
+    except Exception as err:
+        if stream.error is not None and err is not stream.error:
+            # the DBAPI reports the failed read of the stream as its own error
+            raise stream.error from err
+        raise
+    elapsed = time.perf_counter() - start
+
+    logger.info(
+        '%s: %d rows (%d bytes) in %.3fs (%.0f rows/s)',
+        copy_sql,
+        stream.rows,
+        stream.bytes,
+        elapsed,
+        stream.rows / elapsed if elapsed else float('inf'),
+    )
+    return stream
+
+
+def split_values_statement(statement, values_expr):
+    '''
+    Split a compiled single-row INSERT around its VALUES expression
+
+    Args:
+        statement (str): the compiled INSERT statement
+        values_expr (str): the compiled VALUES expression for a single row
+
+    Returns:
+        tuple of (str, str, str): the text before the row, the row template, and
+            the text after the row
+
+    Raises:
+        BulkNotSupported: when the VALUES expression is not found in the statement
+    '''
+    template = '({})'.format(values_expr)
+    marker = ' VALUES ' + template
+    if statement.count(marker) != 1:
+        raise BulkNotSupported('VALUES expression not found in statement')
+    prefix, suffix = statement.split(marker)
+    return prefix + ' VALUES ', template, suffix
+
+
+def values_executemany(cursor, statement, parameters, context, max_bytes, page_size=None):
+    '''
+    Execute an executemany INSERT as a series of multi-row INSERT ... VALUES statements
+
+    Each statement is filled with rows until adding the next row would take it over
+    max_bytes, so the number of rows per statement adapts to the width of the rows.
+    The bytes sent are set as the hawq_bytes_sent of the context, for the stats
+    collector.
+
+    Args:
+        cursor: the DBAPI cursor
+        statement (str): the compiled INSERT statement
+        parameters (list of dict): the bind-processed parameter sets
+        context: the execution context of the INSERT
+        max_bytes (int): the size budget for each statement sent to the server
+        page_size (int, optional): the maximum number of rows per statement
+
+    Returns:
+        int: the number of statements executed
+
+    Raises:
+        BulkNotSupported: when the statement is not a compiled single-row INSERT
+    '''
+    compiled = context.compiled if context is not None else None
+    if compiled is None or not context.isinsert or not compiled.insert_single_values_expr:
+        raise BulkNotSupported('not a compiled INSERT')
+    prefix, template, suffix = split_values_statement(
+        statement, compiled.insert_single_values_expr
+    )
+
+    encoding = encodings[cursor.connection.encoding]
+    # the rendered statement is sent without parameters, so un-escape literal percent signs
+    prefix = prefix.replace('%%', '%').encode(encoding)
+    suffix = suffix.replace('%%', '%').encode(encoding)
+
+    statements = 0
+    sent = 0
+    rows = []
+    size = len(prefix) + len(suffix)
+    for params in parameters:
+        row = cursor.mogrify(template, params)
+        if rows and (size + len(row) + 1 > max_bytes or len(rows) == page_size):
+            cursor.execute(prefix + b','.join(rows) + suffix)
+            statements += 1
+            sent += size - 1
+            rows = []
+            size = len(prefix) + len(suffix)
+        rows.append(row)
+        size += len(row) + 1
+    if rows:
+        cursor.execute(prefix + b','.join(rows) + suffix)
+        statements += 1
+        sent += size - 1
+    context.hawq_bytes_sent = sent
+
+    logger.debug('%d rows sent in %d INSERT statements', len(parameters), statements)
+    return statements
@@ -0,0 +1,309 @@
+'''
+In-process cache of the partition catalog of the Apache Hawq database
+
+Catalog queries are slow on a busy master. PartitionIndex loads every partition
+definition with one query on pg_partitions and pg_partition_columns, answers
+lookups from memory, and reloads once its TTL expires or it is invalidated (the
+dialect invalidates it whenever it runs DDL or TRUNCATE).
+
+The partition definitions are also used to rebuild the hawq_partition_by of
+partitioned tables when they are reflected.
+'''
+import collections
+import logging
+import re
+import threading
+import time
+
+from sqlalchemy import text
+
+from .partition import ListPartition, ListSubpartition, RangePartition, RangeSubpartition
+
+
+logger = logging.getLogger(__name__)
+
+
+PARTITIONS_QUERY = text('''
+SELECT p.schemaname, p.tablename, p.partitionschemaname, p.partitiontablename,
+    p.partitionname, p.parentpartitiontablename, p.partitionlevel, p.partitiontype,
+    p.partitionrank, p.partitionposition, p.partitionlistvalues, p.partitionrangestart,
+    p.partitionstartinclusive, p.partitionrangeend, p.partitionendinclusive,
+    p.partitionisdefault, p.partitionboundary, c.columnname
+FROM pg_partitions p
+LEFT JOIN pg_partition_columns c
+    ON c.schemaname = p.schemaname
+    AND c.tablename = p.tablename
+    AND c.partitionlevel = p.partitionlevel
+ORDER BY p.schemaname, p.tablename, p.partitionlevel, p.partitionposition, c.position_in_partition_key
+''')
+
+#: a cast suffixed to the partition boundaries in pg_partitions, e.g. 'chr1'::text
+CAST_SUFFIX = re.compile(r'::[\w\s"]+(\[\])?$')
+
+#: the name HAWQ gives the child tables of partitions, e.g. sales_1_prt_2
+CHILD_TABLE_NAME = re.compile(r'_\d+_prt_')
+
+#: statements after which the cached partition catalog may be stale
+INVALIDATING_STATEMENT = re.compile(r'^\s*(ALTER|CREATE|DROP|TRUNCATE)\b', re.IGNORECASE)
+
+
+PartitionInfo = collections.namedtuple(
+    'PartitionInfo',
+    [
+        'schema',
+        'table',
+        'child_schema',
+        'child',
+        'name',
+        'parent',
+        'level',
+        'type',
+        'rank',
+        'position',
+        'list_values',
+        'range_start',
+        'start_inclusive',
+        'range_end',
+        'end_inclusive',
+        'is_default',
+        'boundary',
+        'columns',
+    ],
+)
+PartitionInfo.__doc__ = '''
+A child table of a partitioned table, as described by pg_partitions. columns are
+the names of the columns partitioned on at its level.
+'''
+
+
+class PartitionIndex:
+    """
+    Partition definitions of all partitioned tables, loaded with one catalog query
+    and cached for ttl seconds
+
+    Args:
+        ttl (float): seconds before the cached definitions are reloaded, or None to
+            only reload when invalidated
+        clock (callable): returns the current time in seconds
+    """
+
+    def __init__(self, ttl=300, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._partitions = {}
+        self._children = {}
+
+    def invalidate(self):
+        '''
+        Drop the cached definitions, so the next lookup reloads them
+        '''
+        with self._lock:
+            self._loaded_at = None
+
+    def expired(self):
+        '''
+        Returns:
+            bool: True when the next lookup will reload the definitions
+        '''
+        loaded_at = self._loaded_at
+        return loaded_at is None or (self.ttl is not None and self.clock() - loaded_at >= self.ttl)
+
+    def load(self, connection):
+        '''
+        (Re)load the partition definitions of all tables
+
+        Args:
+            connection (sqlalchemy.engine.Connection): the connection to query the catalog with
+        '''
+        loaded_at = self.clock()
+        partitions = collections.OrderedDict()
+        for row in connection.execute(PARTITIONS_QUERY):
+            key = (row.partitionschemaname, row.partitiontablename)
+            if key in partitions:
+                # one row per column of a multi-column partition key
+                if row.columnname is not None:
+                    partitions[key].columns.append(row.columnname)
+                continue
+            partitions[key] = PartitionInfo(
+                schema=row.schemaname,
+                table=row.tablename,
+                child_schema=row.partitionschemaname,
+                child=row.partitiontablename,
+                name=row.partitionname,
+                parent=row.parentpartitiontablename,
+                level=row.partitionlevel,
+                type=row.partitiontype,
+                rank=row.partitionrank,
+                position=row.partitionposition,
+                list_values=row.partitionlistvalues,
+                range_start=row.partitionrangestart,
+                start_inclusive=row.partitionstartinclusive,
+                range_end=row.partitionrangeend,
+                end_inclusive=row.partitionendinclusive,
+                is_default=row.partitionisdefault,
+                boundary=row.partitionboundary,
+                columns=[] if row.columnname is None else [row.columnname],
+            )
+
+        by_table = collections.defaultdict(list)
+        for info in partitions.values():
+            by_table[(info.schema, info.table)].append(info)
+        with self._lock:
+            self._partitions = dict(by_table)
+            self._children = partitions
+            self._loaded_at = loaded_at
+        logger.debug('loaded %d partitions of %d tables', len(partitions), len(by_table))
+
+    def _ensure_loaded(self, connection):
+        if self.expired():
+            self.load(connection)
+
+    @staticmethod
+    def _schema(connection, schema):
+        return schema if schema is not None else connection.dialect.default_schema_name
+
+    def partitions(self, connection, table_name, schema=None):
+        '''
+        The child tables of a partitioned table, at all levels
+
+        Args:
+            connection (sqlalchemy.engine.Connection): the connection to load the catalog with
+            table_name (str): the name of the partitioned (root) table
+            schema (str, optional): the schema of the table, if not the default schema
+
+        Returns:
+            list of PartitionInfo: the child tables ordered by level and position,
+            or an empty list if the table is not partitioned
+        '''
+        self._ensure_loaded(connection)
+        return list(self._partitions.get((self._schema(connection, schema), table_name), ()))
+
+    def partition_columns(self, connection, table_name, schema=None):
+        '''
+        The columns a table is partitioned on, by level
+
+        Returns:
+            list of list of str: the column names at each level, from the top
+        '''
+        columns = collections.OrderedDict()
+        for info in self.partitions(connection, table_name, schema):
+            columns.setdefault(info.level, info.columns)
+        return list(columns.values())
+
+    def partition(self, connection, child_name, schema=None):
+        '''
+        The definition of a child table
+
+        Args:
+            connection (sqlalchemy.engine.Connection): the connection to load the catalog with
+            child_name (str): the name of the child table
+            schema (str, optional): the schema of the child table, if not the default schema
+
+        Returns:
+            PartitionInfo: the definition, or None when the table is not a partition
+        '''
+        self._ensure_loaded(connection)
+        return self._children.get((self._schema(connection, schema), child_name))
+
+    def is_partition(self, connection, table_name, schema=None):
+        '''
+        Returns:
+            bool: True when the table is the child table of a partition
+        '''
+        return self.partition(connection, table_name, schema) is not None
+
+
+def boundary_value(expression):
+    '''
+    The value of a partition boundary expression from pg_partitions
+
+    Args:
+        expression (str): the boundary, e.g. 2009 or 'chr1'::text
+
+    Returns:
+        the value as int or float for numbers, or str for quoted literals
+    '''
+    expression = CAST_SUFFIX.sub('', expression.strip())
+    if expression[:1] == "'" and expression[-1:] == "'":
+        return expression[1:-1].replace("''", "'")
+    try:
+        return int(expression)
+    except ValueError:
+        return float(expression)
+
+
+def _range_level(level, partitions):
+    ranges = [
+        (boundary_value(info.range_start), boundary_value(info.range_end))
+        for info in partitions
+        if not info.is_default
+    ]
+    if not ranges or not all(info.start_inclusive and not info.end_inclusive
+                             for info in partitions if not info.is_default):
+        return None
+    ranges.sort()
+    every = ranges[0][1] - ranges[0][0]
+    for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+        if end != next_start or end - start != every:
+            return None  # not expressible as START/END/EVERY
+    if ranges[-1][1] - ranges[-1][0] > every:
+        return None  # only the last range can be short of every
+    partition_class = RangePartition if level == 0 else RangeSubpartition
+    return partition_class(partitions[0].columns[0], ranges[0][0], ranges[-1][1], every)
+
+
+def _list_level(level, partitions):
+    mapping = collections.OrderedDict()
+    for info in partitions:
+        if info.is_default:
+            continue
+        values = info.list_values.split(',')
+        if len(values) != 1:
+            return None  # ListPartition maps each partition to a single value
+        mapping[info.name] = boundary_value(values[0])
+    partition_class = ListPartition if level == 0 else ListSubpartition
+    return partition_class(partitions[0].columns[0], mapping)
+
+
+def rebuild_partition_by(partitions):
+    '''
+    Rebuild the hawq_partition_by of a partitioned table from its partitions
+
+    Subpartitions are taken from the first partition of the level above, since the
+    SUBPARTITION TEMPLATE clauses give every partition the same subpartitions.
+
+    Args:
+        partitions (list of PartitionInfo): the partitions, from PartitionIndex.partitions
+
+    Returns:
+        Partition: the partition plan, or None when it cannot be expressed with
+        RangePartition and ListPartition (e.g. multi-column keys, multi-value list
+        partitions, uneven ranges or non-numeric ranges)
+    '''
+    levels = []
+    parent = None
+    for level in sorted(set(info.level for info in partitions)):
+        siblings = [
+            info for info in partitions
+            if info.level == level and (parent is None or info.parent == parent)
+        ]
+        if not siblings or len(siblings[0].columns) != 1:
+            return None
+        try:
+            if siblings[0].type == 'range':
+                levels.append(_range_level(level, siblings))
+            elif siblings[0].type == 'list':
+                levels.append(_list_level(level, siblings))
+            else:
+                return None
+        except (TypeError, ValueError, AttributeError):
+            return None
+        if levels[-1] is None:
+            return None
+        parent = siblings[0].child
+    if not levels:
+        return None
+    levels[0].subpartitions = levels[1:]
+    return levels[0]
@@ -0,0 +1,141 @@
+'''
+Columnar result fetching for analytical queries on the Apache Hawq database
+
+Decodes batches of DBAPI rows straight into per-column NumPy arrays, skipping
+the construction of a result row object per record. Requires numpy
+(pip install sqlalchemy_hawq[numpy]).
+'''
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from .point import POINT_OID, points_to_array
+
+
+#: maps the type OID in cursor.description to the numpy dtype of the column
+OID_DTYPES = {
+    16: 'bool',  # bool
+    20: 'int64',  # int8
+    21: 'int16',  # int2
+    23: 'int32',  # int4
+    700: 'float32',  # float4
+    701: 'float64',  # float8
+    1700: 'float64',  # numeric, converted to float
+    1082: 'datetime64[D]',  # date
+    1114: 'datetime64[us]',  # timestamp
+}
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError('numpy is required for columnar fetching (pip install numpy)')
+
+
+def column_array(type_code, values):
+    '''
+    Convert the values of one column into a numpy array
+
+    Args:
+        type_code (int): the type OID of the column, from cursor.description
+        values (tuple): the raw DBAPI values of the column
+
+    Returns:
+        numpy.ndarray: the column as an array, masked where the values are NULL
+    '''
+    mask = None
+    if None in values:
+        mask = numpy.equal(numpy.array(values, dtype=object), None)
+
+    if type_code == POINT_OID:
+        if mask is None:
+            return points_to_array(values)
+        data = numpy.zeros((len(values), 2), dtype='float64')
+        data[~mask] = points_to_array([value for value in values if value is not None])
+        return numpy.ma.masked_array(data, mask=numpy.repeat(mask, 2).reshape(-1, 2))
+
+    dtype = OID_DTYPES.get(type_code, object)
+    if mask is None:
+        return numpy.array(values, dtype=dtype)
+    data = numpy.array(values, dtype=object)
+    if dtype is not object:
+        data[mask] = 0 if not dtype.startswith('datetime') else 'NaT'
+    return numpy.ma.masked_array(data.astype(dtype), mask=mask)
+
+
+def arrays_from_rows(description, rows):
+    '''
+    Convert a batch of DBAPI rows into per-column arrays
+
+    Args:
+        description (list): the cursor.description of the result
+        rows (list of tuple): the raw DBAPI rows
+
+    Returns:
+        dict of str to numpy.ndarray: the arrays, by column name
+    '''
+    _require_numpy()
+    columns = list(zip(*rows)) if rows else [()] * len(description)
+    return {
+        column[0]: column_array(column[1], values)
+        for column, values in zip(description, columns)
+    }
+
+
+def _concatenate(arrays):
+    if len(arrays) == 1:
+        return arrays[0]
+    if any(isinstance(array, numpy.ma.MaskedArray) for array in arrays):
+        return numpy.ma.concatenate(arrays)
+    return numpy.concatenate(arrays)
+
+
+def iter_array_batches(result, batch_size=100000):
+    '''
+    Fetch a result as batches of per-column arrays
+
+    Args:
+        result (sqlalchemy.engine.ResultProxy): the result to fetch, which is closed
+            once exhausted
+        batch_size (int): the number of rows decoded per batch
+
+    Yields:
+        dict of str to numpy.ndarray: the arrays for the next batch, by column name
+    '''
+    _require_numpy()
+    description = result.cursor.description
+    try:
+        while True:
+            # the raw DBAPI rows, before result processors are applied
+            rows = result._fetchmany_impl(batch_size)  # pylint: disable=protected-access
+            if not rows:
+                break
+            yield arrays_from_rows(description, rows)
+    finally:
+        result.close()
+
+
+def fetch_arrays(result, batch_size=100000):
+    '''
+    Fetch a whole result as per-column arrays
+
+    Columns of NULL-able values come back as masked arrays when NULLs are present,
+    POINT columns as (n, 2) float64 arrays, and numeric columns as float64.
+    Columns of other types are object arrays of the DBAPI values.
+
+    Args:
+        result (sqlalchemy.engine.ResultProxy): the result to fetch
+        batch_size (int): the number of rows decoded per batch
+
+    Returns:
+        dict of str to numpy.ndarray: the arrays, by column name
+    '''
+    _require_numpy()
+    description = result.cursor.description
+    batches = list(iter_array_batches(result, batch_size))
+    if not batches:
+        return arrays_from_rows(description, [])
+    return {
+        column[0]: _concatenate([batch[column[0]] for batch in batches])
+        for column in description
+    }
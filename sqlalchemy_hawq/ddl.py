@@ -1,13 +1,38 @@
 '''
 Data definition language support for the Apache Hawq database
 '''
+import collections
+import logging
+import threading
+
 from sqlalchemy.dialects import postgresql
-from sqlalchemy import schema
+from sqlalchemy import schema, text
+from sqlalchemy.sql import ddl
 
 
 from .partition import partition_clause
 
 
+logger = logging.getLogger(__name__)
+
+#: the table arguments the WITH clause is rendered from
+WITH_OPTIONS = ('appendonly', 'orientation', 'compresstype', 'compresslevel', 'bucketnum', 'distributed_by')
+
+#: the maximum number of distinct clauses kept by the compile cache, per clause
+COMPILE_CACHE_SIZE = 1024
+
+#: the most DDL statements create_all and drop_all send in one round trip
+DDL_BATCH_SIZE = 100
+
+#: the schemas, and the tables among the given names in them, that exist
+EXISTING_TABLES_QUERY = text('''
+SELECT n.nspname, c.relname
+FROM pg_catalog.pg_namespace n
+LEFT JOIN pg_catalog.pg_class c ON c.relnamespace = n.oid AND c.relname = ANY(:names)
+WHERE n.nspname = ANY(:schemas)
+''')
+
+
 def with_clause(table_opts):
     '''
     Create the WITH clause for table DDL to indicates storage parameters
@@ -64,6 +89,400 @@ def with_clause(table_opts):
     return '\nWITH ({})'.format(with_statement)
 
 
+class ClauseCache:
+    """
+    A least recently used cache of rendered clauses, by a hashable key of what
+    they are rendered from
+
+    Args:
+        maxsize (int): the maximum number of clauses kept
+    """
+
+    def __init__(self, maxsize=COMPILE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._clauses = collections.OrderedDict()
+
+    def get(self, key, render):
+        '''
+        Args:
+            key: the hashable key of the clause
+            render (callable): renders the clause, on a miss
+
+        Returns:
+            str: the clause
+        '''
+        with self._lock:
+            clause = self._clauses.get(key)
+            if clause is not None:
+                self._clauses.move_to_end(key)
+                return clause
+        clause = render()
+        with self._lock:
+            self._clauses[key] = clause
+            if len(self._clauses) > self.maxsize:
+                self._clauses.popitem(last=False)
+        return clause
+
+    def clear(self):
+        '''
+        Drop all cached clauses
+        '''
+        with self._lock:
+            self._clauses.clear()
+
+
+#: the memoized WITH clauses
+WITH_CLAUSES = ClauseCache()
+
+#: the memoized PARTITION BY clauses
+PARTITION_CLAUSES = ClauseCache()
+
+
+def typed_key(value):
+    '''
+    A cache key of a value that also tells apart values of different types, such as
+    True, 1 and 1.0, which are equal and hash the same in python but are validated
+    and rendered differently
+
+    Args:
+        value: the value, or a tuple of values
+
+    Returns:
+        tuple: the key
+    '''
+    if isinstance(value, tuple):
+        return (tuple, tuple(typed_key(item) for item in value))
+    return (type(value), value)
+
+
+def cached_with_clause(table_opts):
+    '''
+    with_clause, memoized on the values, and their types, of the table arguments it
+    is rendered from, so that tables sharing storage options are validated and
+    rendered once
+
+    Args:
+        table_opts (dict): the dictionary of table specific arguments
+
+    Returns:
+        str: the with clause to follow CREATE TABLE
+    '''
+    key = tuple((name, typed_key(table_opts[name])) for name in WITH_OPTIONS)
+    try:
+        hash(key)
+    except TypeError:
+        key = None
+    if key is None:
+        return with_clause(table_opts)
+    return WITH_CLAUSES.get(key, lambda: with_clause(table_opts))
+
+
+def cached_partition_clause(table, partition_by):
+    '''
+    partition_clause, memoized on the partition plan and the python types of the
+    columns partitioned on, so that tables sharing a partition plan are rendered once
+
+    Args:
+        table (sqlalchemy.schema.Table): the table being partitioned
+        partition_by (Partition): the partition plan
+
+    Returns:
+        str: the partition clause
+    '''
+    try:
+        levels = [partition_by] + list(partition_by.subpartitions)
+        columns = tuple(
+            (level.column_name, level.partition_column(table).type.python_type) for level in levels
+        )
+        key = (typed_key(partition_by.cache_key()), columns)
+        hash(key)
+    except (TypeError, ValueError, NotImplementedError):
+        key = None  # not cacheable, or invalid, which partition_clause reports
+    if key is None:
+        return partition_clause(table, partition_by)
+    return PARTITION_CLAUSES.get(key, lambda: partition_clause(table, partition_by))
+
+
+def check_leaf_partitions(table, partition_by, max_leaf_partitions=None):
+    '''
+    Count the leaf partitions a partition plan creates, before its clause is rendered
+    or sent, and check the count against a limit
+
+    Args:
+        table (sqlalchemy.schema.Table): the table being partitioned
+        partition_by (Partition): the partition plan
+        max_leaf_partitions (int, optional): the most leaf partitions allowed, or None
+            for no limit
+
+    Returns:
+        int: the number of leaf partitions
+
+    Raises:
+        ValueError: when the partition plan creates more leaf partitions than allowed
+    '''
+    count = partition_by.leaf_count()
+    logger.debug('%s is partitioned into %d leaf partitions', table.name, count)
+    if max_leaf_partitions is not None and count > max_leaf_partitions:
+        raise ValueError(
+            'partitioning ({}) creates {} leaf partitions, more than the maximum ({})'.format(
+                table.name, count, max_leaf_partitions
+            )
+        )
+    return count
+
+
+def clear_compile_cache():
+    '''
+    Drop the memoized WITH and PARTITION BY clauses
+    '''
+    WITH_CLAUSES.clear()
+    PARTITION_CLAUSES.clear()
+
+
+def existing_tables(connection, names):
+    '''
+    Look up which of the given tables, and their schemas, exist, in one catalog query
+
+    Args:
+        connection (sqlalchemy.engine.Connection): the connection to query with
+        names (iterable of tuple): the (schema, table name) of each table
+
+    Returns:
+        tuple of set: the existing schemas, and the (schema, table name) of the
+        existing tables
+    '''
+    names = set(names)
+    schemas, tables = set(), set()
+    if not names:
+        return schemas, tables
+    rows = connection.execute(
+        EXISTING_TABLES_QUERY,
+        schemas=sorted({namespace for namespace, _ in names}),
+        names=sorted({name for _, name in names}),
+    )
+    for namespace, name in rows:
+        schemas.add(namespace)
+        if name is not None:
+            tables.add((namespace, name))
+    return schemas, tables & names
+
+
+class DDLPipeline:
+    """
+    A connection proxy that buffers DDL statements and sends them several per round
+    trip, as one multi-statement query. Anything else is executed on the connection,
+    after the buffered statements, so statements run in the order they are executed
+
+    Each batch runs as one implicit transaction: if a statement fails, the earlier
+    statements of its batch are rolled back with it.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): the connection to execute on
+        batch_size (int): the most DDL statements sent in one round trip
+    """
+
+    def __init__(self, connection, batch_size=DDL_BATCH_SIZE):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.statements = []
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def execute(self, statement, *multiparams, **params):
+        '''
+        Buffer a DDL statement, or flush and execute anything else
+        '''
+        if isinstance(statement, ddl.DDLElement) and not multiparams and not params:
+            compiled = statement.compile(
+                dialect=self.connection.dialect,
+                schema_translate_map=self.connection.get_execution_options().get('schema_translate_map'),
+            )
+            self.statements.append(str(compiled).strip())
+            if len(self.statements) >= self.batch_size:
+                self.flush()
+            return None
+        self.flush()
+        return self.connection.execute(statement, *multiparams, **params)
+
+    def flush(self):
+        '''
+        Send the buffered DDL statements in one round trip
+        '''
+        if not self.statements:
+            return
+        statements, self.statements = self.statements, []
+        self.connection.execute(';\n'.join(statements))
+        logger.debug('sent %d DDL statements in one round trip', len(statements))
+
+
+class HawqSchemaGenerator(ddl.SchemaGenerator):
+    """
+    Creates the tables of a MetaData as MetaData.create_all does, checking which
+    already exist with one catalog query instead of one has_table query per table,
+    and sending the DDL through a DDLPipeline
+
+    Args:
+        dialect: the dialect
+        connection (sqlalchemy.engine.Connection): the connection to create the tables with
+        checkfirst (bool): skip the tables that already exist
+        tables (list of sqlalchemy.schema.Table, optional): the tables to create, if
+            not all tables of the MetaData
+        batch_size (int): the most DDL statements sent in one round trip
+        create_schemas (bool): also create the schemas of the tables that do not exist
+    """
+
+    def __init__(
+        self,
+        dialect,
+        connection,
+        checkfirst=False,
+        tables=None,
+        batch_size=DDL_BATCH_SIZE,
+        create_schemas=False,
+        **kwargs
+    ):
+        super().__init__(dialect, DDLPipeline(connection, batch_size), checkfirst, tables, **kwargs)
+        self.create_schemas = create_schemas
+        self.existing = None
+
+    def visit_metadata(self, metadata):
+        tables = self.tables if self.tables is not None else list(metadata.tables.values())
+        if self.checkfirst or self.create_schemas:
+            self.existing = prefetch_tables(self.connection, self.dialect, tables)
+        if self.create_schemas:
+            schemas, _ = self.existing
+            missing = {namespace for namespace, _ in table_keys(self.connection, self.dialect, tables)} - schemas
+            for namespace in sorted(missing):
+                self.connection.execute(schema.CreateSchema(namespace))
+        super().visit_metadata(metadata)
+        self.connection.flush()
+
+    def visit_table(self, table, create_ok=False, **kwargs):
+        super().visit_table(table, create_ok=create_ok, **kwargs)
+        if not create_ok:
+            self.connection.flush()  # a single table, not part of visit_metadata
+
+    def _can_create_table(self, table):
+        if self.existing is None or not self.checkfirst:
+            return super()._can_create_table(table)
+        self.dialect.validate_identifier(table.name)
+        return table_key(self.connection, self.dialect, table) not in self.existing[1]
+
+
+class HawqSchemaDropper(ddl.SchemaDropper):
+    """
+    Drops the tables of a MetaData as MetaData.drop_all does, checking which
+    exist with one catalog query instead of one has_table query per table,
+    and sending the DDL through a DDLPipeline
+
+    Args:
+        dialect: the dialect
+        connection (sqlalchemy.engine.Connection): the connection to drop the tables with
+        checkfirst (bool): skip the tables that do not exist
+        tables (list of sqlalchemy.schema.Table, optional): the tables to drop, if
+            not all tables of the MetaData
+        batch_size (int): the most DDL statements sent in one round trip
+    """
+
+    def __init__(self, dialect, connection, checkfirst=False, tables=None, batch_size=DDL_BATCH_SIZE, **kwargs):
+        super().__init__(dialect, DDLPipeline(connection, batch_size), checkfirst, tables, **kwargs)
+        self.existing = None
+
+    def visit_metadata(self, metadata):
+        if self.checkfirst:
+            tables = self.tables if self.tables is not None else list(metadata.tables.values())
+            self.existing = prefetch_tables(self.connection, self.dialect, tables)
+        super().visit_metadata(metadata)
+        self.connection.flush()
+
+    def visit_table(self, table, drop_ok=False, **kwargs):
+        super().visit_table(table, drop_ok=drop_ok, **kwargs)
+        if not drop_ok:
+            self.connection.flush()  # a single table, not part of visit_metadata
+
+    def _can_drop_table(self, table):
+        if self.existing is None:
+            return super()._can_drop_table(table)
+        self.dialect.validate_identifier(table.name)
+        return table_key(self.connection, self.dialect, table) in self.existing[1]
+
+
+def table_key(connection, dialect, table):
+    '''
+    Returns:
+        tuple: the effective (schema, table name) of a table, in the default schema
+        when it has none
+    '''
+    effective_schema = connection.schema_for_object(table)
+    if effective_schema:
+        dialect.validate_identifier(effective_schema)
+    return (effective_schema or dialect.default_schema_name, table.name)
+
+
+def table_keys(connection, dialect, tables):
+    '''
+    Returns:
+        list of tuple: the effective (schema, table name) of each table
+    '''
+    return [table_key(connection, dialect, table) for table in tables]
+
+
+def prefetch_tables(connection, dialect, tables):
+    '''
+    The existing schemas and tables among those of the given tables, from one catalog query
+
+    Returns:
+        tuple of set: as existing_tables returns them
+    '''
+    existing = existing_tables(connection, table_keys(connection, dialect, tables))
+    logger.debug('%d of %d tables exist', len(existing[1]), len(tables))
+    return existing
+
+
+def create_all(bind, metadata, tables=None, checkfirst=True, batch_size=DDL_BATCH_SIZE, create_schemas=False):
+    '''
+    MetaData.create_all, with the existence of the tables checked in one catalog query
+    and the DDL sent several statements per round trip. See HawqSchemaGenerator
+
+    Args:
+        bind (sqlalchemy.engine.Connectable): the engine or connection to create the tables with
+        metadata (sqlalchemy.schema.MetaData): the tables
+        tables (list of sqlalchemy.schema.Table, optional): the tables to create, if not all
+        checkfirst (bool): skip the tables that already exist
+        batch_size (int): the most DDL statements sent in one round trip
+        create_schemas (bool): also create the schemas of the tables that do not exist
+    '''
+    with bind.connect() as connection:
+        HawqSchemaGenerator(
+            connection.dialect,
+            connection,
+            checkfirst=checkfirst,
+            tables=tables,
+            batch_size=batch_size,
+            create_schemas=create_schemas,
+        ).traverse_single(metadata)
+
+
+def drop_all(bind, metadata, tables=None, checkfirst=True, batch_size=DDL_BATCH_SIZE):
+    '''
+    MetaData.drop_all, with the existence of the tables checked in one catalog query
+    and the DDL sent several statements per round trip. See HawqSchemaDropper
+
+    Args:
+        bind (sqlalchemy.engine.Connectable): the engine or connection to drop the tables with
+        metadata (sqlalchemy.schema.MetaData): the tables
+        tables (list of sqlalchemy.schema.Table, optional): the tables to drop, if not all
+        checkfirst (bool): skip the tables that do not exist
+        batch_size (int): the most DDL statements sent in one round trip
+    '''
+    with bind.connect() as connection:
+        HawqSchemaDropper(
+            connection.dialect, connection, checkfirst=checkfirst, tables=tables, batch_size=batch_size
+        ).traverse_single(metadata)
+
+
 class HawqDDLCompiler(postgresql.base.PGDDLCompiler):
     '''
     override the default postgres DDL
@@ -90,11 +509,12 @@ class HawqDDLCompiler(postgresql.base.PGDDLCompiler):
                 '\nINHERITS ({}) '.format(', '.join(self.preparer.quote(name) for name in inherits))
             )
 
-        table_opts.append(with_clause(pg_opts))
+        compile_cache = getattr(self.dialect, 'ddl_compile_cache', False)
+        table_opts.append((cached_with_clause if compile_cache else with_clause)(pg_opts))
 
         if pg_opts['on_commit']:
             on_commit = {'PRESERVE ROWS', 'DELETE ROWS', 'DROP'}
-            if pg_opts['on commit'].upper() not in on_commit:
+            if pg_opts['on_commit'].upper() not in on_commit:
                 raise ValueError('Invalid option for on_commit {}'.format(pg_opts['on_commit']))
             table_opts.append('\n ON COMMIT {}'.format(pg_opts['on_commit'].upper()))
 
@@ -106,7 +526,11 @@ class HawqDDLCompiler(postgresql.base.PGDDLCompiler):
             table_opts.append('\nDISTRIBUTED BY ({})'.format(pg_opts['distributed_by']))
 
         if pg_opts['partition_by']:
-            table_opts.append('\n' + partition_clause(table, pg_opts['partition_by']))
+            check_leaf_partitions(
+                table, pg_opts['partition_by'], getattr(self.dialect, 'max_leaf_partitions', None)
+            )
+            render = cached_partition_clause if compile_cache else partition_clause
+            table_opts.append('\n' + render(table, pg_opts['partition_by']))
 
         return ''.join(table_opts)
 
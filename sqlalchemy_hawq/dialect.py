@@ -1,12 +1,57 @@
 """ Customizes the postgresql.psycopg2 dialect to work with Hawq. """
+import logging
+
 
 from sqlalchemy.dialects import postgresql
 from sqlalchemy import schema
 from sqlalchemy.ext.compiler import compiles
-from sqlalchemy.sql.expression import Delete
+from sqlalchemy.sql.expression import Delete, Update
 
 
+from .bulk import BulkNotSupported, copy_executemany, values_executemany
+from .catalog import CHILD_TABLE_NAME, INVALIDATING_STATEMENT, PartitionIndex, rebuild_partition_by
 from .ddl import HawqDDLCompiler
+from .point import POINT_OID, cast_point
+from . import columnar, ddl, exchange, explain, export, merge, rewrite
+from .reflection import ReflectionCache, multi_columns, multi_table_options, shared_cache
+from .result import AdaptiveBufferedRowResultProxy
+
+
+logger = logging.getLogger(__name__)
+
+
+class HawqExecutionContext(postgresql.psycopg2.PGExecutionContext_psycopg2):
+    '''
+    Execution context for the Hawq dialect
+    '''
+
+    def get_result_proxy(self):
+        '''
+        Use the adaptive fetch size for server-side cursors
+        '''
+        if self._is_server_side:
+            self._log_notices(self.cursor)
+            return AdaptiveBufferedRowResultProxy(self)
+        return super().get_result_proxy()
+
+    def pre_exec(self):
+        '''
+        Check the estimated cost of the statement with the hawq_cost_guard execution
+        option, if any. See sqlalchemy_hawq.guard.CostGuard
+        '''
+        super().pre_exec()
+        guard = self.execution_options.get('hawq_cost_guard')
+        if guard is not None:
+            guard.check(self)
+
+    def post_exec(self):
+        '''
+        Invalidate the cached partition catalog after DDL or TRUNCATE, including
+        the rewrites and partition truncates UPDATE and DELETE are compiled to
+        '''
+        super().post_exec()
+        if self.isddl or self.isupdate or self.isdelete or INVALIDATING_STATEMENT.match(self.statement or ''):
+            self.dialect.partition_index.invalidate()
 
 
 class HawqDialect(postgresql.psycopg2.PGDialect_psycopg2):
@@ -32,25 +77,379 @@ class HawqDialect(postgresql.psycopg2.PGDialect_psycopg2):
         )
     ]
     ddl_compiler = HawqDDLCompiler
+    execution_ctx_cls = HawqExecutionContext
+    # UPDATE and DELETE run as rewrites or truncates of the table, which report no rowcount
+    supports_sane_rowcount = False
+    supports_sane_multi_rowcount = False
     name = 'hawq'
 
+    def __init__(
+        self,
+        copy_executemany=False,
+        values_executemany=False,
+        values_executemany_max_bytes=1024 * 1024,
+        values_executemany_page_size=None,
+        stream_buffer_bytes=8 * 1024 * 1024,
+        stream_fetch_seconds=0.05,
+        use_native_point=True,
+        partition_cache_ttl=300,
+        shared_reflection_cache=False,
+        reflection_cache_path=None,
+        reflect_partitions=False,
+        ddl_compile_cache=True,
+        max_leaf_partitions=None,
+        stats_collector=None,
+        **kwargs
+    ):
+        '''
+        Args:
+            copy_executemany (bool): send executemany INSERTs as a streamed
+                COPY ... FROM STDIN instead of one INSERT per row
+            values_executemany (bool): send executemany INSERTs (that COPY is not
+                used for) as multi-row INSERT ... VALUES statements
+            values_executemany_max_bytes (int): the size budget of each multi-row INSERT
+            values_executemany_page_size (int): the maximum rows in each multi-row INSERT
+            stream_buffer_bytes (int): the memory budget of each fetch from a server-side
+                cursor, used to cap the fetch size by the observed row width
+            stream_fetch_seconds (float): the fetch time below which round trips are
+                considered to dominate, and the fetch size from a server-side cursor grows
+            use_native_point (bool): register a psycopg2 typecaster for POINT on each
+                connection, so points are parsed once by the DBAPI instead of by a
+                result processor
+            partition_cache_ttl (float): seconds before the cached partition catalog
+                is reloaded, or None to only reload it after DDL or TRUNCATE
+            shared_reflection_cache (bool): share reflection results across connections
+                (and Inspectors) while the catalog marker of their schema is unchanged
+            reflection_cache_path (str): a file to persist the shared reflection cache to.
+                Setting it also enables the shared reflection cache
+            reflect_partitions (bool): list the child tables of partitioned tables in
+                get_table_names, so that MetaData.reflect reflects them too
+            ddl_compile_cache (bool): memoize the WITH and PARTITION BY clauses of CREATE
+                TABLE, so that tables sharing storage options or partition plans are
+                validated and rendered once
+            max_leaf_partitions (int): the most leaf partitions a partitioned table may be
+                created with, checked before CREATE TABLE is sent, or None for no limit
+            stats_collector (HawqStatsCollector): collect per-statement timing and statistics
+                of the engine into this collector. See sqlalchemy_hawq.stats
+        '''
+        super().__init__(**kwargs)
+        self.copy_executemany = copy_executemany
+        self.values_executemany = values_executemany
+        self.values_executemany_max_bytes = values_executemany_max_bytes
+        self.values_executemany_page_size = values_executemany_page_size
+        self.stream_buffer_bytes = stream_buffer_bytes
+        self.stream_fetch_seconds = stream_fetch_seconds
+        self.use_native_point = use_native_point
+        self.partition_index = PartitionIndex(partition_cache_ttl)
+        self.reflection_cache = None
+        if shared_reflection_cache or reflection_cache_path is not None:
+            self.reflection_cache = ReflectionCache(reflection_cache_path)
+        self.reflect_partitions = reflect_partitions
+        self.ddl_compile_cache = ddl_compile_cache
+        self.max_leaf_partitions = max_leaf_partitions
+        self.stats_collector = stats_collector
+
+    @classmethod
+    def engine_created(cls, engine):
+        '''
+        Attach the stats collector of the dialect, if any, to the engine's events
+        '''
+        super().engine_created(engine)
+        if engine.dialect.stats_collector is not None:
+            engine.dialect.stats_collector.attach(engine)
+
     def initialize(self, connection):
         """
-        Override implicit_returning = True of postgresql dialect
+        Override implicit_returning = True of postgresql dialect, and the rowcount
+        support set from the executemany mode of the psycopg2 dialect
         """
         super().initialize(connection)
         self.implicit_returning = False
+        self.supports_sane_multi_rowcount = False  # set by the psycopg2 dialect from its executemany mode
+
+    def on_connect(self):
+        '''
+        Register the POINT typecaster on new connections, after the psycopg2
+        dialect's own connection setup
+        '''
+        parent = super().on_connect()
+        if not (self.dbapi and self.use_native_point):
+            return parent
+
+        def on_connect(conn):
+            if parent is not None:
+                parent(conn)
+            self._register_point(conn)
+
+        return on_connect
+
+    def _register_point(self, conn):
+        # the OID of POINT is fixed, so no query (and no transaction) is needed to look it up
+        extensions = self._psycopg2_extensions()
+        extensions.register_type(extensions.new_type((POINT_OID,), 'POINT', cast_point), conn)
+
+    # the reflection methods are shared across connections by the reflection cache,
+    # see sqlalchemy_hawq.reflection.shared_cache
+
+    @shared_cache
+    def get_table_oid(self, connection, table_name, schema=None, **kw):
+        return super().get_table_oid(connection, table_name, schema, **kw)
+
+    def get_table_names(self, connection, schema=None, **kw):
+        '''
+        List the tables of a schema, without the child tables of partitions unless
+        reflect_partitions is set. When listed by an Inspector, as MetaData.reflect
+        does, the tables of the schema are then reflected in bulk
+
+        The partition catalog is only queried when a name looks like a child table
+        (e.g. sales_1_prt_2), so schemas without partitions are listed with one query
+        '''
+        info_cache = kw.get('info_cache')
+        if info_cache is not None:
+            info_cache[('hawq_bulk_reflection', schema or self.default_schema_name)] = True
+        names = self._get_table_names(connection, schema, **kw)
+        if self.reflect_partitions:
+            return names
+        return [
+            name
+            for name in names
+            if not CHILD_TABLE_NAME.search(name)
+            or not self.partition_index.is_partition(connection, name, schema)
+        ]
+
+    @shared_cache
+    def _get_table_names(self, connection, schema=None, **kw):
+        return super().get_table_names(connection, schema, **kw)
+
+    @shared_cache
+    def get_view_names(self, connection, schema=None, include=('plain', 'materialized'), **kw):
+        return super().get_view_names(connection, schema, include, **kw)
+
+    @shared_cache
+    def get_view_definition(self, connection, view_name, schema=None, **kw):
+        return super().get_view_definition(connection, view_name, schema, **kw)
+
+    @shared_cache
+    def get_columns(self, connection, table_name, schema=None, **kw):
+        if self._bulk_reflection(schema, kw):
+            columns = self.get_multi_columns(
+                connection, schema, info_cache=kw['info_cache']
+            ).get(table_name)
+            if columns is not None:
+                return columns
+        return super().get_columns(connection, table_name, schema, **kw)
+
+    @shared_cache
+    def get_pk_constraint(self, connection, table_name, schema=None, **kw):
+        return super().get_pk_constraint(connection, table_name, schema, **kw)
+
+    @shared_cache
+    def get_foreign_keys(self, connection, table_name, schema=None, **kw):
+        return super().get_foreign_keys(connection, table_name, schema, **kw)
+
+    @shared_cache
+    def get_indexes(self, connection, table_name, schema=None, **kw):
+        return super().get_indexes(connection, table_name, schema, **kw)
+
+    @shared_cache
+    def get_unique_constraints(self, connection, table_name, schema=None, **kw):
+        return super().get_unique_constraints(connection, table_name, schema, **kw)
+
+    @shared_cache
+    def get_check_constraints(self, connection, table_name, schema=None, **kw):
+        return super().get_check_constraints(connection, table_name, schema, **kw)
+
+    @shared_cache
+    def get_table_comment(self, connection, table_name, schema=None, **kw):
+        return super().get_table_comment(connection, table_name, schema, **kw)
+
+    @shared_cache
+    def get_table_options(self, connection, table_name, schema=None, **kw):
+        '''
+        Reflect the Hawq storage options, distribution policy and partitions of a
+        table, as the hawq_* table arguments. See sqlalchemy_hawq.reflection.multi_table_options
+        and sqlalchemy_hawq.catalog.rebuild_partition_by
+        '''
+        if self._bulk_reflection(schema, kw):
+            options = self.get_multi_table_options(connection, schema, info_cache=kw['info_cache'])
+        else:
+            options = multi_table_options(
+                connection, schema or self.default_schema_name, table_name
+            )
+        options = dict(options.get(table_name, {}))
+        partitions = self.partition_index.partitions(connection, table_name, schema)
+        if partitions:
+            partition_by = rebuild_partition_by(partitions)
+            if partition_by is None:
+                logger.warning('cannot reflect the partitions of %s as hawq_partition_by', table_name)
+            else:
+                options['hawq_partition_by'] = partition_by
+        return options
+
+    @shared_cache
+    def get_multi_columns(self, connection, schema=None, **kw):
+        '''
+        Reflect the columns of all tables and views of a schema in one catalog query.
+        See sqlalchemy_hawq.reflection.multi_columns
+
+        Returns:
+            dict of str to list of dict: the columns, as get_columns returns them, by table name
+        '''
+        return multi_columns(self, connection, schema or self.default_schema_name)
+
+    @shared_cache
+    def get_multi_table_options(self, connection, schema=None, **kw):
+        '''
+        Reflect the Hawq storage options and distribution policy of all tables of
+        a schema in one catalog query. See sqlalchemy_hawq.reflection.multi_table_options
+
+        Returns:
+            dict of str to dict: the hawq_* table arguments, by table name
+        '''
+        return multi_table_options(connection, schema or self.default_schema_name)
+
+    def _bulk_reflection(self, schema, kw):
+        info_cache = kw.get('info_cache')
+        return info_cache is not None and info_cache.get(
+            ('hawq_bulk_reflection', schema or self.default_schema_name), False
+        )
+
+    def get_partitions(self, connection, table_name, schema=None, **kw):
+        '''
+        The child tables of a partitioned table, from the cached partition catalog.
+        See sqlalchemy_hawq.catalog.PartitionIndex
+        '''
+        return self.partition_index.partitions(connection, table_name, schema)
+
+    def do_executemany(self, cursor, statement, parameters, context=None):
+        '''
+        Use COPY or multi-row VALUES for executemany INSERTs when enabled, falling
+        back to the psycopg2 executemany modes for anything they cannot express.
+        An executemany UPDATE or DELETE, e.g. the ORM's flush of several changed
+        objects, runs as one statement, so one rewrite of the table, per parameter set
+        '''
+        if context is not None and (context.isupdate or context.isdelete):
+            logger.warning(
+                'executemany %s rewrites the table once for each of %d parameter sets, queue the '
+                'statements on a sqlalchemy_hawq.rewrite.TableRewrite to rewrite it once',
+                'UPDATE' if context.isupdate else 'DELETE',
+                len(parameters),
+            )
+            for params in parameters:
+                cursor.execute(statement, params)
+            return
+        if self.copy_executemany:
+            try:
+                stream = copy_executemany(cursor, statement, parameters, context)
+                if context is not None:
+                    context.hawq_copy_stream = stream  # counted as COPY by the stats collector
+                return
+            except BulkNotSupported as err:
+                logger.debug('COPY not used for executemany: %s', err)
+        if self.values_executemany:
+            try:
+                values_executemany(
+                    cursor,
+                    statement,
+                    parameters,
+                    context,
+                    self.values_executemany_max_bytes,
+                    self.values_executemany_page_size,
+                )
+                return
+            except BulkNotSupported as err:
+                logger.debug('multi-row VALUES not used for executemany: %s', err)
+        super().do_executemany(cursor, statement, parameters, context)
+
+    def copy_to(self, connection, query, sink, **kwargs):
+        '''
+        Export the results of a query into a file-like sink with COPY (query) TO STDOUT.
+        See sqlalchemy_hawq.export.copy_to
+        '''
+        return export.copy_to(connection, query, sink, **kwargs)
+
+    def iter_copy_chunks(self, connection, query, **kwargs):
+        '''
+        Export the results of a query as a bounded-memory stream of raw chunks.
+        See sqlalchemy_hawq.export.iter_copy_chunks
+        '''
+        return export.iter_copy_chunks(connection, query, **kwargs)
+
+    def iter_copy_rows(self, connection, query, **kwargs):
+        '''
+        Export the results of a query as a bounded-memory stream of row batches.
+        See sqlalchemy_hawq.export.iter_copy_rows
+        '''
+        return export.iter_copy_rows(connection, query, **kwargs)
+
+    def fetch_arrays(self, result, batch_size=100000):
+        '''
+        Fetch a result as per-column numpy arrays instead of rows.
+        See sqlalchemy_hawq.columnar.fetch_arrays
+        '''
+        return columnar.fetch_arrays(result, batch_size)
+
+    def iter_array_batches(self, result, batch_size=100000):
+        '''
+        Fetch a result as batches of per-column numpy arrays.
+        See sqlalchemy_hawq.columnar.iter_array_batches
+        '''
+        return columnar.iter_array_batches(result, batch_size)
+
+    def merge(self, connection, table, rows, key):
+        '''
+        Insert rows into a table, replacing the rows with the same key, through a
+        temporary staging table. See sqlalchemy_hawq.merge.StagedMerge
+        '''
+        return merge.StagedMerge(table, key).execute(connection, rows)
+
+    def exchange_partition(self, connection, table, values, rows, **kwargs):
+        '''
+        Replace the rows of a leaf partition by exchanging it with a loaded staging table.
+        See sqlalchemy_hawq.exchange.PartitionExchange.load
+        '''
+        return exchange.PartitionExchange(table).load(connection, values, rows, **kwargs)
+
+    def create_all(self, connection, metadata, **kwargs):
+        '''
+        Create the tables of a MetaData, checking which exist in one catalog query and
+        sending the DDL several statements per round trip. See sqlalchemy_hawq.ddl.create_all
+        '''
+        ddl.create_all(connection, metadata, **kwargs)
+
+    def drop_all(self, connection, metadata, **kwargs):
+        '''
+        Drop the tables of a MetaData, checking which exist in one catalog query and
+        sending the DDL several statements per round trip. See sqlalchemy_hawq.ddl.drop_all
+        '''
+        ddl.drop_all(connection, metadata, **kwargs)
+
+    def explain(self, connection, statement, analyze=False):
+        '''
+        Run EXPLAIN on a statement and parse the plan into a tree of nodes. The
+        warnings of the plan check partition scans against the partition catalog.
+        See sqlalchemy_hawq.explain.explain
+        '''
+        return explain.explain(
+            connection, statement, analyze, explain.partition_lookup(connection, self.partition_index)
+        )
 
     @compiles(Delete, 'hawq')
     def visit_delete_statement(element, compiler, **kwargs):  # pylint: disable=no-self-argument
         """
-        Allows a version of the delete statement to get compiled - the version
-        that is effectively the same as truncate.
+        Compiles delete statements for append-only tables. Without filters the
+        delete is a truncate. Filters that line up with partition boundaries
+        truncate those partitions, and any other filter rewrites the table
+        without the deleted rows. See sqlalchemy_hawq.rewrite.delete_statements
+        """
+        compiler.isdelete = True  # as SQLCompiler.visit_delete does, for the execution context
+        return ';\n'.join(rewrite.delete_statements(compiler, element, **kwargs))
 
-        Any filters on the delete statement result in an Exception.
+    @compiles(Update, 'hawq')
+    def visit_update_statement(element, compiler, **kwargs):  # pylint: disable=no-self-argument
+        """
+        Compiles update statements for append-only tables, as a rewrite of the
+        table with the new values. See sqlalchemy_hawq.rewrite.update_statements
         """
-        delete_stmt_table = compiler.process(element.table, asfrom=True, **kwargs)
-        filters_tuple = element.get_children()
-        if not filters_tuple:
-            return 'TRUNCATE TABLE {}'.format(delete_stmt_table)
-        raise NotImplementedError('Delete statement with filter clauses not implemented for Hawq')
+        compiler.isupdate = True  # as SQLCompiler.visit_update does, for the execution context
+        return ';\n'.join(rewrite.update_statements(compiler, element, **kwargs))
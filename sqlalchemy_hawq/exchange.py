@@ -0,0 +1,183 @@
+'''
+Partition exchange loading for partitioned tables on the Apache Hawq database
+
+Loading a partition through the root of a live table is a long write that
+readers wait on. PartitionExchange loads the rows into a staging table with the
+storage options of the table instead, checks in Python that they all belong to
+the partition, and swaps the staging table in with ALTER TABLE ... EXCHANGE
+PARTITION, which only changes the catalog.
+'''
+import logging
+
+from sqlalchemy import Column, MetaData, Table, text
+from sqlalchemy.schema import CreateTable, DropTable
+
+from .rewrite import alter_partition_statement, suffixed_name
+from .routing import PartitionRouter
+
+
+logger = logging.getLogger(__name__)
+
+
+#: appended to the name of a child table for the staging table exchanged with it
+EXCHANGE_SUFFIX = '__hawq_exchange'
+
+#: the table arguments the staging table shares with the partitioned table
+STORAGE_OPTIONS = [
+    'appendonly',
+    'orientation',
+    'compresstype',
+    'compresslevel',
+    'tablespace',
+    'distributed_by',
+    'bucketnum',
+]
+
+
+class PartitionExchange:
+    """
+    Replaces the rows of leaf partitions of a table by exchanging them with loaded staging tables
+
+    Args:
+        table (sqlalchemy.schema.Table): the partitioned table
+        partition_by (Partition, optional): the partition plan, if not the table's
+            hawq_partition_by
+
+    Raises:
+        ValueError: when the table is not partitioned
+    """
+
+    def __init__(self, table, partition_by=None):
+        self.router = PartitionRouter(table, partition_by)
+        self.table = table
+
+    def partition_path(self, values):
+        '''
+        Locate the leaf partition holding the given values of the partition columns
+
+        Args:
+            values (dict): a value of each partition column, by column name
+
+        Returns:
+            tuple of int: the index of the partition at each level
+
+        Raises:
+            ValueError: when a partition column has no value, or the values belong to
+                a default partition, which cannot be exchanged
+        '''
+        path = []
+        for level, column, names in zip(self.router.levels, self.router.columns, self.router.names):
+            if column.name not in values:
+                raise ValueError('no value for the partition column ({})'.format(column.name))
+            index = int(level.partition_indexes(column, [values[column.name]])[0])
+            if index == len(names) - 1:
+                raise ValueError('cannot exchange the default partition ({}) of ({})'.format(
+                    names[index], column.name
+                ))
+            path.append(index)
+        return tuple(path)
+
+    def leaf_index(self, path):
+        '''
+        Returns:
+            int: the index of a leaf partition in router.leaf_names()
+        '''
+        index = 0
+        for position, names in zip(path, self.router.names):
+            index = index * len(names) + position
+        return index
+
+    def validate(self, rows, path):
+        '''
+        Check that rows belong to a leaf partition
+
+        Args:
+            rows (list of dict): the rows, keyed by column name
+            path (tuple of int): the leaf partition, from partition_path()
+
+        Raises:
+            ValueError: when any row belongs to another partition
+        '''
+        if not rows:
+            return
+        leaf = self.leaf_index(path)
+        misplaced = sum(1 for index in self.router.leaf_indexes(rows) if index != leaf)
+        if misplaced:
+            raise ValueError('{} of {} rows do not belong to the partition ({})'.format(
+                misplaced, len(rows), self.router.leaf_name(leaf)
+            ))
+
+    def staging_table(self, path, storage_options=None):
+        '''
+        The staging table to load a leaf partition's rows into
+
+        Args:
+            path (tuple of int): the leaf partition, from partition_path()
+            storage_options (dict, optional): the hawq table arguments of the partition
+                (without the hawq_ prefix), if not those of the partitioned table
+
+        Returns:
+            sqlalchemy.schema.Table: a table with the columns of the partitioned table and
+            the storage options and distribution of the partition
+        '''
+        if storage_options is None:
+            options = self.table.dialect_options['hawq']
+            storage_options = {name: options[name] for name in STORAGE_OPTIONS}
+        return Table(
+            suffixed_name(self.router.leaf_name(self.leaf_index(path)), EXCHANGE_SUFFIX),
+            MetaData(),
+            *[Column(column.name, column.type, key=column.key) for column in self.table.columns],
+            schema=self.table.schema,
+            **{'hawq_' + name: value for name, value in storage_options.items()}
+        )
+
+    def exchange_statement(self, preparer, path, staging):
+        '''
+        Returns:
+            str: the ALTER TABLE ... EXCHANGE PARTITION ... WITH TABLE statement. The rows
+            are validated by validate() instead of by the database
+        '''
+        return '{} WITH TABLE {} WITHOUT VALIDATION'.format(
+            alter_partition_statement(preparer, self.table, path, 'EXCHANGE'),
+            preparer.format_table(staging),
+        )
+
+    def load(self, connection, values, rows, analyze=False, storage_options=None):
+        '''
+        Replace the rows of a leaf partition, in a transaction: create a staging table,
+        load the rows into it with one executemany (a COPY when the dialect has
+        copy_executemany), optionally ANALYZE it, exchange it with the partition and
+        drop it, with the partition's previous rows
+
+        Args:
+            connection (sqlalchemy.engine.Connection): the connection to load with
+            values (dict): a value of each partition column, by column name, locating
+                the leaf partition
+            rows (list of dict): the rows, keyed by column name
+            analyze (bool): collect the statistics of the staging table before the exchange,
+                so that the partition has statistics as soon as it is swapped in
+            storage_options (dict, optional): the hawq table arguments of the partition,
+                if not those of the partitioned table
+
+        Returns:
+            str: the name of the child table of the partition loaded
+
+        Raises:
+            ValueError: when the values locate a default partition, or the rows do not
+                all belong to the partition
+        '''
+        path = self.partition_path(values)
+        self.validate(rows, path)
+        staging = self.staging_table(path, storage_options)
+        preparer = connection.dialect.identifier_preparer
+        with connection.begin():
+            connection.execute(CreateTable(staging))
+            if rows:
+                connection.execute(staging.insert(), rows)
+            if analyze:
+                connection.execute(text('ANALYZE {}'.format(preparer.format_table(staging))))
+            connection.execute(text(self.exchange_statement(preparer, path, staging)))
+            connection.execute(DropTable(staging))
+        name = self.router.leaf_name(self.leaf_index(path))
+        logger.debug('exchanged %d rows into %s', len(rows), name)
+        return name
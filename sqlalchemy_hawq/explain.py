@@ -0,0 +1,421 @@
+'''
+EXPLAIN capture and plan parsing for the Apache Hawq database
+
+Hawq plans are printed as indented text. Motion nodes move rows between slices
+of the plan, which run on the virtual segments. parse_plan reads the text into
+a tree of PlanNode, with the cost, rows and width of each node, the motion type,
+sender and receiver counts, slice and segments of motions, the relation of scans
+and the partitions selected by partition selectors. Plan.warnings() flags the
+broadcast motions and the partitioned tables that are scanned without pruning.
+'''
+import collections
+import re
+
+from sqlalchemy import text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.elements import ClauseElement
+
+
+#: the motion types of Motion nodes
+MOTIONS = {
+    'gather': 'gather',
+    'redistribute': 'redistribute',
+    'explicit redistribute': 'redistribute',
+    'broadcast': 'broadcast',
+}
+
+NODE_LINE = re.compile(
+    r'^(?P<indent>\s*)(?:->\s+)?(?P<title>.*?)'
+    r'\s+\(cost=(?P<startup>[\d.]+)\.\.(?P<total>[\d.]+) rows=(?P<rows>\d+) width=(?P<width>\d+)\)(?P<rest>.*)$'
+)
+
+ARROW_LINE = re.compile(r'^(?P<indent>\s*)->\s+(?P<title>.*)$')
+
+ACTUAL = re.compile(r'\(actual time=(?P<startup>[\d.]+)\.\.(?P<total>[\d.]+) rows=(?P<rows>\d+) loops=(?P<loops>\d+)\)')
+
+MOTION = re.compile(
+    r'^(?P<type>Gather|Redistribute|Explicit Redistribute|Broadcast) Motion (?P<senders>\d+):(?P<receivers>\d+)'
+    r'(?:\s+\(slice(?P<slice>\d+)(?:; segments: (?P<segments>\d+))?\))?',
+    re.IGNORECASE,
+)
+
+SCAN = re.compile(r'^(?P<type>.*\bScan)(?: using \S+)? on (?P<relation>[\w.$"]+)(?: (?P<alias>(?!\()\S+))?')
+
+PARTITION_SELECTOR = re.compile(r'^Partition Selector for (?P<relation>[\w.$"]+)')
+
+PARTITIONS_SELECTED = re.compile(r'Partitions selected:\s*(?P<selected>\d+)\s*\(out of (?P<total>\d+)\)')
+
+ROWS_OUT = re.compile(
+    r'Rows out:\s+(?:Avg (?P<avg>[\d.]+) rows x (?P<workers>\d+) workers|(?P<rows>\d+) rows)'
+    r'(?:.*?(?P<end>[\d.]+) ms to end)?'
+)
+
+TOTAL_RUNTIME = re.compile(r'^Total runtime:\s*(?P<ms>[\d.]+) ms')
+
+#: the name of a child table of a partitioned table, from the name of the root table
+CHILD_TABLE = re.compile(r'^(?P<root>.+?)_1_prt_\w+$')
+
+PlanWarning = collections.namedtuple('PlanWarning', ['kind', 'node', 'message'])
+PlanWarning.__doc__ = '''
+A problem spotted in a plan. kind is 'broadcast_motion' or 'unpruned_partition_scan'.
+'''
+
+
+class PlanNode:
+    """
+    A node of a Hawq plan
+
+    Attributes:
+        title (str): the node as printed, without its estimates
+        node_type (str): e.g. 'Hash Join', 'Parquet table Scan', 'Redistribute Motion'
+        startup_cost (float): the estimated cost before the first row
+        total_cost (float): the estimated cost of all rows
+        rows (int): the estimated rows
+        width (int): the estimated row width, in bytes
+        motion (str): 'gather', 'redistribute' or 'broadcast' for Motion nodes, else None
+        senders (int): the segments a motion sends from
+        receivers (int): the segments a motion sends to
+        slice (int): the slice the node runs in. A motion is in the slice it sends from
+        segments (int): the virtual segments of a motion's slice
+        relation (str): the relation of a scan or partition selector
+        alias (str): the alias of the relation of a scan
+        partitions_selected (int): the partitions selected by a partition selector
+        partitions_total (int): the partitions a partition selector selects from
+        actual_rows (float): the rows produced, with EXPLAIN ANALYZE
+        actual_ms (float): the time to the last row, in milliseconds, with EXPLAIN ANALYZE
+        details (list of str): the other lines of the node, e.g. 'Hash Cond: ...'
+        children (list of PlanNode): the input nodes
+    """
+
+    def __init__(self, title, startup_cost, total_cost, rows, width):
+        self.title = title
+        self.node_type = title
+        self.startup_cost = startup_cost
+        self.total_cost = total_cost
+        self.rows = rows
+        self.width = width
+        self.motion = None
+        self.senders = None
+        self.receivers = None
+        self.slice = 0
+        self.segments = None
+        self.relation = None
+        self.alias = None
+        self.partitions_selected = None
+        self.partitions_total = None
+        self.actual_rows = None
+        self.actual_ms = None
+        self.details = []
+        self.children = []
+
+    def __repr__(self):
+        return '<PlanNode {} (cost={}..{} rows={})>'.format(
+            self.title, self.startup_cost, self.total_cost, self.rows
+        )
+
+    def walk(self):
+        '''
+        Yields:
+            PlanNode: this node and the nodes below it, depth first
+        '''
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def _parse_title(self):
+        motion = MOTION.match(self.title)
+        if motion:
+            self.node_type = '{} Motion'.format(motion.group('type'))
+            self.motion = MOTIONS[motion.group('type').lower()]
+            self.senders = int(motion.group('senders'))
+            self.receivers = int(motion.group('receivers'))
+            if motion.group('slice') is not None:
+                self.slice = int(motion.group('slice'))
+            if motion.group('segments') is not None:
+                self.segments = int(motion.group('segments'))
+            return
+        scan = SCAN.match(self.title)
+        if scan:
+            self.node_type = scan.group('type')
+            self.relation = scan.group('relation')
+            self.alias = scan.group('alias')
+            return
+        selector = PARTITION_SELECTOR.match(self.title)
+        if selector:
+            self.node_type = 'Partition Selector'
+            self.relation = selector.group('relation')
+
+    def _parse_detail(self, line):
+        selected = PARTITIONS_SELECTED.search(line)
+        if selected:
+            self.partitions_selected = int(selected.group('selected'))
+            self.partitions_total = int(selected.group('total'))
+        rows_out = ROWS_OUT.search(line)
+        if rows_out:
+            if rows_out.group('avg') is not None:
+                self.actual_rows = float(rows_out.group('avg')) * int(rows_out.group('workers'))
+            else:
+                self.actual_rows = float(rows_out.group('rows'))
+            if rows_out.group('end') is not None:
+                self.actual_ms = float(rows_out.group('end'))
+        self.details.append(line)
+
+
+class Plan:
+    """
+    A parsed Hawq plan
+
+    Attributes:
+        root (PlanNode): the top node
+        lines (list of str): the plan as printed
+        trailer (list of str): the lines after the tree, e.g. Settings, Slice statistics
+        total_runtime_ms (float): the total runtime, with EXPLAIN ANALYZE
+    """
+
+    def __init__(self, root, lines, trailer):
+        self.root = root
+        self.lines = lines
+        self.trailer = trailer
+        self.partitions = None
+        self.total_runtime_ms = None
+        for line in trailer:
+            runtime = TOTAL_RUNTIME.match(line.strip())
+            if runtime:
+                self.total_runtime_ms = float(runtime.group('ms'))
+
+    def __str__(self):
+        return '\n'.join(self.lines)
+
+    def nodes(self):
+        '''
+        Returns:
+            list of PlanNode: all nodes, depth first from the root
+        '''
+        return list(self.root.walk()) if self.root is not None else []
+
+    @property
+    def total_cost(self):
+        return self.root.total_cost if self.root is not None else None
+
+    @property
+    def rows(self):
+        return self.root.rows if self.root is not None else None
+
+    def slices(self):
+        '''
+        Returns:
+            dict of int to int: the virtual segments of each slice sent from by a motion
+        '''
+        return {node.slice: node.segments for node in self.nodes() if node.motion is not None}
+
+    def warnings(self, partitions=None):
+        '''
+        Flag the broadcast motions and the unpruned partition scans of the plan
+
+        A partition scan is unpruned when a partition selector selects all the
+        partitions of a table, or when all the leaf partitions of a table are
+        scanned under one Append.
+
+        Args:
+            partitions (callable, optional): maps the name of a scanned table to the
+                (root table name, number of leaf partitions) of the partitioned table
+                it is a child table of, or None. Defaults to the partitions of the plan,
+                set by explain(). Without it, the scans under an Append are not checked
+
+        Returns:
+            list of PlanWarning: the warnings, in plan order
+        '''
+        if partitions is None:
+            partitions = self.partitions
+        warnings = []
+        for node in self.nodes():
+            if node.motion == 'broadcast':
+                warnings.append(PlanWarning('broadcast_motion', node, (
+                    'Broadcast Motion {}:{} in slice {} sends ~{} rows to every segment'.format(
+                        node.senders, node.receivers, node.slice, node.rows
+                    )
+                )))
+            if node.partitions_total and node.partitions_selected >= node.partitions_total:
+                warnings.append(PlanWarning('unpruned_partition_scan', node, (
+                    'all {} partitions of {} are selected'.format(node.partitions_total, node.relation)
+                )))
+            if partitions is not None and node.children:
+                warnings.extend(_unpruned_children(node, partitions))
+        return warnings
+
+
+def _unpruned_children(node, partitions):
+    scanned = collections.defaultdict(set)
+    leaf_counts = {}
+    for child in node.children:
+        if child.relation is None:
+            continue
+        partition = partitions(child.relation)
+        if partition is None:
+            continue
+        root, leaf_count = partition
+        scanned[root].add(child.relation)
+        leaf_counts[root] = leaf_count
+    return [
+        PlanWarning('unpruned_partition_scan', node, (
+            'all {} leaf partitions of {} are scanned'.format(leaf_counts[root], root)
+        ))
+        for root, children in scanned.items()
+        if leaf_counts[root] and len(children) >= leaf_counts[root]
+    ]
+
+
+def partition_lookup(connection, partition_index):
+    '''
+    The partitions callable of Plan.warnings, from the cached partition catalog
+
+    Args:
+        connection (sqlalchemy.engine.Connection): the connection to load the catalog with
+        partition_index (sqlalchemy_hawq.catalog.PartitionIndex): the partition catalog
+
+    Returns:
+        callable: maps the name of a scanned table, optionally schema-qualified, to
+        the (root table name, number of leaf partitions) of its partitioned table, or None
+    '''
+    leaf_counts = {}
+
+    def lookup(relation):
+        schema, _, name = relation.replace('"', '').rpartition('.')
+        if not CHILD_TABLE.match(name):
+            return None  # not named like a child table, no need for the catalog
+        info = partition_index.partition(connection, name, schema or None)
+        if info is None:
+            return None
+        root = (info.schema, info.table)
+        if root not in leaf_counts:
+            children = partition_index.partitions(connection, info.table, info.schema)
+            leaf_level = max(child.level for child in children)
+            leaf_counts[root] = sum(1 for child in children if child.level == leaf_level)
+        return info.table, leaf_counts[root]
+
+    return lookup
+
+
+def parse_plan(lines):
+    '''
+    Parse the text of a Hawq plan, as returned by EXPLAIN one line per row
+
+    Args:
+        lines (list of str): the lines of the plan
+
+    Returns:
+        Plan: the parsed plan
+
+    Raises:
+        ValueError: when the lines contain no plan node
+    '''
+    lines = [line.rstrip('\n') for line in lines]
+    root = None
+    stack = []  # (indent, node) of the open nodes, innermost last
+    trailer = []
+    for line in lines:
+        if not line.strip():
+            continue
+        if trailer or (root is not None and not line[0].isspace() and not NODE_LINE.match(line)):
+            trailer.append(line)
+            continue
+        match = NODE_LINE.match(line)
+        arrow = ARROW_LINE.match(line)
+        if match is None and (arrow is not None or root is None):
+            raise ValueError('cannot parse the plan node ({})'.format(line.strip()))
+        if match is None:
+            indent = len(line) - len(line.lstrip())
+            while len(stack) > 1 and stack[-1][0] >= indent:
+                stack.pop()
+            stack[-1][1]._parse_detail(line.strip())  # pylint: disable=protected-access
+            continue
+        node = PlanNode(
+            match.group('title'),
+            float(match.group('startup')),
+            float(match.group('total')),
+            int(match.group('rows')),
+            int(match.group('width')),
+        )
+        actual = ACTUAL.search(match.group('rest'))
+        if actual:
+            node.actual_rows = float(actual.group('rows')) * int(actual.group('loops'))
+            node.actual_ms = float(actual.group('total'))
+        node._parse_title()  # pylint: disable=protected-access
+        indent = len(match.group('indent'))
+        if root is None:
+            root = node
+        else:
+            while stack and stack[-1][0] >= indent:
+                stack.pop()
+            if not stack:
+                raise ValueError('cannot place the plan node ({})'.format(line.strip()))
+            parent = stack[-1][1]
+            parent.children.append(node)
+            if node.motion is None:
+                node.slice = parent.slice  # a motion's inputs run in the slice it sends from
+        stack.append((indent, node))
+    if root is None:
+        raise ValueError('no plan node found')
+    return Plan(root, lines, trailer)
+
+
+class Explain(Executable, ClauseElement):
+    """
+    EXPLAIN, or EXPLAIN ANALYZE, of a statement. EXPLAIN ANALYZE runs the statement
+
+    Args:
+        statement: the statement to explain
+        analyze (bool): run the statement and report what it actually did
+    """
+
+    __visit_name__ = 'hawq_explain'
+
+    def __init__(self, statement, analyze=False):
+        if isinstance(statement, str):
+            statement = text(statement)
+        self.statement = statement
+        self.analyze = analyze
+
+
+@compiles(Explain, 'hawq')
+def visit_explain(element, compiler, **kwargs):
+    '''
+    Compile an Explain, with the parameters of the statement explained. EXPLAIN
+    only takes one statement, so an UPDATE or DELETE compiled to a rewrite of the
+    table explains the query producing the new rows, without running the rewrite
+
+    Raises:
+        ValueError: when the statement compiles to several statements that are not
+            a rewrite, e.g. a DELETE of partitions, or to a TRUNCATE
+    '''
+    sql = compiler.process(element.statement, **kwargs)
+    rewrite_query = getattr(compiler, 'hawq_rewrite_query', None)
+    writes = compiler.isupdate or compiler.isdelete
+    # the Explain itself neither writes nor rewrites a table
+    compiler.hawq_rewrite_query = None
+    compiler.isupdate = compiler.isdelete = False
+    if rewrite_query is not None:
+        sql = rewrite_query
+    elif writes or ';' in sql.strip().rstrip(';'):
+        raise ValueError('cannot explain several statements, or a DELETE compiled to TRUNCATE: {}'.format(sql))
+    return '{} {}'.format('EXPLAIN ANALYZE' if element.analyze else 'EXPLAIN', sql)
+
+
+def explain(connection, statement, analyze=False, partitions=None):
+    '''
+    Run EXPLAIN on a statement and parse the plan
+
+    Args:
+        connection (sqlalchemy.engine.Connection): the connection to explain the statement on
+        statement: the statement, or its SQL
+        analyze (bool): run the statement (EXPLAIN ANALYZE) to also get its actual rows and times
+        partitions (callable, optional): see Plan.warnings, kept on the plan as its default
+
+    Returns:
+        Plan: the parsed plan
+    '''
+    rows = connection.execute(Explain(statement, analyze))
+    plan = parse_plan([row[0] for row in rows])
+    plan.partitions = partitions
+    return plan
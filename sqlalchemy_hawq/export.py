@@ -0,0 +1,279 @@
+'''
+Streaming export support for the Apache Hawq database
+
+Wraps a query in COPY (query) TO STDOUT and streams the output with a fixed
+memory ceiling, instead of holding the whole result set in memory
+'''
+import queue
+import re
+import threading
+import time
+
+from psycopg2.extensions import encodings
+
+
+COPY_FORMATS = {'text', 'csv', 'binary'}
+
+TEXT_ESCAPE_PATTERN = re.compile(r'\\(?:([0-7]{1,3})|x([0-9a-fA-F]{1,2})|(.))')
+
+TEXT_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+
+
+class _QueueWriter:
+    """
+    File-like object handed to cursor.copy_expert. Buffers the COPY output into
+    chunks and puts them on a bounded queue, so that the copy blocks (and stops
+    reading from the server) until the consumer catches up.
+    """
+
+    def __init__(self, chunks, chunk_size):
+        self.chunks = chunks
+        self.chunk_size = chunk_size
+        self.bytes = 0
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.chunk_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self.chunks.put(b''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+
+class _CountingWriter:
+    """
+    File-like object handed to cursor.copy_expert, which counts the bytes of the
+    COPY output written to a sink
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        return self.sink.write(data)
+
+
+def copy_to_statement(query, connection, copy_format='csv', header=False):
+    '''
+    Render the COPY statement to export the results of a query
+
+    Args:
+        query (sqlalchemy.sql.expression.Selectable): the query to export
+        connection (sqlalchemy.engine.Connection): the connection the query will run on
+        copy_format (str): one of 'text', 'csv' or 'binary'
+        header (bool): include a header line (csv only)
+
+    Returns:
+        str: the COPY statement, with the query parameters already rendered in
+    '''
+    if copy_format not in COPY_FORMATS:
+        raise ValueError(
+            'copy_format ({}) must be one of {}'.format(copy_format, COPY_FORMATS)
+        )
+    if header and copy_format != 'csv':
+        raise ValueError('header is only valid for the csv format')
+
+    compiled = query.compile(dialect=connection.dialect)
+    params = compiled.construct_params()
+    for key, process in compiled._bind_processors.items():  # pylint: disable=protected-access
+        if key in params:
+            params[key] = process(params[key])
+
+    cursor = connection.connection.cursor()
+    try:
+        sql = cursor.mogrify(compiled.string, params).decode(
+            encodings[connection.connection.encoding]
+        )
+    finally:
+        cursor.close()
+
+    options = ''
+    if copy_format != 'text':
+        options = ' WITH {}'.format(copy_format.upper())
+        if header:
+            options += ' HEADER'
+    return 'COPY ({}) TO STDOUT{}'.format(sql, options)
+
+
+def copy_to(connection, query, sink, copy_format='csv', header=False):
+    '''
+    Export the results of a query directly into a file-like sink
+
+    The sink's own write() provides the backpressure: the server is not read
+    from while a write is blocked.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): the connection to run the query on
+        query (sqlalchemy.sql.expression.Selectable): the query to export
+        sink: a file or socket-like object with a write() method
+        copy_format (str): one of 'text', 'csv' or 'binary'
+        header (bool): include a header line (csv only)
+
+    Returns:
+        int: the number of rows exported
+    '''
+    sql = copy_to_statement(query, connection, copy_format, header)
+    collector = getattr(connection.dialect, 'stats_collector', None)
+    if collector is not None:
+        sink = _CountingWriter(sink)
+    cursor = connection.connection.cursor()
+    try:
+        start = time.perf_counter()
+        cursor.copy_expert(sql, sink)
+        if collector is not None:
+            collector.record(
+                sql,
+                time.perf_counter() - start,
+                cursor.rowcount,
+                len(sql.encode(encodings[connection.connection.encoding])),
+                kind='copy',
+                received=sink.bytes,
+            )
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def iter_copy_chunks(
+    connection, query, copy_format='csv', header=False, chunk_size=1024 * 1024, max_chunks=4
+):
+    '''
+    Export the results of a query as a stream of raw byte chunks
+
+    The COPY runs on a background thread which blocks once max_chunks chunks are
+    waiting to be consumed, so at most (max_chunks + 2) * chunk_size bytes are held
+    in memory at once. If the generator is closed early, the COPY is cancelled on the
+    server and the current transaction must be rolled back before the connection is
+    reused.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): the connection to run the query on
+        query (sqlalchemy.sql.expression.Selectable): the query to export
+        copy_format (str): one of 'text', 'csv' or 'binary'
+        header (bool): include a header line (csv only)
+        chunk_size (int): the approximate size in bytes of each chunk
+        max_chunks (int): the number of chunks that may be waiting to be consumed
+
+    Yields:
+        bytes: the COPY output, in chunks
+    '''
+    sql = copy_to_statement(query, connection, copy_format, header)
+    dbapi_connection = connection.connection
+    chunks = queue.Queue(maxsize=max_chunks)
+    writer = _QueueWriter(chunks, chunk_size)
+    done = object()
+    errors = []
+
+    collector = getattr(connection.dialect, 'stats_collector', None)
+    rowcounts = []
+
+    def run_copy():
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(sql, writer)
+            writer.flush()
+            rowcounts.append(cursor.rowcount)
+        except Exception as err:  # pylint: disable=broad-except
+            errors.append(err)
+        finally:
+            cursor.close()
+            chunks.put(done)
+
+    thread = threading.Thread(target=run_copy, name='hawq-copy-to', daemon=True)
+    start = time.perf_counter()
+    thread.start()
+    finished = False
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                finished = True
+                break
+            yield chunk
+    finally:
+        if not finished:
+            dbapi_connection.cancel()
+            # drain so the copy thread is never left blocked on a full queue
+            while chunks.get() is not done:
+                pass
+        thread.join()
+    if errors:
+        raise errors[0]
+    if collector is not None and rowcounts:
+        collector.record(
+            sql,
+            time.perf_counter() - start,
+            rowcounts[0],
+            len(sql.encode(encodings[dbapi_connection.encoding])),
+            kind='copy',
+            received=writer.bytes,
+        )
+
+
+def decode_text_field(field):
+    '''
+    Decode a single field of the COPY text format
+
+    Args:
+        field (str): the raw field
+
+    Returns:
+        str: the unescaped value, or None for NULL
+    '''
+    if field == '\\N':
+        return None
+    if '\\' not in field:
+        return field
+
+    def unescape(match):
+        octal, hexadecimal, char = match.groups()
+        if octal:
+            return chr(int(octal, 8))
+        if hexadecimal:
+            return chr(int(hexadecimal, 16))
+        return TEXT_ESCAPES.get(char, char)
+
+    return TEXT_ESCAPE_PATTERN.sub(unescape, field)
+
+
+def iter_copy_rows(connection, query, batch_size=10000, **kwargs):
+    '''
+    Export the results of a query as batches of decoded rows
+
+    Rows are streamed in the COPY text format (see iter_copy_chunks for the memory
+    bound) and decoded to tuples of str, with None for NULL.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): the connection to run the query on
+        query (sqlalchemy.sql.expression.Selectable): the query to export
+        batch_size (int): the number of rows in each batch
+        **kwargs: chunk_size and max_chunks, passed to iter_copy_chunks
+
+    Yields:
+        list of tuple: the next batch of rows
+    '''
+    encoding = encodings[connection.connection.encoding]
+    batch = []
+    remainder = b''
+    for chunk in iter_copy_chunks(connection, query, copy_format='text', **kwargs):
+        lines = (remainder + chunk).split(b'\n')
+        remainder = lines.pop()
+        for line in lines:
+            batch.append(tuple(decode_text_field(f) for f in line.decode(encoding).split('\t')))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if remainder:
+        batch.append(tuple(decode_text_field(f) for f in remainder.decode(encoding).split('\t')))
+    if batch:
+        yield batch
@@ -0,0 +1,266 @@
+'''
+Cost-based guard of the statements run on the Apache Hawq database
+
+A CostGuard, set as the hawq_cost_guard execution option of an engine or
+connection, runs EXPLAIN on each query before it is executed and compares the
+estimated cost and rows of the plan to its limits. An UPDATE or DELETE compiled
+to a rewrite of the table is estimated by the query producing the new rows. A query over the limits is
+rejected, logged, or run on the connection pool of a lower-priority engine
+instead. The estimates are cached by the compiled SQL of the statement, so
+repeated queries only pay for the EXPLAIN round trip once.
+'''
+import collections
+import logging
+import re
+
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.sql.selectable import SelectBase
+
+from .ddl import ClauseCache
+from .explain import parse_plan
+
+
+logger = logging.getLogger(__name__)
+
+#: what a guard does with the statements over its limits
+ACTIONS = ('reject', 'log', 'route')
+
+#: the most statements whose estimates a guard keeps
+PLAN_CACHE_SIZE = 1024
+
+#: the textual statements that are explained. Others, e.g. TRUNCATE, are run unchecked
+GUARDED_STATEMENT = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
+
+#: the textual statements that can be routed to another connection pool, as they only read
+ROUTABLE_STATEMENT = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+
+Estimate = collections.namedtuple('Estimate', ['cost', 'rows'])
+Estimate.__doc__ = '''
+The estimated total cost and rows of the plan of a statement
+'''
+
+
+def guarded_statement(context):
+    '''
+    The statement to explain for the statement of an execution context, decided
+    from its compiled statement. Only compiled statements are checked, and never
+    with EXPLAIN in front of several statements: an UPDATE or DELETE compiled to a
+    rewrite of the table is estimated by the query of the rewrite, and one compiled
+    to TRUNCATE is not checked. A textual statement is checked when it is a single
+    SELECT, INSERT, UPDATE or DELETE
+
+    Args:
+        context (HawqExecutionContext): the execution context of the statement
+
+    Returns:
+        tuple of (str, bool): the statement to explain, or None when the statement
+        is not checked, and whether the statement only reads, so that it can be routed
+    '''
+    compiled = context.compiled
+    if compiled is None or context.isddl:
+        return None, False
+    rewrite_query = getattr(compiled, 'hawq_rewrite_query', None)
+    if rewrite_query is not None:
+        return rewrite_query, False
+    if context.isupdate or context.isdelete:
+        return None, False
+    statement = context.statement
+    if context.isinsert:
+        return statement, False
+    if isinstance(compiled.statement, SelectBase):
+        return statement, True
+    if (
+        isinstance(compiled.statement, TextClause)
+        and GUARDED_STATEMENT.match(statement)
+        and ';' not in statement.strip().rstrip(';')
+    ):
+        return statement, bool(ROUTABLE_STATEMENT.match(statement))
+    return None, False
+
+
+class CostLimitExceeded(ValueError):
+    """
+    Raised when a statement is estimated to be over the limits of a CostGuard
+
+    Args:
+        message (str): the description of the limits exceeded
+        statement (str): the statement
+        estimate (Estimate): the estimated cost and rows of the statement
+    """
+
+    def __init__(self, message, statement, estimate):
+        super().__init__(message)
+        self.statement = statement
+        self.estimate = estimate
+
+
+class RoutedCursor:
+    """
+    A cursor of a connection checked out from another pool, that checks the
+    connection back in when it is closed
+
+    Args:
+        cursor: the DBAPI cursor
+        connection: the pooled DBAPI connection of the cursor
+    """
+
+    def __init__(self, cursor, connection):
+        self._cursor = cursor
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        '''
+        Close the cursor and return its connection to its pool
+        '''
+        connection, self._connection = self._connection, None
+        try:
+            self._cursor.close()
+        finally:
+            if connection is not None:
+                connection.close()
+
+
+class CostGuard:
+    """
+    Checks the estimated cost and rows of statements before they are executed
+
+    Set it as the hawq_cost_guard execution option, e.g. with
+    engine.execution_options(hawq_cost_guard=guard), to check the statements run
+    on the engine. Only compiled SELECT, INSERT, UPDATE and DELETE statements are
+    checked, see guarded_statement.
+
+    Args:
+        max_cost (float, optional): the highest estimated total cost allowed
+        max_rows (int, optional): the highest estimated rows allowed
+        action (str): what to do with a statement over the limits: 'reject' raises
+            CostLimitExceeded, 'log' logs a warning and runs it, 'route' runs it on a
+            connection of the fallback engine. INSERT, UPDATE and DELETE, which would
+            leave the transaction of the connection, are rejected instead of routed
+        fallback (sqlalchemy.engine.Engine): the engine of the lower-priority connection
+            pool (e.g. of a role in a low-priority resource queue), for 'route'
+        cache_size (int): the most statements whose estimates are kept
+    """
+
+    def __init__(self, max_cost=None, max_rows=None, action='reject', fallback=None, cache_size=PLAN_CACHE_SIZE):
+        if action not in ACTIONS:
+            raise ValueError('action ({}) must be one of {}'.format(action, ', '.join(ACTIONS)))
+        if action == 'route' and fallback is None:
+            raise ValueError('the route action needs a fallback engine')
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.action = action
+        self.fallback = fallback
+        self._estimates = ClauseCache(cache_size)
+
+    def estimate(self, dbapi_connection, statement, parameters, no_parameters=False):
+        '''
+        The estimated cost and rows of a statement, from the cache or from EXPLAIN
+
+        Args:
+            dbapi_connection: the DBAPI connection to run EXPLAIN on
+            statement (str): the compiled statement
+            parameters: the DBAPI parameters of the statement
+            no_parameters (bool): the no_parameters execution option of the statement,
+                with which a statement without parameters is executed without them
+
+        Returns:
+            Estimate: the estimated cost and rows of the plan
+        '''
+
+        def explain():
+            cursor = dbapi_connection.cursor()
+            try:
+                # as the statement is executed, so that the DBAPI reads the % in it the same way
+                if no_parameters and not parameters:
+                    cursor.execute('EXPLAIN ' + statement)
+                else:
+                    cursor.execute('EXPLAIN ' + statement, parameters)
+                plan = parse_plan([row[0] for row in cursor.fetchall()])
+            finally:
+                cursor.close()
+            return Estimate(plan.total_cost, plan.rows)
+
+        return self._estimates.get(statement, explain)
+
+    def clear(self):
+        '''
+        Drop the cached estimates, e.g. after the tables were analyzed
+        '''
+        self._estimates.clear()
+
+    def violations(self, estimate):
+        '''
+        Returns:
+            list of str: the limits the estimate is over, if any
+        '''
+        violations = []
+        if self.max_cost is not None and estimate.cost > self.max_cost:
+            violations.append('estimated cost {} over {}'.format(estimate.cost, self.max_cost))
+        if self.max_rows is not None and estimate.rows > self.max_rows:
+            violations.append('estimated rows {} over {}'.format(estimate.rows, self.max_rows))
+        return violations
+
+    def check(self, context):
+        '''
+        Check the statement of an execution context, before it is executed, and
+        reject, log or route it when it is over the limits
+
+        Args:
+            context (HawqExecutionContext): the execution context of the statement
+
+        Raises:
+            CostLimitExceeded: when the statement is over the limits and cannot be run
+        '''
+        explained, routable = guarded_statement(context)
+        if explained is None:
+            return
+        statement = context.statement
+        try:
+            estimate = self.estimate(
+                context._dbapi_connection,  # pylint: disable=protected-access
+                explained,
+                context.parameters[0],
+                context.no_parameters,
+            )
+        except context.dialect.dbapi.Error as err:
+            context.root_connection._handle_dbapi_exception(  # pylint: disable=protected-access
+                err, 'EXPLAIN ' + explained, context.parameters[0], context.cursor, context
+            )
+        violations = self.violations(estimate)
+        if not violations:
+            return
+        message = '; '.join(violations)
+        if self.action == 'log':
+            logger.warning('running a statement over the cost limits (%s): %s', message, statement)
+        elif self.action == 'route' and routable:
+            logger.info('routing a statement over the cost limits (%s): %s', message, statement)
+            self.route(context)
+        else:
+            context.cursor.close()
+            raise CostLimitExceeded(
+                'statement rejected, {}: {}'.format(message, statement), statement, estimate
+            )
+
+    def route(self, context):
+        '''
+        Run the statement of an execution context on a connection of the fallback
+        engine, by replacing the cursor of the context. The connection is returned to
+        its pool when the result is closed
+        '''
+        connection = self.fallback.raw_connection()
+        try:
+            if context._is_server_side:  # pylint: disable=protected-access
+                cursor = connection.cursor('c_routed_{:x}'.format(id(context)))
+            else:
+                cursor = connection.cursor()
+        except Exception:
+            connection.close()
+            raise
+        context.cursor.close()
+        context.cursor = RoutedCursor(cursor, connection)
@@ -0,0 +1,135 @@
+'''
+Staged "insert or replace by key" merges into tables on the Apache Hawq database
+
+Hawq tables are append-only, so rows cannot be replaced in place. StagedMerge
+bulk-loads the incoming rows into a temporary staging table (ON COMMIT DROP),
+counts the keys that already exist with one join, and then either appends the
+staged rows (when no key exists yet) or rewrites the table once, keeping the
+rows whose key is not staged (an anti-join) followed by the staged rows.
+'''
+import collections
+import logging
+import operator
+
+from sqlalchemy import Column, MetaData, Table, and_, exists, func, select, union_all
+from sqlalchemy.schema import CreateTable, DropTable
+
+from .rewrite import TableReplace, suffixed_name
+
+
+logger = logging.getLogger(__name__)
+
+
+#: appended to the name of a table for its staging table
+STAGING_SUFFIX = '__hawq_staging'
+
+
+MergeResult = collections.namedtuple('MergeResult', ['inserted', 'replaced'])
+MergeResult.__doc__ = '''
+The outcome of a merge: the number of rows inserted with new keys, and the number
+of rows that replaced the rows of an existing key
+'''
+
+
+class StagedMerge:
+    """
+    Inserts rows into a table, replacing the rows that have the same key
+
+    Args:
+        table (sqlalchemy.schema.Table): the table merged into
+        key (str or list of str): the names of the key columns
+
+    Raises:
+        ValueError: when a key column is not in the table
+    """
+
+    def __init__(self, table, key):
+        if isinstance(key, str):
+            key = [key]
+        for name in key:
+            if name not in table.c:
+                raise ValueError('Key column ({}) not found in table ({})'.format(name, table.name))
+        options = table.dialect_options['hawq']
+        self.table = table
+        self.key = list(key)
+        # distributed like the table, so that the joins with it are co-located
+        self.staging = Table(
+            suffixed_name(table.name, STAGING_SUFFIX),
+            MetaData(),
+            *[Column(column.name, column.type, key=column.key) for column in table.columns],
+            prefixes=['TEMPORARY'],
+            hawq_on_commit='DROP',
+            hawq_distributed_by=options['distributed_by'],
+            hawq_bucketnum=options['bucketnum']
+        )
+
+    def _key_matches(self, left, right):
+        return and_(*[left.c[name] == right.c[name] for name in self.key])
+
+    def unique_rows(self, rows):
+        '''
+        Drop the rows whose key repeats in a later row
+
+        Args:
+            rows (list of dict): the rows, keyed by column key
+
+        Returns:
+            list of dict: the last row of each key, in the order each key first appears
+        '''
+        row_key = operator.itemgetter(*self.key)
+        unique = collections.OrderedDict()
+        for row in rows:
+            unique[row_key(row)] = row
+        return list(unique.values())
+
+    def count_query(self):
+        '''
+        Returns:
+            sqlalchemy.sql.expression.Select: the number of staged rows, and of staged
+            rows whose key is in the table
+        '''
+        keys = select([self.table.c[name] for name in self.key]).distinct().alias('hawq_keys')
+        return select([func.count(), func.count(keys.c[self.key[0]])]).select_from(
+            self.staging.outerjoin(keys, self._key_matches(keys, self.staging))
+        )
+
+    def merge_query(self):
+        '''
+        Returns:
+            the UNION ALL of the rows of the table whose key is not staged, and the staged rows
+        '''
+        kept = select([self.table]).where(~exists().where(self._key_matches(self.staging, self.table)))
+        return union_all(kept, select([self.staging]))
+
+    def execute(self, connection, rows):
+        '''
+        Merge rows into the table, in a transaction
+
+        The rows are loaded into the staging table with one executemany, which is
+        a COPY when the dialect has copy_executemany. Of the rows with the same key,
+        only the last one is merged.
+
+        Args:
+            connection (sqlalchemy.engine.Connection): the connection to merge with
+            rows (list of dict): the rows, keyed by column key
+
+        Returns:
+            MergeResult: the number of rows inserted and replaced
+        '''
+        rows = self.unique_rows(rows)
+        if not rows:
+            return MergeResult(0, 0)
+        with connection.begin():
+            connection.execute(CreateTable(self.staging))
+            connection.execute(self.staging.insert(), rows)
+            staged, replaced = connection.execute(self.count_query()).first()
+            if replaced:
+                connection.execute(TableReplace(self.table, self.merge_query()))
+            else:
+                connection.execute(
+                    self.table.insert().from_select(list(self.table.columns), select([self.staging]))
+                )
+            # dropped on commit anyway, but another merge may follow in this transaction
+            connection.execute(DropTable(self.staging))
+        logger.debug('merged %d rows into %s, replacing %d', staged, self.table.name, replaced)
+        return MergeResult(staged - replaced, replaced)
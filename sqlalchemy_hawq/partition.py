@@ -5,7 +5,41 @@ for use as the values of key 'hawq_partition_by'.
 
 """
 import re
+import datetime
 import decimal
+import itertools
+import numbers
+import operator
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+#: the names allowed for partitions, word characters only (to avoid injection)
+PARTITION_NAME = re.compile(r'^[a-z]\w+$', re.IGNORECASE)
+
+#: the comparisons that depend on the order of the values
+ORDER_COMPARISONS = (operator.lt, operator.le, operator.gt, operator.ge)
+
+#: the values Python orders as the database does. Strings are ordered by the collation of the database
+ORDERED_TYPES = (numbers.Number, datetime.date, datetime.time, datetime.timedelta)
+
+
+def ordered_like_database(compare, value):
+    """ Whether compare(column value, value) evaluates in Python as in the database.
+
+    Args:
+        compare(callable): a comparison from the operator module.
+        value: the value compared with.
+
+    Returns:
+        bool: False for the order comparisons of values the database may order
+        differently, e.g. strings, whose order depends on the collation.
+
+    """
+    return compare not in ORDER_COMPARISONS or isinstance(value, ORDERED_TYPES)
 
 
 class Partition:
@@ -64,6 +98,50 @@ class Partition:
         """Base version of func that returns the assembled clause."""
         raise NotImplementedError('abstract method must be overridden')
 
+    def partition_names(self):
+        """Base version of func that returns the names of the partitions at this level."""
+        raise NotImplementedError('abstract method must be overridden')
+
+    def partition_indexes(self, column, values):
+        """Base version of func that locates the partition of each value."""
+        raise NotImplementedError('abstract method must be overridden')
+
+    def matching_partitions(self, column, compare, value):
+        """Base version of func that finds the partitions holding values that may match."""
+        raise NotImplementedError('abstract method must be overridden')
+
+    def covering_partitions(self, column, compare, value):
+        """Base version of func that finds the partitions holding only values that match."""
+        raise NotImplementedError('abstract method must be overridden')
+
+    def cache_key(self):
+        """Base version of func that returns a hashable key of the partition plan."""
+        raise NotImplementedError('abstract method must be overridden')
+
+    def partition_for(self, column, index):
+        """Base version of func that returns the clause naming a partition in ALTER TABLE."""
+        raise NotImplementedError('abstract method must be overridden')
+
+    def level_count(self):
+        """Base version of func that returns the number of partitions at this level."""
+        raise NotImplementedError('abstract method must be overridden')
+
+    def leaf_count(self):
+        """The number of leaf partitions (child tables holding rows) of the partition plan.
+
+        Every subpartition is a template applied to each partition of the level
+        above, so this is the product of the number of partitions at each level,
+        default partitions included. It is computed without rendering the clause.
+
+        Returns:
+            count(int): the number of leaf partitions.
+
+        """
+        count = self.level_count()
+        for item in self.subpartitions:
+            count *= item.level_count()
+        return count
+
 
 class ListPartition(Partition):
     """ A class representing a list-style top-level partition.
@@ -85,6 +163,26 @@ class ListPartition(Partition):
         self.mapping = mapping
         self.subpartitions = subpartitions
 
+    def iter_partition_statements(self, column, partition_level=''):
+        """ Generates the partition statements one at a time, in mapping order.
+
+        The value formatter of the column type is resolved once, so long
+        mappings are rendered in linear time without intermediate lists.
+
+        Args:
+            column(Column): the column to partition on.
+            partition_level(str, optional): either '' or 'SUB'. Prepended to
+            'PARTITION' in strs.
+
+        Yields:
+            statement(str): the statement defining one partition.
+
+        """
+        template = '    {}PARTITION {{}} VALUES ({{}}),'.format(partition_level).format
+        format_value = value_formatter(column.type)
+        for name, value in self.mapping.items():
+            yield template(valid_partition_name(name), format_value(value))
+
     def get_partition_statements(self, column, partition_level=''):
         """ Assembles a partition clause.
 
@@ -98,14 +196,7 @@ class ListPartition(Partition):
             for this column.
 
         """
-        partition_statements = []
-        for name, value in self.mapping.items():
-            partition_statements.append("""    {}PARTITION {} VALUES ({}),""".format(
-                partition_level,
-                valid_partition_name(name),
-                format_partition_value(column.type, value)
-            ))
-        return partition_statements
+        return list(self.iter_partition_statements(column, partition_level))
 
     def clause(self, table):
         """ Assembles the partition clause.
@@ -118,17 +209,136 @@ class ListPartition(Partition):
 
         """
         column = self.partition_column(table)
-        partition_statements = self.get_partition_statements(column)
         subpartition_statements = self.get_subpartition_statements(table)
 
-        statement = """PARTITION BY LIST ({}){}
-(
-{}
-    DEFAULT PARTITION other
-)""".format(self.column_name,
+        return "".join([
+            "PARTITION BY LIST ({})".format(self.column_name),
             "\n".join(subpartition_statements),
-            "\n".join(partition_statements))
-        return statement
+            "\n(\n",
+            "\n".join(self.iter_partition_statements(column)),
+            "\n    DEFAULT PARTITION other\n)",
+        ])
+
+    def partition_names(self):
+        """ Names of the partitions at this level, as used in the child table names.
+
+        Returns:
+            names(`list` of str): the named partitions in mapping order, then
+            the default partition 'other'.
+
+        """
+        return [valid_partition_name(name) for name in self.mapping] + ['other']
+
+    def level_count(self):
+        """ The number of partitions at this level: the named partitions and the default partition. """
+        return len(self.mapping) + 1
+
+    def partition_indexes(self, column, values):
+        """ Locates the partition of each value, evaluating the mapping in Python.
+
+        Args:
+            column(Column): the column partitioned on, whose type the
+                mapping values are cast to.
+            values(sequence): the column values.
+
+        Returns:
+            indexes(`list` of int): the index of each value's partition in
+            partition_names(). Values not in the mapping (and NULL)
+            map to the default partition.
+
+        """
+        lookup = {}
+        for index, value in enumerate(self.mapping.values()):
+            lookup.setdefault(partition_value(column.type, value), index)
+        # a dict lookup per value, mapped in C, beats sorting the values with numpy
+        return list(map(lookup.get, values, itertools.repeat(len(self.mapping), len(values))))
+
+    def matching_partitions(self, column, compare, value):
+        """ Finds the partitions that may hold values for which compare(column value, value) is true.
+
+        Args:
+            column(Column): the column partitioned on.
+            compare(callable): a comparison from the operator module (eq, ne, lt, le, gt or ge).
+            value: the value compared with, not None.
+
+        Returns:
+            indexes(`set` of int): the indexes of the partitions in partition_names().
+            The default partition is included unless compare is eq and the
+            value is in the mapping. All of them are for an order comparison
+            with a value not ordered as in the database, e.g. a string.
+
+        """
+        if not ordered_like_database(compare, value):
+            return set(range(self.level_count()))
+        matches = set()
+        mapped = False
+        for index, mapped_value in enumerate(self.mapping.values()):
+            mapped_value = partition_value(column.type, mapped_value)
+            mapped = mapped or mapped_value == value
+            try:
+                if compare(mapped_value, value):
+                    matches.add(index)
+            except TypeError:
+                matches.add(index)
+        if compare is not operator.eq or not mapped:
+            matches.add(len(self.mapping))
+        return matches
+
+    def covering_partitions(self, column, compare, value):
+        """ Finds the partitions holding only values for which compare(column value, value) is true.
+
+        Args:
+            column(Column): the column partitioned on.
+            compare(callable): a comparison from the operator module (eq, ne, lt, le, gt or ge).
+            value: the value compared with, not None.
+
+        Returns:
+            indexes(`set` of int): the indexes of the partitions in partition_names().
+            Never includes the default partition, which can hold any value, and
+            empty for an order comparison with a value not ordered as in the
+            database, e.g. a string.
+
+        """
+        covers = set()
+        if not ordered_like_database(compare, value):
+            return covers
+        for index, mapped_value in enumerate(self.mapping.values()):
+            try:
+                if compare(partition_value(column.type, mapped_value), value):
+                    covers.add(index)
+            except TypeError:
+                pass
+        return covers
+
+    def partition_for(self, column, index):
+        """ The clause naming a partition in ALTER TABLE, e.g. PARTITION FOR ('e').
+
+        Args:
+            column(Column): the column partitioned on.
+            index(int): the index of the partition in partition_names().
+
+        Returns:
+            clause(str): the partition clause.
+
+        """
+        if index == len(self.mapping):
+            return 'PARTITION other'
+        value = list(self.mapping.values())[index]
+        return 'PARTITION FOR ({})'.format(format_partition_value(column.type, value))
+
+    def cache_key(self):
+        """ A hashable key of the partition plan, equal for plans with the same clause.
+
+        Returns:
+            key(tuple): the class, column, mapping and subpartition keys.
+
+        """
+        return (
+            type(self),
+            self.column_name,
+            tuple(self.mapping.items()),
+            tuple(item.cache_key() for item in self.subpartitions),
+        )
 
 
 class ListSubpartition(ListPartition):
@@ -149,15 +359,12 @@ class ListSubpartition(ListPartition):
          """
 
         column = self.partition_column(table)
-        partition_statements = self.get_partition_statements(column, 'SUB')
 
-        statement = """    SUBPARTITION BY LIST ({})
-    SUBPARTITION TEMPLATE
-    (
-    {}
-        DEFAULT SUBPARTITION other
-    )""".format(self.column_name, "\n    ".join(partition_statements))
-        return statement
+        return "".join([
+            "    SUBPARTITION BY LIST ({})\n    SUBPARTITION TEMPLATE\n    (\n    ".format(self.column_name),
+            "\n    ".join(self.iter_partition_statements(column, 'SUB')),
+            "\n        DEFAULT SUBPARTITION other\n    )",
+        ])
 
 
 class RangePartition(Partition):
@@ -207,6 +414,146 @@ class RangePartition(Partition):
             self.every)
         return statement
 
+    def partition_count(self):
+        """ The number of partitions between start and end, excluding the default partition. """
+        return max(0, -(-(self.end - self.start) // self.every))
+
+    def partition_names(self):
+        """ Names of the partitions at this level, as used in the child table names.
+
+        HAWQ ranks the partitions generated by START/END/EVERY after the default
+        partition, so they are named from '2' upwards.
+
+        Returns:
+            names(`list` of str): the ranked partitions in order, then the
+            default partition 'extra'.
+
+        """
+        return [str(rank) for rank in range(2, self.partition_count() + 2)] + ['extra']
+
+    def level_count(self):
+        """ The number of partitions at this level: the ranked partitions and the default partition. """
+        return self.partition_count() + 1
+
+    def partition_indexes(self, column, values):
+        """ Locates the partition of each value, evaluating start/end/every in Python.
+
+        Args:
+            column(Column): the column partitioned on.
+            values(sequence): the column values.
+
+        Returns:
+            indexes(`list` or numpy array of int): the index of each value's
+            partition in partition_names(). Values outside [start, end) (and NULL)
+            map to the default partition.
+
+        """
+        default = self.partition_count()
+        if numpy is not None:
+            array = numpy.asarray(values)
+            if array.dtype.kind in 'iuf':
+                inside = (array >= self.start) & (array < self.end)
+                indexes = numpy.floor_divide(array - self.start, self.every)
+                return numpy.where(inside, indexes, default).astype(int)
+        return [
+            default if value is None or not self.start <= value < self.end
+            else int((value - self.start) // self.every)
+            for value in values
+        ]
+
+    def matching_partitions(self, column, compare, value):
+        """ Finds the partitions that may hold values for which compare(column value, value) is true.
+
+        Args:
+            column(Column): the column partitioned on.
+            compare(callable): a comparison from the operator module (eq, ne, lt, le, gt or ge).
+            value: the value compared with, not None.
+
+        Returns:
+            indexes(`set` of int): the indexes of the partitions in partition_names().
+            The default partition is included unless compare is eq and the
+            value is in [start, end).
+
+        """
+        count = self.partition_count()
+        if compare is operator.eq:
+            if self.start <= value < self.end:
+                return {int((value - self.start) // self.every)}
+            return {count}
+        matches = {count}
+        for index in range(count):
+            lower = self.start + index * self.every
+            upper = min(lower + self.every, self.end)  # exclusive
+            if not (
+                (compare is operator.lt and lower >= value)
+                or (compare is operator.le and lower > value)
+                or (compare in (operator.gt, operator.ge) and upper <= value)
+            ):
+                matches.add(index)
+        return matches
+
+    def covering_partitions(self, column, compare, value):
+        """ Finds the partitions holding only values for which compare(column value, value) is true.
+
+        Args:
+            column(Column): the column partitioned on.
+            compare(callable): a comparison from the operator module (eq, ne, lt, le, gt or ge).
+            value: the value compared with, not None.
+
+        Returns:
+            indexes(`set` of int): the indexes of the partitions in partition_names().
+            Never includes the default partition, which holds the values outside
+            [start, end). Equality only covers partitions of a single integer.
+
+        """
+        covers = set()
+        for index in range(self.partition_count()):
+            lower = self.start + index * self.every
+            upper = min(lower + self.every, self.end)  # exclusive
+            if (
+                (compare is operator.eq and lower == value and upper == lower + 1
+                 and column.type.python_type is int)
+                or (compare is operator.ne and not lower <= value < upper)
+                or (compare is operator.lt and upper <= value)
+                or (compare is operator.le and upper <= value)
+                or (compare is operator.gt and lower > value)
+                or (compare is operator.ge and lower >= value)
+            ):
+                covers.add(index)
+        return covers
+
+    def partition_for(self, column, index):
+        """ The clause naming a partition in ALTER TABLE, e.g. PARTITION FOR (2005).
+
+        Args:
+            column(Column): the column partitioned on.
+            index(int): the index of the partition in partition_names().
+
+        Returns:
+            clause(str): the partition clause, by the start of its range.
+
+        """
+        if index == self.partition_count():
+            return 'PARTITION extra'
+        lower = self.start + index * self.every
+        return 'PARTITION FOR ({})'.format(format_partition_value(column.type, lower))
+
+    def cache_key(self):
+        """ A hashable key of the partition plan, equal for plans with the same clause.
+
+        Returns:
+            key(tuple): the class, column, range and subpartition keys.
+
+        """
+        return (
+            type(self),
+            self.column_name,
+            self.start,
+            self.end,
+            self.every,
+            tuple(item.cache_key() for item in self.subpartitions),
+        )
+
 
 class RangeSubpartition(RangePartition):
     """ Overrides a parent method in order to provide a modified partition clause.
@@ -253,18 +600,66 @@ def format_partition_value(type_, value):
         uses double dollar sign quoted strings for strings containing single quotes
          https://www.postgresql.org/docs/current/static/sql-syntax-lexical.html#SQL-SYNTAX-DOLLAR-QUOTING
     '''
-    if type_.python_type in [int, float, decimal.Decimal]:
-        return str(type_.python_type(value))
-    if type_.python_type == str:
-        if '\'' in value:
-            return '$${}$$'.format(value)
-        return '\'{}\''.format(value)
+    return value_formatter(type_)(value)
+
+
+def value_formatter(type_):
+    '''
+    Resolve how format_partition_value formats the values of an SQL type, once, for
+    formatting many values of the same column
+
+    Args:
+        type_: an sqlalchemy type instance e.x. TEXT()
+
+    Returns:
+        callable: formats a single value of the type as format_partition_value does
+    '''
+    python_type = type_.python_type
+    if python_type in [int, float, decimal.Decimal]:
+        return lambda value: str(python_type(value))
+    if python_type == str:
+        return _format_text_value
+    if python_type == bool:
+        return _format_bool_value
+
+    def unsupported(value):
+        raise NotImplementedError(
+            'unsupported type ({}) for the given value ({}) in hawq has not been implemented'.format(
+                python_type, value
+            )
+        )
+
+    return unsupported
+
+
+def _format_text_value(value):
+    if '\'' in value:
+        return '$${}$$'.format(value)
+    return '\'{}\''.format(value)
+
+
+def _format_bool_value(value):
+    if str(value).lower() in ['t', 'true', '1']:
+        return 'TRUE'
+    return 'FALSE'
+
+
+def partition_value(type_, value):
+    '''
+    Cast a partition value to the python equivalent of the SQL type, as
+    format_partition_value does, for comparing it with column values in Python
+
+    Args:
+        type_: an sqlalchemy type instance e.x. TEXT()
+        value: value to cast
+
+    Returns:
+        the value cast to its python equivalent
+    '''
+    if type_.python_type in [int, float, decimal.Decimal, str]:
+        return type_.python_type(value)
     if type_.python_type == bool:
-        if str(value).lower() in ['t', 'true', '1']:
-            return 'TRUE'
-        if str(value).lower() in ['f', 'false', '0']:
-            return 'FALSE'
-        return 'FALSE'
+        return format_partition_value(type_, value) == 'TRUE'
     raise NotImplementedError('unsupported type ({}) for the given value ({}) in hawq has not been implemented'.format(
         type_.python_type, value
     ))
@@ -283,7 +678,7 @@ def valid_partition_name(name):
     Raises:
         ValueError: when an invalid partition name is input
     '''
-    if not re.match(r'^[a-z]\w+$', str(name), re.IGNORECASE):
+    if not PARTITION_NAME.match(str(name)):
         raise ValueError('invalid partition name ){})'.format(name))
     else:
         return name
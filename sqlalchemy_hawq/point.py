@@ -1,9 +1,6 @@
 '''
 Defines Hawq point type for use by Sqlalchemy
 '''
-import re
-
-
 from sqlalchemy.types import UserDefinedType
 
 
@@ -13,6 +10,160 @@ class SQLAlchemyHawqException(Exception):
     """
 
 
+POINT_CHARACTERS = str.maketrans('(),', '   ')
+
+#: the OID of the POINT type, fixed in the catalog of postgres and Hawq
+POINT_OID = 600
+
+
+def format_point(value):
+    '''
+    Convert a 2-element point to its SQL string
+
+    Args:
+        value: an (x, y) sequence, or None
+
+    Returns:
+        str: the point as '(x, y)', or None if both coordinates (or the point) are None
+
+    Raises:
+        SQLAlchemyHawqException: when the input is not a pair or only one coordinate is None
+    '''
+    if value is None:
+        return None
+    try:
+        val1, val2 = value
+    except (ValueError, TypeError) as err:
+        raise SQLAlchemyHawqException('Unexpected input type for Point ({})'.format(value)) from err
+    if val1 is None or val2 is None:
+        if val1 is not None or val2 is not None:
+            raise SQLAlchemyHawqException(
+                'Both values must be non-null or no data will be saved for Point({})'.format(value)
+            )
+        return None
+    return '(%s, %s)' % (val1, val2)
+
+
+def parse_point(value):
+    '''
+    Convert the SQL string of a point into a tuple. Accepts negative and
+    scientific-notation coordinates.
+
+    Args:
+        value (str): the point as '(x,y)', or None
+
+    Returns:
+        tuple of float: the (x, y) point, or None
+
+    Raises:
+        SQLAlchemyHawqException: when the string is not a point
+    '''
+    if value is None:
+        return None
+    if value[:1] == '(' and value[-1:] == ')':
+        coords = value[1:-1].split(',')
+        if len(coords) == 2:
+            try:
+                return (float(coords[0]), float(coords[1]))
+            except ValueError:
+                pass
+    raise SQLAlchemyHawqException('Failed to get Point value from SQL ({})'.format(value))
+
+
+def cast_point(value, cursor):  # pylint: disable=unused-argument
+    '''
+    psycopg2 typecaster for POINT columns, registered by the dialect on connect
+    so that points are fetched as tuples
+
+    Args:
+        value (str): the point as '(x,y)', or None
+        cursor: the DBAPI cursor fetching the value
+
+    Returns:
+        tuple of float: the (x, y) point, or None
+    '''
+    return parse_point(value)
+
+
+def format_points(values):
+    '''
+    Convert a sequence of points to their SQL strings in one pass
+
+    Args:
+        values: a sequence of (x, y) pairs or None, or an (n, 2) numpy array
+
+    Returns:
+        list of str: the SQL strings, with None for null points
+    '''
+    if hasattr(values, 'tolist'):
+        # an array has no nulls to check for
+        return ['(%s, %s)' % (val1, val2) for val1, val2 in values.tolist()]
+    return [format_point(value) for value in values]
+
+
+def parse_points(values):
+    '''
+    Convert a sequence of point SQL strings into tuples in one pass.
+    The non-null strings are joined and split at once, instead of per value.
+
+    Args:
+        values (sequence of str): the SQL strings, or None for null points
+
+    Returns:
+        list of tuple: the (x, y) points, with None for null points
+
+    Raises:
+        SQLAlchemyHawqException: when any string is not a point
+    '''
+    present = [value for value in values if value is not None]
+    text = ''.join(present)
+    coords = text.translate(POINT_CHARACTERS).split()
+    count = len(present)
+    if (
+        len(coords) != 2 * count
+        or text.count('(') != count
+        or text.count(')') != count
+        or text.count(',') != count
+    ):
+        # parse one by one to report the offending value
+        return [parse_point(value) for value in values]
+    try:
+        floats = iter([float(coord) for coord in coords])
+    except ValueError:
+        floats = None
+    if floats is None:
+        return [parse_point(value) for value in values]
+    points = list(zip(floats, floats))
+    if count == len(values):
+        return points
+    points = iter(points)
+    return [None if value is None else next(points) for value in values]
+
+
+def points_to_array(values):
+    '''
+    Convert a sequence of non-null points into an (n, 2) float64 numpy array.
+    The strings are joined and parsed by numpy at once, instead of per value.
+
+    Args:
+        values (sequence): SQL strings '(x,y)' or (x, y) tuples
+
+    Returns:
+        numpy.ndarray: the (n, 2) array of coordinates
+    '''
+    import numpy  # pylint: disable=import-outside-toplevel
+
+    if not len(values):  # pylint: disable=len-as-condition
+        return numpy.empty((0, 2), dtype='float64')
+    if isinstance(values[0], str):
+        text = ''.join(values).translate(POINT_CHARACTERS)
+        array = numpy.fromstring(text, dtype='float64', sep=' ')
+        if array.size != 2 * len(values):
+            raise SQLAlchemyHawqException('Failed to get Point values from SQL')
+        return array.reshape(-1, 2)
+    return numpy.array(values, dtype='float64').reshape(-1, 2)
+
+
 class Point(UserDefinedType):
     """
     Wrapper for a 2-element tuple.
@@ -29,30 +180,16 @@ class Point(UserDefinedType):
         """
         Returns a method to convert the tuple input to a its SQL string.
         """
-        def process(value):
-            if value is None:
-                return None
-            try:
-                val1, val2 = value
-                if val1 is None or val2 is None:
-                    if val1 is not None or val2 is not None:
-                        raise SQLAlchemyHawqException('Both values must be non-null or no data will be saved for Point({})'.format(value))
-                    return None
-                return str(value)
-            except (ValueError, TypeError):
-                raise SQLAlchemyHawqException('Unexpected input type for Point ({})'.format(value))
-        return process
+        return format_point
 
     def result_processor(self, dialect, coltype):
         """
         Transforms the SQL string into a Python tuple.
         Point((float x),(float y)) -> (float x, float y)
+
+        No processor is needed when the dialect registers the POINT typecaster
+        (use_native_point), since the DBAPI already returns tuples.
         """
-        def process(value):
-            if value is None:
-                return None
-            match = re.match(r'^\((?P<x>\d+(\.\d+)?),(?P<y>\d+(\.\d+)?)\)$', value)
-            if match:
-                return (float(match.group('x')), float(match.group('y')))
-            raise SQLAlchemyHawqException('Failed to get Point value from SQL ({})'.format(value))
-        return process
+        if getattr(dialect, 'use_native_point', False):
+            return None
+        return parse_point
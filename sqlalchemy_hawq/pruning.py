@@ -0,0 +1,340 @@
+'''
+Client-side partition pruning for queries on partitioned tables on the Apache Hawq database
+
+The Hawq planner does not always prune partitions for parameterized predicates,
+and then scans every child table. PartitionPruner evaluates a filter on the
+partition columns against the table's hawq_partition_by instead, to find the
+child tables that can hold matching rows and to query just those.
+'''
+import itertools
+import operator
+
+from sqlalchemy import false, select, union_all
+from sqlalchemy.sql import operators, visitors
+from sqlalchemy.sql.elements import (
+    BinaryExpression,
+    BindParameter,
+    BooleanClauseList,
+    ClauseList,
+    Grouping,
+    Null,
+)
+
+from .partition import RangePartition
+from .routing import PartitionRouter, child_table_name
+
+
+#: comparisons with the column on the right, as the same comparison with the column on the left
+FLIPPED = {
+    operator.eq: operator.eq,
+    operator.ne: operator.ne,
+    operator.lt: operator.gt,
+    operator.le: operator.ge,
+    operator.gt: operator.lt,
+    operator.ge: operator.le,
+}
+
+
+class UnknownValue(Exception):
+    """
+    Raised when a bound value cannot be resolved, so the predicate cannot prune
+    """
+
+
+def bound_value(element, params):
+    '''
+    The value of a bound parameter
+
+    Args:
+        element: the clause element
+        params (dict): values for the parameters without one, by key
+
+    Returns:
+        the value
+
+    Raises:
+        UnknownValue: when the element is not a bound parameter, or it has no value
+    '''
+    if not isinstance(element, BindParameter):
+        raise UnknownValue()
+    if element.key in params:
+        return params[element.key]
+    if element.callable is None and element.value is None:
+        raise UnknownValue()
+    return element.effective_value
+
+
+def bound_values(element, params):
+    '''
+    The values of an IN or BETWEEN list of bound parameters, or of an expanding parameter
+
+    Raises:
+        UnknownValue: when any value cannot be resolved
+    '''
+    if isinstance(element, BindParameter):
+        values = bound_value(element, params)
+        return list(values) if element.expanding else [values]
+    if isinstance(element, (Grouping, ClauseList)):
+        if isinstance(element, Grouping):
+            element = element.element
+        if isinstance(element, ClauseList):
+            return [value for clause in element.clauses for value in bound_values(clause, params)]
+        return bound_values(element, params)
+    raise UnknownValue()
+
+
+class PartitionPruner:
+    """
+    Finds the leaf partitions of a table that a filter expression can match
+
+    Args:
+        table (sqlalchemy.schema.Table): the partitioned table
+        partition_by (Partition, optional): the partition plan, if not the table's
+            hawq_partition_by
+
+    Raises:
+        ValueError: when the table is not partitioned
+    """
+
+    def __init__(self, table, partition_by=None):
+        self.router = PartitionRouter(table, partition_by)
+        self.table = table
+
+    def level_partitions(self, level, column, expression, params):
+        '''
+        Find the partitions at one level that an expression can match
+
+        Args:
+            level (Partition): the (sub)partition level
+            column (Column): the column partitioned on at this level
+            expression: the filter expression
+            params (dict): values for the bound parameters without one, by key
+
+        Returns:
+            set of int: the indexes of the partitions in level.partition_names()
+        '''
+        default = len(level.partition_names()) - 1
+        return {min(index, default) for index in self._level_partitions(level, column, expression, params)}
+
+    def _level_partitions(self, level, column, expression, params):
+        # the default partition of a range level holds the values below start (at
+        # its index), above end (the next index) and NULL (the one after), tracked
+        # apart so that e.g. year >= 2002 AND year < 2006 rules it out
+        default = len(level.partition_names()) - 1
+        ranged = isinstance(level, RangePartition)
+        everything = set(range(default + (3 if ranged else 1)))
+
+        def matching(compare, value):
+            matches = level.matching_partitions(column, compare, value)
+            if ranged and default in matches:
+                matches.discard(default)
+                below = compare in (operator.ne, operator.lt, operator.le) or value < level.start
+                above = compare in (operator.ne, operator.gt, operator.ge) or (
+                    value > level.end if compare is operator.lt else value >= level.end
+                )
+                matches.update(index for index, side in [(default, below), (default + 1, above)] if side)
+            return matches
+
+        if isinstance(expression, Grouping):
+            return self._level_partitions(level, column, expression.element, params)
+        if isinstance(expression, BooleanClauseList):
+            parts = [
+                self._level_partitions(level, column, clause, params)
+                for clause in expression.clauses
+            ]
+            if expression.operator is operators.and_:
+                return set.intersection(everything, *parts)
+            if expression.operator is operators.or_:
+                return set.union(set(), *parts)
+            return everything
+        if not isinstance(expression, BinaryExpression):
+            return everything
+
+        left, right, compare = expression.left, expression.right, expression.operator
+        if not self._column_of(left, column):
+            if not self._column_of(right, column) or compare not in FLIPPED:
+                return everything
+            left, right, compare = right, left, FLIPPED[compare]
+
+        try:
+            if compare is operators.is_ and isinstance(right, Null):
+                return {default + 2 if ranged else default}
+            if compare in FLIPPED:
+                value = bound_value(right, params)
+                if value is None:
+                    return set()  # comparisons with NULL are never true
+                return matching(compare, value)
+            if compare is operators.in_op:
+                return set().union(*[
+                    matching(operator.eq, value)
+                    for value in bound_values(right, params)
+                    if value is not None
+                ])
+            if compare is operators.empty_in_op:
+                return set()
+            if compare is operators.between_op:
+                lower, upper = bound_values(right, params)
+                return matching(operator.ge, lower) & matching(operator.le, upper)
+        except (UnknownValue, TypeError, ValueError):
+            pass
+        return everything
+
+    @staticmethod
+    def _column_of(element, column):
+        return getattr(element, 'name', None) == column.name and column.shares_lineage(element)
+
+    def partitions(self, expression, params=None):
+        '''
+        Find the leaf partitions that can hold rows matching a filter expression.
+        Only the comparisons (=, !=, <, <=, >, >=, IN, BETWEEN, IS NULL) of partition
+        columns with bound values, combined with AND and OR, prune partitions;
+        any other clause can match every partition.
+
+        Args:
+            expression: the filter expression, e.g. table.c.year.between(2010, 2012)
+            params (dict, optional): values for the bound parameters without one, by key
+
+        Returns:
+            list of str: the child table names of the matching leaf partitions
+        '''
+        names = self.router.names
+        return [
+            child_table_name(self.table.name, [names[level][index] for level, index in enumerate(path)])
+            for path in self._matching_paths(expression, params or {})
+        ]
+
+    def _matching_paths(self, expression, params):
+        levels = zip(self.router.levels, self.router.columns)
+        return list(itertools.product(*[
+            sorted(self.level_partitions(level, column, expression, params))
+            for level, column in levels
+        ]))
+
+    def covered_paths(self, expression, params):
+        '''
+        Find the leaf partitions holding only rows that match a filter expression
+
+        Args:
+            expression: the filter expression
+            params (dict): values for the bound parameters without one, by key
+
+        Returns:
+            set of tuple of int: the leaf partitions, as the index of the partition
+            at each level
+        '''
+        if isinstance(expression, Grouping):
+            return self.covered_paths(expression.element, params)
+        if isinstance(expression, BooleanClauseList):
+            parts = [self.covered_paths(clause, params) for clause in expression.clauses]
+            if expression.operator is operators.and_:
+                return set.intersection(*parts) if parts else set()
+            if expression.operator is operators.or_:
+                return set.union(set(), *parts)
+            return set()
+        if not isinstance(expression, BinaryExpression):
+            return set()
+
+        covers = set()
+        levels = enumerate(zip(self.router.levels, self.router.columns, self.router.names))
+        for position, (level, column, names) in levels:
+            left, right, compare = expression.left, expression.right, expression.operator
+            if not self._column_of(left, column):
+                if not self._column_of(right, column) or compare not in FLIPPED:
+                    continue
+                left, right, compare = right, left, FLIPPED[compare]
+            try:
+                if compare in FLIPPED:
+                    value = bound_value(right, params)
+                    indexes = set() if value is None else level.covering_partitions(column, compare, value)
+                elif compare is operators.in_op:
+                    indexes = set().union(*[
+                        level.covering_partitions(column, operator.eq, value)
+                        for value in bound_values(right, params)
+                        if value is not None
+                    ])
+                elif compare is operators.between_op:
+                    lower, upper = bound_values(right, params)
+                    indexes = level.covering_partitions(
+                        column, operator.ge, lower
+                    ) & level.covering_partitions(column, operator.le, upper)
+                else:
+                    continue
+            except (UnknownValue, TypeError, ValueError):
+                continue
+            ranges = [range(len(level_names)) for level_names in self.router.names]
+            ranges[position] = sorted(indexes)
+            covers.update(itertools.product(*ranges))
+        return covers
+
+    def aligned_partitions(self, expression, params=None):
+        '''
+        Find the partitions whose rows are exactly the rows matching a filter
+        expression, so that deleting the matching rows is truncating the partitions
+
+        Args:
+            expression: the filter expression
+            params (dict, optional): values for the bound parameters without one, by key
+
+        Returns:
+            list of tuple of int: the fewest (sub)partitions covering the rows, each as
+            the index of the partition at each level down to it, or None when the
+            expression does not line up with partition boundaries (or matches no rows)
+        '''
+        params = params or {}
+        matches = set(self._matching_paths(expression, params))
+        if not matches or matches != self.covered_paths(expression, params):
+            return None
+        return self._prefixes((), matches)
+
+    def _prefixes(self, prefix, paths):
+        names = self.router.names
+        count = 1
+        for level_names in names[len(prefix):]:
+            count *= len(level_names)
+        below = [path for path in paths if path[:len(prefix)] == prefix]
+        if len(below) == count:
+            return [prefix]
+        if not below:
+            return []
+        return [
+            partition
+            for index in range(len(names[len(prefix)]))
+            for partition in self._prefixes(prefix + (index,), below)
+        ]
+
+    def union_all(self, query, expression=None, params=None):
+        '''
+        Rewrite a query on the partitioned table to read from just the child tables
+        of the leaf partitions that the expression can match. Several child tables are
+        read through a UNION ALL of their rows, aliased as the table, so that the
+        filter, aggregates, grouping, ordering and limits of the query still apply to
+        all the rows at once
+
+        Args:
+            query (sqlalchemy.sql.expression.Select): the query, selecting from the table
+            expression (optional): the filter expression, if not the query's WHERE clause
+            params (dict, optional): values for the bound parameters without one, by key
+
+        Returns:
+            the rewritten query, or the query with WHERE false when no partition can match
+        '''
+        if expression is None:
+            expression = query._whereclause  # pylint: disable=protected-access
+        names = self.partitions(expression, params)
+        if not names:
+            return query.where(false())
+        children = [self.router.child_table(name) for name in names]
+        if len(children) == 1:
+            return self._replace_table(query, children[0])
+        rows = union_all(*[select([child]) for child in children]).alias(self.table.name)
+        return self._replace_table(query, rows)
+
+    def _replace_table(self, query, source):
+        def replace(element):
+            if element is self.table:
+                return source
+            if getattr(element, 'table', None) is self.table:
+                return source.c[element.name]
+            return None
+
+        return visitors.replacement_traverse(query, {}, replace)
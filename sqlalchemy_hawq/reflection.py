@@ -0,0 +1,335 @@
+'''
+Reflection for the slow catalog of the Apache Hawq database
+
+The reflection methods of the dialect are cached per schema, keyed by a cheap
+marker of the schema's catalog state. The marker is read once per Inspector
+(reflection cache), so repeated reflections of an unchanged schema, by any
+connection of the dialect, skip the per-table catalog queries. The cache can
+be persisted to disk to share it across processes and restarts.
+
+Columns and table options can also be reflected for a whole schema at once,
+with one catalog query each, instead of table by table.
+'''
+import atexit
+import copy
+import functools
+import inspect
+import logging
+import os
+import pickle
+import stat
+import tempfile
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import reflection
+
+
+logger = logging.getLogger(__name__)
+
+
+#: a marker of the reflected catalog state of a schema: its tables, views, sequences and
+#: indexes (all in pg_class), columns and their types, column defaults, constraints,
+#: comments and view definitions. Each part is a count and a sum of oids and hashes,
+#: which change with the DDL that changes what reflection returns
+SCHEMA_MARKER_QUERY = text('''
+SELECT count(DISTINCT c.oid), max(c.oid), sum(hashtext(c.relname)::int8),
+    count(a.attnum),
+    sum(a.atttypid::int8 * a.attnum + a.atttypmod + hashtext(a.attname) + a.attnotnull::int
+        + a.atthasdef::int),
+    (SELECT count(*) || ':' || coalesce(sum(hashtext(pg_catalog.pg_get_expr(d.adbin, d.adrelid))::int8), 0)
+        FROM pg_catalog.pg_attrdef d
+        JOIN pg_catalog.pg_class dc ON dc.oid = d.adrelid
+        JOIN pg_catalog.pg_namespace dn ON dn.oid = dc.relnamespace
+        WHERE dn.nspname = :schema),
+    (SELECT count(*) || ':' || coalesce(sum(co.oid::int8 + hashtext(co.conname)), 0)
+        FROM pg_catalog.pg_constraint co
+        JOIN pg_catalog.pg_namespace con ON con.oid = co.connamespace
+        WHERE con.nspname = :schema),
+    (SELECT count(*) || ':' || coalesce(sum(hashtext(ds.description)::int8 + ds.objsubid), 0)
+        FROM pg_catalog.pg_description ds
+        JOIN pg_catalog.pg_class dsc ON dsc.oid = ds.objoid
+        JOIN pg_catalog.pg_namespace dsn ON dsn.oid = dsc.relnamespace
+        WHERE dsn.nspname = :schema),
+    (SELECT count(*) || ':' || coalesce(sum(hashtext(r.ev_action::text)::int8), 0)
+        FROM pg_catalog.pg_rewrite r
+        JOIN pg_catalog.pg_class rc ON rc.oid = r.ev_class
+        JOIN pg_catalog.pg_namespace rn ON rn.oid = rc.relnamespace
+        WHERE rn.nspname = :schema)
+FROM pg_catalog.pg_class c
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+WHERE n.nspname = :schema
+''')
+
+
+def untrusted_file(status):
+    '''
+    Why a file may have been written by another user, if it may
+
+    Args:
+        status (os.stat_result): the status of the file
+
+    Returns:
+        str: the reason, or None when only the current user could have written the file
+    '''
+    if hasattr(os, 'getuid') and status.st_uid != os.getuid():
+        return 'it is owned by another user'
+    if status.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        return 'it is writable by other users'
+    return None
+
+
+class ReflectionCache:
+    """
+    Reflection results by schema, valid for as long as the schema marker is unchanged
+
+    Args:
+        path (str, optional): a file to persist the cache to, loaded on first use and
+            saved by save() and at exit. It is only loaded when it is owned by the
+            current user and not writable by other users, as loading runs pickle
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._schemas = None
+        self._dirty = False
+        if path is not None:
+            atexit.register(self.save)
+
+    def _load(self):
+        self._schemas = {}
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as file:
+                problem = untrusted_file(os.fstat(file.fileno()))
+                if problem is not None:
+                    # unpickling runs code from the file, so only load a file no one else could write
+                    logger.warning('ignoring reflection cache %s: %s', self.path, problem)
+                    return
+                self._schemas = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as err:
+            logger.warning('ignoring unreadable reflection cache %s: %s', self.path, err)
+
+    def _entries(self, schema, marker):
+        if self._schemas is None:
+            self._load()
+        cached_marker, entries = self._schemas.get(schema, (None, None))
+        if cached_marker != marker:
+            entries = {}
+            self._schemas[schema] = (marker, entries)
+        return entries
+
+    def get(self, schema, marker, key):
+        '''
+        Returns:
+            the cached result, or None when it is missing or the marker has changed
+        '''
+        with self._lock:
+            return self._entries(schema, marker).get(key)
+
+    def set(self, schema, marker, key, value):
+        '''
+        Cache a result for the schema at the given marker
+        '''
+        with self._lock:
+            self._entries(schema, marker)[key] = value
+            self._dirty = True
+
+    def clear(self):
+        '''
+        Drop all cached results
+        '''
+        with self._lock:
+            self._schemas = {}
+            self._dirty = True
+
+    def save(self):
+        '''
+        Write the cache to its path, if it has one and has changed
+        '''
+        if self.path is None or not self._dirty:
+            return
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            handle, temporary = tempfile.mkstemp(dir=directory)
+            try:
+                with os.fdopen(handle, 'wb') as file:
+                    pickle.dump(self._schemas, file, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temporary, self.path)
+            except Exception:
+                os.remove(temporary)
+                raise
+            self._dirty = False
+
+
+def schema_marker(dialect, connection, schema, info_cache):
+    '''
+    The catalog marker of a schema, read once per reflection cache
+
+    Args:
+        dialect: the dialect
+        connection (sqlalchemy.engine.Connection): the connection to read the marker with
+        schema (str): the schema
+        info_cache (dict): the reflection cache of the Inspector
+
+    Returns:
+        tuple: the marker
+    '''
+    key = ('hawq_schema_marker', schema)
+    marker = info_cache.get(key)
+    if marker is None:
+        marker = tuple(connection.execute(SCHEMA_MARKER_QUERY, schema=schema).first())
+        info_cache[key] = marker
+    return marker
+
+
+def shared_cache(fn):
+    '''
+    Cache a reflection method of the dialect in its reflection_cache, shared across
+    connections, besides the Inspector's own cache
+
+    Results are only shared when the method is called with an Inspector's info_cache,
+    which the schema marker is read once for. Cached results are copied, so that
+    reflection events cannot alter them.
+    '''
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(self, connection, *args, **kw):
+        info_cache = kw.get('info_cache')
+        if self.reflection_cache is None or info_cache is None:
+            return fn(self, connection, *args, **kw)
+        schema = signature.bind(self, connection, *args, **kw).arguments.get('schema')
+        if schema is None:
+            schema = self.default_schema_name
+        marker = schema_marker(self, connection, schema, info_cache)
+        key = (
+            fn.__name__,
+            tuple(arg for arg in args if isinstance(arg, str)),
+            tuple((name, value) for name, value in sorted(kw.items()) if name != 'info_cache'),
+        )
+        result = self.reflection_cache.get(schema, marker, key)
+        if result is None:
+            result = fn(self, connection, *args, **kw)
+            self.reflection_cache.set(schema, marker, key, result)
+        return copy.deepcopy(result)
+
+    return reflection.cache(wrapper)
+
+
+# whether PGDialect._get_column_info takes the generated argument (sqlalchemy 1.3.16+)
+_COLUMN_INFO_GENERATED = 'generated' in inspect.signature(
+    postgresql.base.PGDialect._get_column_info  # pylint: disable=protected-access
+).parameters
+
+
+#: the columns of all tables and views in a schema
+MULTI_COLUMNS_QUERY = '''
+SELECT c.relname, a.attname,
+    pg_catalog.format_type(a.atttypid, a.atttypmod),
+    (SELECT pg_catalog.pg_get_expr(d.adbin, d.adrelid)
+        FROM pg_catalog.pg_attrdef d
+        WHERE d.adrelid = a.attrelid AND d.adnum = a.attnum AND a.atthasdef) AS default,
+    a.attnotnull, a.attnum, pgd.description AS comment
+FROM pg_catalog.pg_attribute a
+JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_catalog.pg_description pgd ON pgd.objoid = a.attrelid AND pgd.objsubid = a.attnum
+WHERE n.nspname = :schema AND c.relkind IN ('r', 'v', 'm', 'f', 'p') {}
+AND a.attnum > 0 AND NOT a.attisdropped
+ORDER BY c.relname, a.attnum
+'''
+
+#: the storage options and distribution policy of all tables in a schema
+MULTI_TABLE_OPTIONS_QUERY = '''
+SELECT c.relname, c.relstorage, ao.compresstype, ao.compresslevel,
+    p.attrnums, p.bucketnum, t.spcname,
+    array(
+        SELECT a.attnum || ':' || a.attname FROM pg_catalog.pg_attribute a
+        WHERE a.attrelid = c.oid AND a.attnum = ANY (p.attrnums)
+    ) AS distribution_columns
+FROM pg_catalog.pg_class c
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_catalog.pg_appendonly ao ON ao.relid = c.oid
+LEFT JOIN gp_distribution_policy p ON p.localoid = c.oid
+LEFT JOIN pg_catalog.pg_tablespace t ON t.oid = c.reltablespace
+WHERE n.nspname = :schema AND c.relkind = 'r' {}
+'''
+
+#: the storage orientation of each pg_class.relstorage of append-only tables
+ORIENTATIONS = {'a': 'ROW', 'p': 'PARQUET'}
+
+
+def _table_filter(query, table_name):
+    if table_name is None:
+        return text(query.format(''))
+    return text(query.format('AND c.relname = :table_name')).bindparams(table_name=table_name)
+
+
+def multi_columns(dialect, connection, schema, table_name=None):
+    '''
+    Reflect the columns of all tables in a schema with one catalog query
+
+    Args:
+        dialect (HawqDialect): the dialect
+        connection (sqlalchemy.engine.Connection): the connection to query the catalog with
+        schema (str): the schema
+        table_name (str, optional): only reflect this table
+
+    Returns:
+        dict of str to list of dict: the columns, as get_columns returns them, by table name
+    '''
+    rows = connection.execute(_table_filter(MULTI_COLUMNS_QUERY, table_name), schema=schema)
+    domains = dialect._load_domains(connection)  # pylint: disable=protected-access
+    enums = dict(
+        ((rec['name'],), rec) if rec['visible'] else ((rec['schema'], rec['name']), rec)
+        for rec in dialect._load_enums(connection, schema='*')  # pylint: disable=protected-access
+    )
+    columns = {}
+    for relname, name, format_type, default, notnull, _, comment in rows:
+        args = [name, format_type, default, notnull, domains, enums, schema, comment]
+        if _COLUMN_INFO_GENERATED:
+            args.append(None)  # Hawq has no generated columns
+        columns.setdefault(relname, []).append(
+            dialect._get_column_info(*args)  # pylint: disable=protected-access
+        )
+    return columns
+
+
+def _table_options(relstorage, compresstype, compresslevel, attrnums, bucketnum, tablespace, distribution):
+    options = {'hawq_appendonly': relstorage in ORIENTATIONS}
+    if relstorage in ORIENTATIONS:
+        options['hawq_orientation'] = ORIENTATIONS[relstorage]
+    if compresstype:
+        options['hawq_compresstype'] = compresstype.upper()
+        options['hawq_compresslevel'] = compresslevel
+    if attrnums:
+        names = dict(column.split(':', 1) for column in distribution)
+        options['hawq_distributed_by'] = ', '.join(names[str(attnum)] for attnum in attrnums)
+        if bucketnum is not None:
+            options['hawq_bucketnum'] = bucketnum
+    if tablespace is not None and tablespace not in ('pg_default', 'dfs_default'):
+        options['hawq_tablespace'] = tablespace
+    return options
+
+
+def multi_table_options(connection, schema, table_name=None):
+    '''
+    Reflect the Hawq storage options and distribution policy of all tables in a schema,
+    from pg_class, pg_appendonly and gp_distribution_policy, with one catalog query
+
+    Args:
+        connection (sqlalchemy.engine.Connection): the connection to query the catalog with
+        schema (str): the schema
+        table_name (str, optional): only reflect this table
+
+    Returns:
+        dict of str to dict: the hawq_* table arguments, as construct_arguments
+        accepts them, by table name
+    '''
+    rows = connection.execute(_table_filter(MULTI_TABLE_OPTIONS_QUERY, table_name), schema=schema)
+    return {row[0]: _table_options(*row[1:]) for row in rows}
@@ -0,0 +1,430 @@
+'''
+Set-based rewrites of DML that Apache Hawq cannot run in place
+
+Hawq tables are append-only, so rows cannot be updated or deleted. A DELETE whose
+filter lines up with partition boundaries truncates those partitions instead.
+Any other filtered DELETE, and any UPDATE, rewrites the table: the new rows are
+copied into a new table with the same definition, storage options, distribution
+and partitions, in a single pass, and the new table is swapped in for the old one.
+TableRewrite applies several queued UPDATE and DELETE statements with one rewrite.
+'''
+import collections
+
+from sqlalchemy import MetaData, case, cast, false, func, literal, not_, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateTable, Sequence, SetColumnComment, SetTableComment
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.elements import BindParameter, ClauseElement
+from sqlalchemy.sql.expression import Delete, Update
+
+from .pruning import PartitionPruner
+
+
+#: appended to the name of a table for the new table a rewrite swaps in
+SWAP_SUFFIX = '__hawq_swap'
+
+#: the maximum length of an identifier
+MAX_IDENTIFIER_LENGTH = 63
+
+
+def suffixed_name(name, suffix):
+    '''
+    A name with a suffix, shortened to fit in an identifier
+
+    Args:
+        name (str): the name
+        suffix (str): the suffix
+
+    Returns:
+        str: the suffixed name, at most 63 characters long
+    '''
+    return name[:MAX_IDENTIFIER_LENGTH - len(suffix)] + suffix
+
+
+def swap_table_name(table_name):
+    '''
+    Name of the new table a rewrite of a table builds
+
+    Args:
+        table_name (str): the name of the table rewritten
+
+    Returns:
+        str: the name of the new table, at most 63 characters long
+    '''
+    return suffixed_name(table_name, SWAP_SUFFIX)
+
+
+def alter_partition_statement(preparer, table, path, action):
+    '''
+    An ALTER TABLE statement acting on a (sub)partition of a table
+
+    Args:
+        preparer: the identifier preparer of the dialect
+        table (sqlalchemy.schema.Table): the partitioned table
+        path (tuple of int): the index of the partition at each level down to it
+        action (str): the action, e.g. TRUNCATE, followed by the partition clause
+
+    Returns:
+        str: e.g. ALTER TABLE sales ALTER PARTITION FOR (2000) TRUNCATE PARTITION FOR ('e')
+    '''
+    partition_by = table.dialect_options['hawq']['partition_by']
+    levels = [partition_by] + list(partition_by.subpartitions)
+    clauses = [
+        level.partition_for(level.partition_column(table), index)
+        for level, index in zip(levels, path)
+    ]
+    return 'ALTER TABLE {} {}{} {}'.format(
+        preparer.format_table(table),
+        ''.join('ALTER {} '.format(clause) for clause in clauses[:-1]),
+        action,
+        clauses[-1],
+    )
+
+
+def truncate_partition_statements(compiler, table, partitions):
+    '''
+    Statements truncating partitions of a table
+
+    Args:
+        compiler: the compiler of the statement rewritten
+        table (sqlalchemy.schema.Table): the partitioned table
+        partitions (list of tuple of int): the (sub)partitions, from PartitionPruner.aligned_partitions
+
+    Returns:
+        list of str: an ALTER TABLE ... TRUNCATE PARTITION statement per partition,
+        or TRUNCATE TABLE when the partitions cover the table
+    '''
+    if () in partitions:
+        return ['TRUNCATE TABLE {}'.format(compiler.preparer.format_table(table))]
+    return [
+        alter_partition_statement(compiler.preparer, table, path, 'TRUNCATE')
+        for path in partitions
+    ]
+
+
+def string_literal(value):
+    '''
+    Returns:
+        str: a value quoted as an SQL string literal
+    '''
+    return "'{}'".format(value.replace("'", "''"))
+
+
+def view_dependency_check(table_name):
+    '''
+    A statement that fails, naming them, when views depend on a table, which would
+    make the DROP TABLE of its rewrite fail only after the copy of its rows
+
+    Args:
+        table_name (str): the formatted name of the table
+
+    Returns:
+        str: a SELECT that returns no rows when no view depends on the table
+    '''
+    literal = string_literal(table_name)
+    return (
+        "SELECT CAST('cannot rewrite ' || {0} || ', views depend on it: ' "
+        "|| array_to_string(t.views, ', ') AS INTEGER)\n"
+        'FROM (SELECT ARRAY(SELECT DISTINCT v.relname::text FROM pg_catalog.pg_depend d\n'
+        'JOIN pg_catalog.pg_rewrite r ON r.oid = d.objid\n'
+        'JOIN pg_catalog.pg_class v ON v.oid = r.ev_class\n'
+        "WHERE d.classid = 'pg_catalog.pg_rewrite'::regclass AND d.refobjid = {0}::regclass\n"
+        'AND v.oid <> d.refobjid) AS views) AS t\n'
+        'WHERE array_upper(t.views, 1) > 0'
+    ).format(literal)
+
+
+def rewrite_statements(compiler, table, query):
+    '''
+    Statements replacing the rows of a table with the rows of a query on it
+
+    The query's rows are inserted into a new table created from the Table, so with
+    its columns, nullability, defaults and constraints, its storage options (WITH
+    clause and tablespace), distribution and partitions, and its prefixes and ON
+    COMMIT action, e.g. of a temporary table. The sequence of a SERIAL column of the
+    new table is set to continue after the rows copied. The new table then replaces the
+    table. The rewrite first checks that no view depends on the table, and the new
+    table gets the table and column comments of the Table. Grants and the owner of
+    the table are not kept. The query is kept as the compiler's hawq_rewrite_query, so
+    that its cost can be estimated without running the rewrite.
+
+    Args:
+        compiler: the compiler of the statement rewritten
+        table (sqlalchemy.schema.Table): the table rewritten
+        query (str): the SELECT producing the new rows, in the order of the table's columns
+
+    Returns:
+        list of str: the statements
+    '''
+    preparer = compiler.preparer
+    swap_name = swap_table_name(table.name)
+    swap = preparer.quote(swap_name)
+    if table.schema is not None:
+        swap = '{}.{}'.format(preparer.quote_schema(table.schema), swap)
+
+    table_name = preparer.format_table(table)
+    compiler.hawq_rewrite_query = query
+    swap_table = table.tometadata(MetaData(), name=swap_name)
+    swap_table._prefixes = list(table._prefixes)  # pylint: disable=protected-access
+    create = compiler.dialect.ddl_compiler(compiler.dialect, CreateTable(swap_table)).string
+    statements = [
+        view_dependency_check(table_name),
+        create.strip(),
+        'INSERT INTO {} {}'.format(swap, query),
+    ]
+    serial = swap_table._autoincrement_column  # pylint: disable=protected-access
+    if serial is not None and (
+        serial.default is None or (isinstance(serial.default, Sequence) and serial.default.optional)
+    ):
+        # the SERIAL column of the new table has a new sequence, which must continue after the rows copied
+        statements.append(
+            "SELECT setval(pg_get_serial_sequence({}, {}), coalesce(max({}), 0) + 1, false) FROM {}".format(
+                string_literal(swap), string_literal(serial.name), preparer.quote(serial.name), swap
+            )
+        )
+
+    comments = [SetTableComment(swap_table)] if swap_table.comment is not None else []
+    comments.extend(SetColumnComment(column) for column in swap_table.columns if column.comment is not None)
+    statements.extend(compiler.dialect.ddl_compiler(compiler.dialect, comment).string for comment in comments)
+    statements.extend([
+        'DROP TABLE {}'.format(table_name),
+        'ALTER TABLE {} RENAME TO {}'.format(swap, preparer.quote(table.name)),
+    ])
+    return statements
+
+
+def fixed_values(compiler, expression, kwargs):
+    '''
+    Whether the bound values of an expression are known when it is compiled and
+    cannot change when the statement is executed, so that partitions can be picked
+    from them. The value of a bound parameter is replaced by the execution parameter
+    of its key, and those keys are the compiler's column_keys (they are part of the
+    key of the compiled cache too). Values from a callable are only known then.
+
+    Args:
+        compiler: the compiler of the statement
+        expression: the expression
+        kwargs (dict): the compile arguments
+
+    Returns:
+        bool: True when the bound values are fixed
+    '''
+    if kwargs.get('literal_binds'):
+        return True
+    keys = set(compiler.column_keys or ())
+    return all(
+        bind.key not in keys and bind.callable is None
+        for bind in visitors.iterate(expression, {})
+        if isinstance(bind, BindParameter)
+    )
+
+
+def delete_statements(compiler, element, **kwargs):
+    '''
+    Statements deleting the rows matching the filter of a DELETE
+
+    Args:
+        compiler: the compiler of the DELETE
+        element (sqlalchemy.sql.expression.Delete): the DELETE
+
+    Returns:
+        list of str: TRUNCATE TABLE when there is no filter, ALTER TABLE ... TRUNCATE
+        PARTITION when the filter lines up with partition boundaries, for values that
+        cannot change at execution, and otherwise
+        a rewrite of the table keeping the rows the filter is not true for
+    '''
+    table = element.table
+    table_name = compiler.process(table, asfrom=True, **kwargs)
+    whereclause = element._whereclause  # pylint: disable=protected-access
+    if whereclause is None:
+        return ['TRUNCATE TABLE {}'.format(table_name)]
+
+    if table.dialect_options['hawq']['partition_by'] is not None and fixed_values(compiler, whereclause, kwargs):
+        partitions = PartitionPruner(table).aligned_partitions(whereclause)
+        if partitions is not None:
+            return truncate_partition_statements(compiler, table, partitions)
+
+    query = 'SELECT * FROM {} WHERE NOT coalesce(({}), false)'.format(
+        table_name, compiler.process(whereclause, **kwargs)
+    )
+    return rewrite_statements(compiler, table, query)
+
+
+def update_values(table, statement, column_keys=None):
+    '''
+    The new values of the columns an UPDATE sets
+
+    Args:
+        table (sqlalchemy.schema.Table): the table updated
+        statement (sqlalchemy.sql.expression.Update): the UPDATE
+        column_keys (list of str, optional): the keys of the parameters the statement
+            is executed with, which set the columns of the same keys, as for any UPDATE
+
+    Returns:
+        collections.OrderedDict: the value expressions by column key
+
+    Raises:
+        ValueError: when the statement sets a column the table does not have
+    '''
+    values = collections.OrderedDict()
+    for key in column_keys or ():
+        if key in table.c:
+            values[key] = BindParameter(key, type_=table.c[key].type, required=True)
+    for key, value in (statement.parameters or {}).items():
+        key = getattr(key, 'key', key)
+        if key not in table.c:
+            raise ValueError('Column ({}) to update not found in table ({})'.format(key, table.name))
+        if key in values:
+            continue  # execution parameters take precedence, as for any UPDATE
+        if not isinstance(value, ClauseElement):
+            value = literal(value, type_=table.c[key].type)
+        values[key] = value
+    return values
+
+
+def rewrite_query(table, statements, column_keys=None):
+    '''
+    The SELECT producing the rows of a table after UPDATE and DELETE statements on it,
+    applied in order. Each statement after the first selects from the one before,
+    which the database pipelines into a single scan of the table.
+
+    Args:
+        table (sqlalchemy.schema.Table): the table
+        statements (list): the UPDATE and DELETE statements on the table
+        column_keys (list of str, optional): the keys of the parameters the statements
+            are executed with
+
+    Returns:
+        sqlalchemy.sql.expression.Select: the query, with the columns of the table in order
+    '''
+    query = None
+    for statement in statements:
+        source = table if query is None else query.alias()
+
+        def rebind(element, source=source):
+            if source is table:
+                return element
+            return visitors.replacement_traverse(
+                element,
+                {},
+                lambda column: source.c[column.name] if getattr(column, 'table', None) is table else None,
+            )
+
+        matches = statement._whereclause  # pylint: disable=protected-access
+        if matches is not None:
+            matches = func.coalesce(rebind(matches), false())
+        current = [source.c[column.name] for column in table.columns]
+
+        if isinstance(statement, Delete):
+            query = select(current).select_from(source)
+            query = query.where(false() if matches is None else not_(matches))
+            continue
+
+        values = update_values(table, statement, column_keys)
+        columns = []
+        for column, current_value in zip(table.columns, current):
+            if column.key not in values:
+                columns.append(current_value)
+                continue
+            # cast, so that the rewritten table keeps the types of the columns
+            value = cast(rebind(values[column.key]), column.type)
+            if matches is not None:
+                value = case([(matches, value)], else_=current_value)
+            columns.append(value.label(column.name))
+        query = select(columns).select_from(source)
+    return query
+
+
+def update_statements(compiler, element, **kwargs):
+    '''
+    Statements applying an UPDATE by a rewrite of the table, which replaces the
+    values of the updated columns with CASE WHEN (filter) THEN (new value) ELSE
+    (column) END
+
+    Args:
+        compiler: the compiler of the UPDATE
+        element (sqlalchemy.sql.expression.Update): the UPDATE
+
+    Returns:
+        list of str: the statements
+    '''
+    query = rewrite_query(element.table, [element], compiler.column_keys)
+    return rewrite_statements(compiler, element.table, compiler.process(query, **kwargs))
+
+
+class TableRewrite(Executable, ClauseElement):
+    """
+    UPDATE and DELETE statements on a table, queued to be applied in order by a
+    single rewrite of the table when executed
+
+    Args:
+        table (sqlalchemy.schema.Table): the table
+        statements (list, optional): UPDATE and DELETE statements to queue
+    """
+
+    __visit_name__ = 'hawq_table_rewrite'
+    _execution_options = Executable._execution_options.union({'autocommit': True})
+
+    def __init__(self, table, statements=()):
+        self.table = table
+        self.statements = []
+        for statement in statements:
+            self.add(statement)
+
+    def add(self, statement):
+        '''
+        Queue an UPDATE or DELETE statement
+
+        Args:
+            statement: the statement, e.g. table.update().where(...).values(...)
+
+        Returns:
+            TableRewrite: this rewrite
+
+        Raises:
+            ValueError: when the statement is not an UPDATE or DELETE of the table
+        '''
+        if not isinstance(statement, (Update, Delete)) or statement.table is not self.table:
+            raise ValueError('only UPDATE and DELETE statements of ({}) can be queued'.format(
+                self.table.name
+            ))
+        self.statements.append(statement)
+        return self
+
+
+@compiles(TableRewrite, 'hawq')
+def visit_table_rewrite(element, compiler, **kwargs):
+    '''
+    Compile the queued statements of a TableRewrite into one rewrite of the table
+    '''
+    if not element.statements:
+        raise ValueError('no statements queued to rewrite ({})'.format(element.table.name))
+    query = rewrite_query(element.table, element.statements)
+    return ';\n'.join(rewrite_statements(compiler, element.table, compiler.process(query, **kwargs)))
+
+
+class TableReplace(Executable, ClauseElement):
+    """
+    Replaces the rows of a table with the rows of a query, by one rewrite of the table
+
+    Args:
+        table (sqlalchemy.schema.Table): the table
+        query: the SELECT (or UNION) producing the new rows, in the order of the table's columns
+    """
+
+    __visit_name__ = 'hawq_table_replace'
+    _execution_options = Executable._execution_options.union({'autocommit': True})
+
+    def __init__(self, table, query):
+        self.table = table
+        self.query = query
+
+
+@compiles(TableReplace, 'hawq')
+def visit_table_replace(element, compiler, **kwargs):
+    '''
+    Compile a TableReplace into the statements of a rewrite of the table
+    '''
+    query = compiler.process(element.query, **kwargs)
+    return ';\n'.join(rewrite_statements(compiler, element.table, query))
@@ -0,0 +1,199 @@
+'''
+Client-side partition routing for inserts into partitioned tables on the Apache Hawq database
+
+Inserting through the root of a partitioned table makes the master route every
+row. PartitionRouter evaluates the table's hawq_partition_by in Python instead,
+buckets the rows by leaf partition and loads each bucket straight into its
+child table. Bucketing is vectorized with numpy when it is installed.
+'''
+import logging
+import operator
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from sqlalchemy import MetaData, Table
+
+
+logger = logging.getLogger(__name__)
+
+
+def child_table_name(table_name, partition_names):
+    '''
+    Name of the child table of a (sub)partition, as HAWQ generates it
+
+    Args:
+        table_name (str): the name of the partitioned (root) table
+        partition_names (list of str): the partition name at each level, from the top
+
+    Returns:
+        str: the child table name, e.g. sales_1_prt_2_2_prt_extra
+    '''
+    return table_name + ''.join(
+        '_{}_prt_{}'.format(level, name) for level, name in enumerate(partition_names, 1)
+    )
+
+
+def column_values(rows, name):
+    '''
+    Extract one column from rows, with None for the rows that omit it
+
+    Args:
+        rows (list of dict): the rows, keyed by column name
+        name (str): the column name
+
+    Returns:
+        list: the values of the column
+    '''
+    try:
+        return list(map(operator.itemgetter(name), rows))
+    except KeyError:
+        return [row.get(name) for row in rows]
+
+
+class PartitionRouter:
+    """
+    Routes rows to the leaf partitions of a table partitioned with hawq_partition_by
+
+    Args:
+        table (sqlalchemy.schema.Table): the partitioned table
+        partition_by (Partition, optional): the partition plan, if not the table's
+            hawq_partition_by
+
+    Raises:
+        ValueError: when the table is not partitioned
+    """
+
+    def __init__(self, table, partition_by=None):
+        if partition_by is None:
+            partition_by = table.dialect_options['hawq']['partition_by']
+        if partition_by is None:
+            raise ValueError('Table ({}) is not partitioned'.format(table.name))
+        self.table = table
+        self.levels = [partition_by] + list(partition_by.subpartitions)
+        self.columns = [level.partition_column(table) for level in self.levels]
+        self.names = [level.partition_names() for level in self.levels]
+        self.leaf_count = 1
+        for names in self.names:
+            self.leaf_count *= len(names)
+        self._children = {}
+
+    def leaf_indexes(self, rows):
+        '''
+        Locate the leaf partition of each row
+
+        Args:
+            rows (list of dict): the rows, keyed by column name
+
+        Returns:
+            list or numpy array of int: the index of each row's leaf partition,
+            in the order of leaf_names()
+        '''
+        indexes = 0
+        for level, column, names in zip(self.levels, self.columns, self.names):
+            values = column_values(rows, column.name)
+            level_indexes = level.partition_indexes(column, values)
+            if numpy is not None:
+                indexes = indexes * len(names) + numpy.asarray(level_indexes, dtype=int)
+            elif isinstance(indexes, int):
+                indexes = list(level_indexes)
+            else:
+                indexes = [
+                    index * len(names) + level_index
+                    for index, level_index in zip(indexes, level_indexes)
+                ]
+        return indexes
+
+    def leaf_name(self, index):
+        '''
+        Name of the child table of a leaf partition
+
+        Args:
+            index (int): the index of the leaf partition, from leaf_indexes()
+
+        Returns:
+            str: the child table name
+        '''
+        path = []
+        for names in reversed(self.names):
+            index, position = divmod(int(index), len(names))
+            path.append(names[position])
+        return child_table_name(self.table.name, reversed(path))
+
+    def leaf_names(self):
+        '''
+        Returns:
+            list of str: the child table names of all leaf partitions, defaults included
+        '''
+        return [self.leaf_name(index) for index in range(self.leaf_count)]
+
+    def child_table(self, name):
+        '''
+        A Table for a child partition, with copies of the columns of the partitioned
+        table, so their keys, defaults and onupdate apply to rows inserted through it
+
+        Args:
+            name (str): the child table name
+
+        Returns:
+            sqlalchemy.schema.Table: the child table
+        '''
+        if name not in self._children:
+            self._children[name] = Table(
+                name,
+                MetaData(),
+                *[column.copy() for column in self.table.columns],
+                schema=self.table.schema
+            )
+        return self._children[name]
+
+    def bucket(self, rows):
+        '''
+        Group rows by leaf partition. Rows outside the partitions at any level
+        go to the default partition of that level.
+
+        Args:
+            rows (list of dict): the rows, keyed by column name
+
+        Returns:
+            dict of str to list of dict: the rows by child table name
+        '''
+        if not rows:
+            return {}
+        indexes = self.leaf_indexes(rows)
+        if numpy is None:
+            buckets = {}
+            for index, row in zip(indexes, rows):
+                buckets.setdefault(index, []).append(row)
+            return {self.leaf_name(index): bucket for index, bucket in buckets.items()}
+
+        if self.leaf_count <= numpy.iinfo('uint16').max:
+            # numpy sorts 16-bit integers with a radix sort
+            indexes = indexes.astype('uint16')
+        order = numpy.argsort(indexes, kind='stable')
+        boundaries = numpy.flatnonzero(numpy.diff(indexes[order])) + 1
+        return {
+            self.leaf_name(indexes[group[0]]): list(map(rows.__getitem__, group.tolist()))
+            for group in numpy.split(order, boundaries)
+        }
+
+    def insert(self, connection, rows):
+        '''
+        Insert rows directly into the child tables of their leaf partitions,
+        one executemany (or COPY, with copy_executemany) per child table
+
+        Args:
+            connection (sqlalchemy.engine.Connection): the connection to insert with
+            rows (list of dict): the rows, keyed by column name
+
+        Returns:
+            dict of str to int: the number of rows inserted, by child table name
+        '''
+        counts = {}
+        for name, bucket in self.bucket(rows).items():
+            connection.execute(self.child_table(name).insert(), bucket)
+            counts[name] = len(bucket)
+        logger.debug('routed %d rows into %d partitions of %s', len(rows), len(counts), self.table.name)
+        return counts
@@ -0,0 +1,321 @@
+'''
+Per-statement timing and statistics for the Apache Hawq database
+
+HawqStatsCollector listens to the cursor execution events of an engine. It
+aggregates the latency, row counts and bytes transferred of each statement by its
+fingerprint: the statement with its literals and parameters replaced by ?, and
+lists of them collapsed. It also counts DDL, TRUNCATE and COPY separately, since
+those are the heaviest on the master.
+
+The fingerprint of each distinct statement text is memoized, so the overhead
+per execution is two clock reads, a dict lookup and the update of one entry.
+'''
+import bisect
+import re
+import threading
+import time
+
+from sqlalchemy import event
+
+
+#: the upper bounds, in seconds, of the latency histogram buckets. The last bucket is unbounded
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+#: the most distinct fingerprints kept. Further fingerprints are aggregated under OTHER
+MAX_FINGERPRINTS = 1000
+
+#: the fingerprint under which statements past MAX_FINGERPRINTS are aggregated
+OTHER = '<other>'
+
+#: the most distinct statement texts whose fingerprint and kind are memoized
+MAX_MEMOIZED = 10000
+
+#: the statement kinds counted separately
+KINDS = ('ddl', 'truncate', 'copy')
+
+FINGERPRINT_PATTERNS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),  # string literals
+    (re.compile(r'\$\$.*?\$\$', re.DOTALL), '?'),  # dollar quoted string literals
+    (re.compile(r'%\(\w+\)s|%s'), '?'),  # psycopg2 parameters
+    (re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b', re.IGNORECASE), '?'),  # numbers
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r'\?(?: ?, ?\?)+'), '?'),  # IN lists and rows of values
+    (re.compile(r'\(\?\)(?: ?, ?\(\?\))+'), '(?)'),  # multi-row VALUES
+]
+
+TRUNCATE_STATEMENT = re.compile(
+    r'^\s*(TRUNCATE\b|ALTER\s+TABLE\b.*\bTRUNCATE\s+PARTITION\b)', re.IGNORECASE | re.DOTALL
+)
+
+DDL_STATEMENT = re.compile(r'^\s*(ALTER|CREATE|DROP|COMMENT|GRANT|REVOKE)\b', re.IGNORECASE)
+
+
+def fingerprint(statement):
+    '''
+    Normalize a statement, so that executions differing only in their literals
+    or parameters, or the length of their IN lists and VALUES, are aggregated
+
+    Args:
+        statement (str): the SQL statement
+
+    Returns:
+        str: the fingerprint of the statement
+    '''
+    for pattern, replacement in FINGERPRINT_PATTERNS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def statement_kind(statement):
+    '''
+    Returns:
+        str: 'truncate', 'ddl' or None, for the counters of a statement. COPY is
+        recognized from how the statement was executed instead
+    '''
+    if TRUNCATE_STATEMENT.match(statement):
+        return 'truncate'
+    if DDL_STATEMENT.match(statement):
+        return 'ddl'
+    return None
+
+
+def sent_bytes(cursor, statement, parameters=None):
+    '''
+    The bytes of a statement sent to the server
+
+    psycopg2 keeps the last statement it sent, with its parameters rendered in, as
+    cursor.query. Without it, the statement is measured as UTF-8.
+
+    Args:
+        cursor: the DBAPI cursor the statement was executed on
+        statement (str): the statement
+        parameters (list, optional): the parameter sets of an executemany
+
+    Returns:
+        int: the bytes sent, estimated from the last parameter set for an executemany
+    '''
+    query = getattr(cursor, 'query', None)
+    sent = len(query) if query is not None else len(statement.encode('utf8'))
+    return sent * len(parameters) if parameters is not None else sent
+
+
+class StatementStats:
+    """
+    The aggregated executions of a statement fingerprint, or of a statement kind
+
+    Attributes:
+        count (int): the executions
+        errors (int): the executions that raised
+        seconds (float): the total latency
+        min_seconds (float): the lowest latency
+        max_seconds (float): the highest latency
+        rows (int): the rows reported by the DBAPI, where it knows them
+        bytes_sent (int): the bytes sent: the statement as encoded by the DBAPI, with its
+            parameters, or the data of a COPY ... FROM STDIN. For an executemany run
+            through the DBAPI's own executemany, it is estimated from the last
+            parameter set, as psycopg2 only keeps the last statement it sent
+        bytes_received (int): the bytes received, where they are known: the data of a
+            COPY ... TO STDOUT. Result sets fetched through the DBAPI are not counted
+        histogram (list of int): the executions by latency bucket, see LATENCY_BUCKETS
+    """
+
+    __slots__ = (
+        'count',
+        'errors',
+        'seconds',
+        'min_seconds',
+        'max_seconds',
+        'rows',
+        'bytes_sent',
+        'bytes_received',
+        'histogram',
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.min_seconds = None
+        self.max_seconds = None
+        self.rows = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, seconds, rows, sent, received=0):
+        self.count += 1
+        self.seconds += seconds
+        if self.min_seconds is None or seconds < self.min_seconds:
+            self.min_seconds = seconds
+        if self.max_seconds is None or seconds > self.max_seconds:
+            self.max_seconds = seconds
+        if rows > 0:
+            self.rows += rows
+        self.bytes_sent += sent
+        self.bytes_received += received
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def as_dict(self):
+        '''
+        Returns:
+            dict: the statistics, with the mean latency
+        '''
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'seconds': self.seconds,
+            'mean_seconds': self.seconds / self.count if self.count else None,
+            'min_seconds': self.min_seconds,
+            'max_seconds': self.max_seconds,
+            'rows': self.rows,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'histogram': list(self.histogram),
+        }
+
+
+class HawqStatsCollector:
+    """
+    Collects per-statement timing and statistics from the engines it is attached to
+
+    Pass it to create_engine as stats_collector to attach it to the engine, or call
+    attach() on an existing engine. One collector can be attached to several engines.
+
+    Args:
+        max_fingerprints (int): the most distinct fingerprints kept, beyond which
+            statements are aggregated under OTHER
+    """
+
+    def __init__(self, max_fingerprints=MAX_FINGERPRINTS):
+        self.max_fingerprints = max_fingerprints
+        self._lock = threading.Lock()
+        self._descriptions = {}
+        self._statements = {}
+        self._kinds = {kind: StatementStats() for kind in KINDS}
+
+    def attach(self, engine):
+        '''
+        Listen to the cursor executions of an engine
+        '''
+        event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+        event.listen(engine, 'handle_error', self.handle_error)
+
+    def detach(self, engine):
+        '''
+        Stop listening to the cursor executions of an engine
+        '''
+        event.remove(engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.remove(engine, 'after_cursor_execute', self.after_cursor_execute)
+        event.remove(engine, 'handle_error', self.handle_error)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument,too-many-arguments
+        if context is not None:
+            context.hawq_stats_start = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument,too-many-arguments
+        start = getattr(context, 'hawq_stats_start', None)
+        if start is None:
+            return
+        seconds = time.perf_counter() - start
+        stream = getattr(context, 'hawq_copy_stream', None)
+        if stream is not None:
+            self.record(statement, seconds, stream.rows, stream.bytes, kind='copy')
+            return
+        key, kind = self._describe(statement)
+        if kind is None and context.isddl:
+            kind = 'ddl'
+        sent = getattr(context, 'hawq_bytes_sent', None)
+        if sent is None:
+            sent = sent_bytes(cursor, statement, parameters if executemany else None)
+        with self._lock:
+            self._entry(key).add(seconds, cursor.rowcount, sent)
+            if kind is not None:
+                self._kinds[kind].add(seconds, cursor.rowcount, sent)
+
+    def handle_error(self, exception_context):
+        context = exception_context.execution_context
+        statement = exception_context.statement
+        if statement is None or getattr(context, 'hawq_stats_start', None) is None:
+            return
+        key, _ = self._describe(statement)
+        with self._lock:
+            self._entry(key).errors += 1
+
+    def record(self, statement, seconds, rows=0, sent=0, kind=None, received=0):  # pylint: disable=too-many-arguments
+        '''
+        Record an execution of a statement, including those run on a raw cursor,
+        such as COPY ... TO STDOUT
+
+        Args:
+            statement (str): the statement
+            seconds (float): its latency
+            rows (int): the rows written or read, or -1 when not known
+            sent (int): the bytes sent
+            kind (str, optional): 'ddl', 'truncate' or 'copy', to also count it as such
+            received (int): the bytes received
+        '''
+        key, _ = self._describe(statement)
+        with self._lock:
+            self._entry(key).add(seconds, rows, sent, received)
+            if kind is not None:
+                self._kinds[kind].add(seconds, rows, sent, received)
+
+    def _describe(self, statement):
+        description = self._descriptions.get(statement)
+        if description is None:
+            description = (fingerprint(statement), statement_kind(statement))
+            if len(self._descriptions) >= MAX_MEMOIZED:
+                self._descriptions.clear()
+            self._descriptions[statement] = description
+        return description
+
+    def _entry(self, key):
+        stats = self._statements.get(key)
+        if stats is None:
+            if len(self._statements) >= self.max_fingerprints:
+                key = OTHER
+            stats = self._statements.setdefault(key, StatementStats())
+        return stats
+
+    def snapshot(self, reset=False):
+        '''
+        The statistics collected so far
+
+        Args:
+            reset (bool): also reset them, atomically
+
+        Returns:
+            dict: 'statements', the statistics by fingerprint, 'kinds', the statistics
+            of DDL, TRUNCATE and COPY, and 'buckets', the upper bounds of the
+            histogram buckets
+        '''
+        with self._lock:
+            snapshot = {
+                'statements': {key: stats.as_dict() for key, stats in self._statements.items()},
+                'kinds': {kind: stats.as_dict() for kind, stats in self._kinds.items()},
+                'buckets': list(LATENCY_BUCKETS),
+            }
+            if reset:
+                self._reset()
+        return snapshot
+
+    def top(self, limit=10, by='seconds'):
+        '''
+        Returns:
+            list of tuple: the (fingerprint, statistics) of the statements that took
+            the most of a statistic, the total latency by default
+        '''
+        statements = self.snapshot()['statements']
+        return sorted(statements.items(), key=lambda item: item[1][by] or 0, reverse=True)[:limit]
+
+    def reset(self):
+        '''
+        Drop the statistics collected so far
+        '''
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self._statements = {}
+        self._kinds = {kind: StatementStats() for kind in KINDS}
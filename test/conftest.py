@@ -43,6 +43,19 @@ def pytest_addoption(parser):
         default=False,
         help="run only the tests that don't require a live connection",
     )
+    parser.addoption(
+        "--benchmark-update",
+        action="store_true",
+        default=False,
+        help="record the offline benchmark results as the new baselines instead of checking them",
+    )
+    parser.addoption(
+        "--benchmark-threshold",
+        type=float,
+        default=None,
+        help="check the offline benchmarks, failing those slower than their baseline by more than "
+        "this (0.5 is 50%%). Without it or --benchmark-update, the benchmarks are not timed",
+    )
     pytestplugin.pytest_addoption(parser)
 
 
@@ -0,0 +1,196 @@
+"""
+Benchmarks of the dialect's hot paths, without connecting to live db.
+
+Each benchmark is timed relative to a fixed pure Python calibration workload
+measured in the same run, so the baselines hold across machines of different
+speeds. The benchmarks are only timed when --benchmark-threshold is given, so
+that the default run does not fail on a loaded machine: a benchmark then fails
+when it is slower than its baseline in benchmark_baselines.json by more than the
+threshold. Run with --benchmark-update to record new baselines after an intended
+change.
+"""
+from collections import OrderedDict
+import json
+import os
+import statistics
+import timeit
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, Text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.testing.plugin import plugin_base
+from sqlalchemy.testing.suite import fixtures
+
+from sqlalchemy_hawq.ddl import with_clause
+from sqlalchemy_hawq.dialect import HawqDialect
+from sqlalchemy_hawq.partition import (
+    ListPartition,
+    ListSubpartition,
+    RangeSubpartition,
+    format_partition_value,
+)
+from sqlalchemy_hawq.point import Point
+from sqlalchemy_hawq.stats import HawqStatsCollector
+
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), 'benchmark_baselines.json')
+
+#: runs of each workload, of which the fastest is kept
+REPEAT = 5
+
+#: measurements of a benchmark before it is reported as regressed, to ride out noise,
+#: and of which the median is recorded as its baseline
+ATTEMPTS = 5
+
+
+def calibration():
+    values = {}
+    for i in range(2000):
+        values['key{}'.format(i)] = str(i * i)
+    return ','.join(sorted(values.values()))
+
+
+def best_time(workload, number):
+    return min(timeit.repeat(workload, number=number, repeat=REPEAT)) / number
+
+
+def load_baselines():
+    if not os.path.exists(BASELINES_PATH):
+        return {}
+    with open(BASELINES_PATH) as file:
+        return json.load(file)['benchmarks']
+
+
+def save_baseline(name, cost):
+    baselines = load_baselines()
+    baselines[name] = round(cost, 4)
+    with open(BASELINES_PATH, 'w') as file:
+        json.dump({'benchmarks': dict(sorted(baselines.items()))}, file, indent=4)
+        file.write('\n')
+
+
+def check_benchmark(name, workload, number=10):
+    '''
+    Time a workload relative to the calibration workload and compare the relative
+    cost with its baseline
+    '''
+    workload()  # warm up caches of compiled constructs, as a running application has them
+    update = getattr(plugin_base.options, 'benchmark_update', False)
+    threshold = getattr(plugin_base.options, 'benchmark_threshold', None)
+    if not update and threshold is None:
+        pytest.skip('benchmarks are only timed with --benchmark-threshold or --benchmark-update')
+    baseline = load_baselines().get(name)
+    assert update or baseline is not None, (
+        'no baseline for the benchmark ({}), run with --benchmark-update'.format(name)
+    )
+    costs = []
+    for _ in range(ATTEMPTS):
+        # the calibration is timed next to the workload, so both see the same machine load
+        costs.append(best_time(workload, number) / best_time(calibration, 20))
+        if not update and min(costs) <= baseline * (1 + threshold):
+            return
+    if update:
+        save_baseline(name, statistics.median(costs))  # a typical cost, not the luckiest
+        return
+    cost = min(costs)
+    assert cost <= baseline * (1 + threshold), (
+        'benchmark ({}) costs {:.3f} calibration runs, more than {:.0%} over its baseline ({:.3f})'.format(
+            name, cost, threshold, baseline
+        )
+    )
+
+
+def get_wide_table():
+    return Table(
+        'wide',
+        MetaData(),
+        *[Column('column_{}'.format(i), Integer if i % 2 else Text) for i in range(200)],
+        hawq_appendonly=True,
+        hawq_orientation='parquet',
+        hawq_distributed_by='column_1'
+    )
+
+
+def get_partitioned_table():
+    chromosomes = OrderedDict(('chr{}'.format(i), 'chr{}'.format(i)) for i in range(1, 1001))
+    strands = OrderedDict([('forward', '+'), ('reverse', '-')])
+    return Table(
+        'partitioned',
+        MetaData(),
+        Column('id', Integer),
+        Column('chrom', Text),
+        Column('pos', Integer),
+        Column('strand', Text),
+        hawq_appendonly=True,
+        hawq_partition_by=ListPartition(
+            'chrom',
+            chromosomes,
+            [RangeSubpartition('pos', 0, 250000000, 10000000), ListSubpartition('strand', strands)],
+        ),
+    )
+
+
+class TestBenchmarks(fixtures.TestBase):
+    def test_wide_table_ddl(self):
+        table, dialect = get_wide_table(), HawqDialect()
+        check_benchmark('wide_table_ddl', lambda: str(CreateTable(table).compile(dialect=dialect)))
+
+    def test_partitioned_table_ddl(self):
+        table, dialect = get_partitioned_table(), HawqDialect(ddl_compile_cache=False)
+        check_benchmark('partitioned_table_ddl', lambda: str(CreateTable(table).compile(dialect=dialect)))
+
+    def test_with_clause(self):
+        options = dict(
+            appendonly=True,
+            orientation='parquet',
+            compresstype='SNAPPY',
+            compresslevel=None,
+            bucketnum=8,
+            distributed_by='id',
+        )
+        check_benchmark('with_clause', lambda: [with_clause(options) for _ in range(1000)])
+
+    def test_format_partition_value(self):
+        values = [
+            (postgresql.INTEGER(), '1'),
+            (postgresql.TEXT(), 'chr1'),
+            (postgresql.TEXT(), "it's"),
+            (postgresql.BOOLEAN(), 't'),
+        ] * 250
+        check_benchmark(
+            'format_partition_value', lambda: [format_partition_value(type_, value) for type_, value in values]
+        )
+
+    def test_point_bind(self):
+        bind = Point().bind_processor(HawqDialect())
+        points = [(i * 0.5, i * 0.25) for i in range(1000)]
+        check_benchmark('point_bind', lambda: [bind(point) for point in points])
+
+    def test_point_result(self):
+        result = Point().result_processor(HawqDialect(use_native_point=False), None)
+        wire = ['({!r},{!r})'.format(i * 0.5, i * 0.25) for i in range(1000)]
+        check_benchmark('point_result', lambda: [result(value) for value in wire])
+
+    def test_stats_collector(self):
+        collector = HawqStatsCollector()
+
+        class Context:
+            isddl = False
+
+        class Cursor:
+            rowcount = 1
+
+        statements = ['SELECT * FROM table_{} WHERE id = %(id_1)s'.format(i) for i in range(10)]
+        context, cursor = Context(), Cursor()
+
+        def workload():
+            for statement in statements * 100:
+                collector.before_cursor_execute(None, cursor, statement, {}, context, False)
+                collector.after_cursor_execute(None, cursor, statement, {}, context, False)
+
+        check_benchmark('stats_collector', workload)
+
+    def test_delete_truncate(self):
+        table, dialect = get_wide_table(), HawqDialect()
+        check_benchmark('delete_truncate', lambda: [str(table.delete().compile(dialect=dialect)) for _ in range(100)])
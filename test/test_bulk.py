@@ -0,0 +1,219 @@
+"""
+Tests the COPY and multi-row VALUES executemany paths without connecting to live db.
+"""
+from types import SimpleNamespace
+import datetime
+import decimal
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text, create_engine, func
+from sqlalchemy.testing.suite import fixtures
+from sqlalchemy.testing import assert_raises
+
+from sqlalchemy_hawq.bulk import (
+    CopyNotSupported,
+    CopyRowError,
+    CopyStream,
+    copy_executemany,
+    copy_statement,
+    copy_value,
+    values_executemany,
+)
+from sqlalchemy_hawq.dialect import HawqDialect
+from sqlalchemy_hawq.point import Point
+
+
+class CopyCursorSpy:
+    def __init__(self):
+        self.connection = SimpleNamespace(encoding='UTF8')
+        self.sql = None
+        self.data = None
+
+    def copy_expert(self, sql, stream):
+        self.sql = sql
+        chunks = []
+        chunk = stream.read(16)
+        while chunk:
+            chunks.append(chunk)
+            chunk = stream.read(16)
+        self.data = b''.join(chunks).decode('utf8')
+
+
+def get_insert_context(stmt):
+    dialect = create_engine('hawq://localhost/dummy_user', strategy='mock', executor=None).dialect
+    compiled = stmt.compile(dialect=dialect)
+    return str(compiled), SimpleNamespace(compiled=compiled, isinsert=True, isupdate=False, isdelete=False)
+
+
+def get_table():
+    return Table(
+        'copytable',
+        MetaData(),
+        Column('id', Integer, primary_key=True, autoincrement=False),
+        Column('name', Text),
+        Column('loc', Point),
+    )
+
+
+class TestCopyValue(fixtures.TestBase):
+    def test_null(self):
+        assert copy_value(None) == '\\N'
+
+    def test_escapes(self):
+        assert copy_value('a\tb\nc\\d\r') == 'a\\tb\\nc\\\\d\\r'
+
+    def test_boolean(self):
+        assert copy_value(True) == 't'
+        assert copy_value(False) == 'f'
+
+    def test_numbers(self):
+        assert copy_value(1) == '1'
+        assert copy_value(1.5) == '1.5'
+        assert copy_value(float('-inf')) == '-Infinity'
+        assert copy_value(decimal.Decimal('1.10')) == '1.10'
+
+    def test_datetime(self):
+        assert copy_value(datetime.datetime(2019, 1, 2, 3, 4, 5)) == '2019-01-02 03:04:05'
+
+    def test_bytes(self):
+        assert copy_value(b'\x01\xff') == '\\\\x01ff'
+
+    def test_unsupported(self):
+        assert_raises(CopyNotSupported, copy_value, [1, 2])
+
+
+class TestCopyStatement(fixtures.TestBase):
+    def test_plain_insert(self):
+        statement, context = get_insert_context(get_table().insert())
+        copy_sql, keys = copy_statement(statement, context.compiled.insert_single_values_expr)
+        assert copy_sql == 'COPY copytable (id, name, loc) FROM STDIN'
+        assert keys == ['id', 'name', 'loc']
+
+    def test_sql_expression_rejected(self):
+        table = get_table()
+        statement, context = get_insert_context(table.insert().values(name=func.lower('X')))
+        assert_raises(
+            CopyNotSupported,
+            copy_statement,
+            statement,
+            context.compiled.insert_single_values_expr,
+        )
+
+
+class TestCopyExecutemany(fixtures.TestBase):
+    def test_streams_all_rows(self):
+        statement, context = get_insert_context(get_table().insert())
+        cursor = CopyCursorSpy()
+        parameters = [
+            {'id': 1, 'name': 'first\tvalue', 'loc': '(1, 2)'},
+            {'id': 2, 'name': None, 'loc': None},
+        ]
+        stream = copy_executemany(cursor, statement, parameters, context)
+
+        assert cursor.sql == 'COPY copytable (id, name, loc) FROM STDIN'
+        assert cursor.data == '1\tfirst\\tvalue\t(1, 2)\n2\t\\N\t\\N\n'
+        assert stream.rows == 2
+
+    def test_unsupported_first_row(self):
+        statement, context = get_insert_context(get_table().insert())
+        cursor = CopyCursorSpy()
+        parameters = [{'id': 1, 'name': ['not', 'text'], 'loc': None}]
+        assert_raises(CopyNotSupported, copy_executemany, cursor, statement, parameters, context)
+        assert cursor.sql is None
+
+    def test_unsupported_later_row(self):
+        statement, context = get_insert_context(get_table().insert())
+        parameters = [
+            {'id': 1, 'name': 'first', 'loc': None},
+            {'id': 2, 'name': ['not', 'text'], 'loc': None},
+        ]
+
+        class FailingCopyCursorSpy(CopyCursorSpy):
+            executemany_calls = 0
+
+            def copy_expert(self, sql, stream):
+                # psycopg2 aborts the COPY and reports the failed read as its own error
+                try:
+                    super().copy_expert(sql, stream)
+                except Exception as err:
+                    raise RuntimeError('COPY from stdin failed: error in .read() call') from err
+
+            def executemany(self, statement, parameters):
+                self.executemany_calls += 1
+
+        cursor = FailingCopyCursorSpy()
+        assert_raises(CopyRowError, copy_executemany, cursor, statement, parameters, context)
+
+        # the failed COPY aborted the transaction, so do_executemany must not fall back
+        dialect = HawqDialect(copy_executemany=True)
+        try:
+            dialect.do_executemany(cursor, statement, parameters, context)
+        except CopyRowError as err:
+            assert str(err).startswith('parameter set 1 cannot be sent by COPY')
+        else:
+            assert False, 'CopyRowError not raised'
+        assert cursor.executemany_calls == 0
+
+    def test_stream_chunks(self):
+        stream = CopyStream(({'id': i} for i in range(1000)), ['id'], chunk_size=100)
+        chunk = stream.read(50)
+        assert len(chunk) == 50
+        assert stream.rows < 1000
+
+    def test_stream_bytes(self):
+        stream = CopyStream([{'name': 'caf\u00e9'}], ['name'])
+        assert stream.read() == 'caf\u00e9\n'.encode('utf8')
+        assert stream.bytes == 6
+
+
+class ValuesCursorSpy:
+    def __init__(self):
+        self.connection = SimpleNamespace(encoding='UTF8')
+        self.statements = []
+
+    def mogrify(self, template, params):
+        return (template % {k: "'{}'".format(v) for k, v in params.items()}).encode('utf8')
+
+    def execute(self, statement):
+        self.statements.append(statement)
+
+
+class TestValuesExecutemany(fixtures.TestBase):
+    def test_single_statement(self):
+        statement, context = get_insert_context(get_table().insert())
+        cursor = ValuesCursorSpy()
+        parameters = [{'id': i, 'name': 'n', 'loc': '(1, 2)'} for i in range(3)]
+        count = values_executemany(cursor, statement, parameters, context, max_bytes=1024)
+
+        assert count == 1
+        assert cursor.statements == [
+            b"INSERT INTO copytable (id, name, loc) VALUES "
+            b"('0', 'n', '(1, 2)'),('1', 'n', '(1, 2)'),('2', 'n', '(1, 2)')"
+        ]
+
+    def test_byte_budget(self):
+        statement, context = get_insert_context(get_table().insert())
+        cursor = ValuesCursorSpy()
+        parameters = [{'id': i, 'name': 'x' * 50, 'loc': None} for i in range(10)]
+        count = values_executemany(cursor, statement, parameters, context, max_bytes=200)
+
+        assert count == len(cursor.statements) > 1
+        assert all(len(stmt) <= 200 for stmt in cursor.statements)
+        assert context.hawq_bytes_sent == sum(len(stmt) for stmt in cursor.statements)
+        assert sum(stmt.count(b"'x") for stmt in cursor.statements) == 10
+
+    def test_page_size(self):
+        statement, context = get_insert_context(get_table().insert())
+        cursor = ValuesCursorSpy()
+        parameters = [{'id': i, 'name': 'n', 'loc': None} for i in range(5)]
+        count = values_executemany(
+            cursor, statement, parameters, context, max_bytes=1024, page_size=2
+        )
+        assert count == 3
+
+    def test_sql_expression_kept(self):
+        statement, context = get_insert_context(get_table().insert().values(name=func.lower('X')))
+        cursor = ValuesCursorSpy()
+        parameters = [{'id': i, 'lower_1': 'X', 'loc': None} for i in range(2)]
+        values_executemany(cursor, statement, parameters, context, max_bytes=1024)
+
+        assert cursor.statements[0].count(b'lower(') == 2
@@ -0,0 +1,289 @@
+"""
+Tests the partition catalog cache without connecting to live db.
+"""
+from types import SimpleNamespace
+import collections
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.testing.suite import fixtures
+
+from sqlalchemy_hawq.catalog import PartitionIndex, PartitionInfo, boundary_value, rebuild_partition_by
+from sqlalchemy_hawq.partition import ListSubpartition, RangePartition
+from sqlalchemy_hawq.dialect import HawqDialect, HawqExecutionContext
+
+
+CatalogRow = collections.namedtuple(
+    'CatalogRow',
+    [
+        'schemaname',
+        'tablename',
+        'partitionschemaname',
+        'partitiontablename',
+        'partitionname',
+        'parentpartitiontablename',
+        'partitionlevel',
+        'partitiontype',
+        'partitionrank',
+        'partitionposition',
+        'partitionlistvalues',
+        'partitionrangestart',
+        'partitionstartinclusive',
+        'partitionrangeend',
+        'partitionendinclusive',
+        'partitionisdefault',
+        'partitionboundary',
+        'columnname',
+    ],
+)
+
+
+def range_row(child, rank, start, end, columnname='year', parent=None, level=0, default=False):
+    return CatalogRow(
+        'public', 'sales', 'public', child, 'extra' if default else None, parent, level, 'range',
+        None if default else rank, rank, None, None if default else str(start), not default,
+        None if default else str(end), False, default, None, columnname,
+    )
+
+
+CATALOG = [
+    range_row('sales_1_prt_extra', 1, None, None, default=True),
+    range_row('sales_1_prt_extra', 1, None, None, columnname='month', default=True),
+    range_row('sales_1_prt_2', 2, 2000, 2005),
+    range_row('sales_1_prt_2', 2, 2000, 2005, columnname='month'),
+    range_row('sales_1_prt_3', 3, 2005, 2010),
+    range_row('sales_1_prt_3', 3, 2005, 2010, columnname='month'),
+    range_row('sales_1_prt_2_2_prt_extra', 1, None, None, 'day', 'sales_1_prt_2', 1, True),
+]
+
+
+class CatalogConnectionSpy:
+    def __init__(self, rows=CATALOG):
+        self.rows = rows
+        self.queries = 0
+        self.dialect = SimpleNamespace(default_schema_name='public')
+
+    def execute(self, statement):
+        self.queries += 1
+        return list(self.rows)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestPartitionIndex(fixtures.TestBase):
+    def test_partitions(self):
+        connection = CatalogConnectionSpy()
+        index = PartitionIndex()
+        partitions = index.partitions(connection, 'sales')
+        assert [info.child for info in partitions] == [
+            'sales_1_prt_extra',
+            'sales_1_prt_2',
+            'sales_1_prt_3',
+            'sales_1_prt_2_2_prt_extra',
+        ]
+        assert partitions[1].range_start == '2000'
+        assert partitions[0].is_default
+        assert index.partitions(connection, 'sales', 'other_schema') == []
+        assert index.partitions(connection, 'missing') == []
+
+    def test_partition_columns(self):
+        index = PartitionIndex()
+        assert index.partition_columns(CatalogConnectionSpy(), 'sales') == [['year', 'month'], ['day']]
+
+    def test_partition(self):
+        connection = CatalogConnectionSpy()
+        index = PartitionIndex()
+        assert index.partition(connection, 'sales_1_prt_2_2_prt_extra').parent == 'sales_1_prt_2'
+        assert index.is_partition(connection, 'sales_1_prt_3')
+        assert not index.is_partition(connection, 'sales')
+
+    def test_single_query(self):
+        connection = CatalogConnectionSpy()
+        index = PartitionIndex()
+        index.partitions(connection, 'sales')
+        index.partition(connection, 'sales_1_prt_3')
+        index.partition_columns(connection, 'sales')
+        assert connection.queries == 1
+
+    def test_ttl(self):
+        connection = CatalogConnectionSpy()
+        clock = Clock()
+        index = PartitionIndex(ttl=10, clock=clock)
+        index.partitions(connection, 'sales')
+        clock.now = 9
+        index.partitions(connection, 'sales')
+        assert connection.queries == 1
+        clock.now = 10
+        index.partitions(connection, 'sales')
+        assert connection.queries == 2
+
+    def test_no_ttl(self):
+        connection = CatalogConnectionSpy()
+        clock = Clock()
+        index = PartitionIndex(ttl=None, clock=clock)
+        index.partitions(connection, 'sales')
+        clock.now = 1e9
+        index.partitions(connection, 'sales')
+        assert connection.queries == 1
+
+    def test_invalidate(self):
+        connection = CatalogConnectionSpy()
+        index = PartitionIndex()
+        index.partitions(connection, 'sales')
+        index.invalidate()
+        index.partitions(connection, 'sales')
+        assert connection.queries == 2
+
+
+def get_context(dialect, statement, isddl=False, isupdate=False, isdelete=False):
+    context = object.__new__(HawqExecutionContext)
+    context.dialect = dialect
+    context.statement = statement
+    context.isddl = isddl
+    context.isupdate = isupdate
+    context.isdelete = isdelete
+    return context
+
+
+class TestInvalidation(fixtures.TestBase):
+    def test_dialect_ttl(self):
+        assert HawqDialect(partition_cache_ttl=5).partition_index.ttl == 5
+
+    def test_ddl_invalidates(self):
+        dialect = HawqDialect()
+        dialect.partition_index.load(CatalogConnectionSpy())
+        get_context(dialect, 'CREATE TABLE sales (id INTEGER)', isddl=True).post_exec()
+        assert dialect.partition_index.expired()
+
+    def test_textual_statements_invalidate(self):
+        dialect = HawqDialect()
+        for statement in ['TRUNCATE TABLE sales', ' alter table sales drop partition for (2000)']:
+            dialect.partition_index.load(CatalogConnectionSpy())
+            get_context(dialect, statement).post_exec()
+            assert dialect.partition_index.expired()
+
+    def test_rewrites_invalidate(self):
+        # the rewrite of a table starts with the check of its views
+        dialect = HawqDialect()
+        for kind in ['isupdate', 'isdelete']:
+            dialect.partition_index.load(CatalogConnectionSpy())
+            get_context(dialect, "SELECT CAST('cannot rewrite ' ...", **{kind: True}).post_exec()
+            assert dialect.partition_index.expired()
+
+    def test_queries_do_not_invalidate(self):
+        dialect = HawqDialect()
+        dialect.partition_index.load(CatalogConnectionSpy())
+        get_context(dialect, 'SELECT * FROM sales').post_exec()
+        get_context(dialect, 'INSERT INTO sales (id) VALUES (1)').post_exec()
+        assert not dialect.partition_index.expired()
+
+
+def partition_info(child, level, type_, column, name=None, parent=None, default=False,
+                   start=None, end=None, values=None):
+    return PartitionInfo(
+        'public', 'sales', 'public', child, name, parent, level, type_, None, None, values,
+        start, start is not None, end, False, default, None, [column],
+    )
+
+
+def sales_partitions(every=5):
+    partitions = [
+        partition_info('sales_1_prt_extra', 0, 'range', 'year', 'extra', default=True),
+        partition_info('sales_1_prt_2', 0, 'range', 'year', start='2000', end=str(2000 + every)),
+        partition_info('sales_1_prt_3', 0, 'range', 'year', start=str(2000 + every), end='2010'),
+    ]
+    for parent in ['sales_1_prt_extra', 'sales_1_prt_2', 'sales_1_prt_3']:
+        partitions.extend([
+            partition_info(parent + '_2_prt_other', 1, 'list', 'region', 'other', parent, True),
+            partition_info(parent + '_2_prt_east', 1, 'list', 'region', 'east', parent, values="'e'::text"),
+            partition_info(parent + '_2_prt_west', 1, 'list', 'region', 'west', parent, values="'w'::text"),
+        ])
+    return partitions
+
+
+class TestRebuildPartitionBy(fixtures.TestBase):
+    def test_boundary_value(self):
+        assert boundary_value('2009') == 2009
+        assert boundary_value('1.5::numeric') == 1.5
+        assert boundary_value("'chr1'::text") == 'chr1'
+        assert boundary_value("'it''s'::character varying") == "it's"
+
+    def test_range_with_list_subpartition(self):
+        partition_by = rebuild_partition_by(sales_partitions())
+        assert isinstance(partition_by, RangePartition)
+        assert (partition_by.column_name, partition_by.start, partition_by.end, partition_by.every) == (
+            'year', 2000, 2010, 5
+        )
+        assert len(partition_by.subpartitions) == 1
+        subpartition = partition_by.subpartitions[0]
+        assert isinstance(subpartition, ListSubpartition)
+        assert subpartition.column_name == 'region'
+        assert dict(subpartition.mapping) == {'east': 'e', 'west': 'w'}
+
+    def test_uneven_ranges(self):
+        assert rebuild_partition_by(sales_partitions(every=4)) is None
+
+    def test_multi_value_list(self):
+        partitions = [
+            partition_info('sales_1_prt_ew', 0, 'list', 'region', 'ew', values="'e'::text, 'w'::text")
+        ]
+        assert rebuild_partition_by(partitions) is None
+
+    def test_same_ddl(self):
+        table = Table(
+            'sales',
+            MetaData(),
+            Column('year', Integer),
+            Column('region', Text),
+            hawq_partition_by=rebuild_partition_by(sales_partitions()),
+        )
+        sql = str(CreateTable(table).compile(dialect=HawqDialect()))
+        assert 'PARTITION BY RANGE (year)' in sql
+        assert "SUBPARTITION east VALUES ('e')" in sql
+        assert 'START (2000) END (2010) EVERY (5)' in sql
+
+
+class TestHidePartitions(fixtures.TestBase):
+    def get_dialect(self, **kwargs):
+        dialect = HawqDialect(shared_reflection_cache=False, **kwargs)
+        dialect.default_schema_name = 'public'
+        dialect.partition_index._partitions = {('public', 'sales'): sales_partitions()}
+        dialect.partition_index._children = {
+            ('public', info.child): info for info in sales_partitions()
+        }
+        dialect.partition_index._loaded_at = dialect.partition_index.clock()
+        return dialect
+
+    def test_table_names(self):
+        names = [('sales',), ('orders',)] + [(info.child,) for info in sales_partitions()]
+        connection = TableNamesConnectionSpy(names)
+        assert self.get_dialect().get_table_names(connection) == ['sales', 'orders']
+        assert len(self.get_dialect(reflect_partitions=True).get_table_names(connection)) == 14
+
+    def test_table_names_without_partitions(self):
+        dialect = HawqDialect(shared_reflection_cache=False)
+        dialect.default_schema_name = 'public'
+        connection = TableNamesConnectionSpy([('sales',), ('orders',)])
+        assert dialect.get_table_names(connection) == ['sales', 'orders']
+        assert dialect.partition_index.expired()
+
+    def test_table_options(self):
+        connection = TableNamesConnectionSpy([('sales', 'a', None, None, None, None, None, [])])
+        options = self.get_dialect().get_table_options(connection, 'sales')
+        assert isinstance(options['hawq_partition_by'], RangePartition)
+        assert options['hawq_appendonly']
+
+
+class TableNamesConnectionSpy:
+    def __init__(self, rows):
+        self.rows = rows
+        self.dialect = SimpleNamespace(default_schema_name='public')
+
+    def execute(self, statement, **params):
+        return list(self.rows)
@@ -0,0 +1,126 @@
+"""
+Tests the single-query existence checks and pipelined DDL of create_all and
+drop_all without connecting to live db.
+"""
+from sqlalchemy import DDL, Column, Integer, MetaData, Table, create_engine, event, text
+from sqlalchemy.schema import CreateTable, DropTable
+from sqlalchemy.testing.suite import fixtures
+import contextlib
+
+from sqlalchemy_hawq import ddl
+from sqlalchemy_hawq.dialect import HawqDialect
+
+
+def get_metadata():
+    metadata = MetaData()
+    for name in ['first', 'second', 'third']:
+        Table(name, metadata, Column('id', Integer), hawq_appendonly=True)
+    Table('scores', metadata, Column('id', Integer), schema='results')
+    return metadata
+
+
+class CatalogConnectionSpy:
+    def __init__(self, tables=(), schemas=('public',)):
+        self.dialect = HawqDialect()
+        self.dialect.default_schema_name = 'public'
+        self.tables = set(tables)
+        self.schemas = set(schemas)
+        self.statements = []
+
+    @contextlib.contextmanager
+    def connect(self):
+        yield self
+
+    def get_execution_options(self):
+        return {}
+
+    def schema_for_object(self, obj):
+        return obj.schema
+
+    def execute(self, statement, *multiparams, **params):
+        if statement is ddl.EXISTING_TABLES_QUERY:
+            self.statements.append('EXISTING TABLES')
+            rows = [
+                (schema, name) for schema, name in self.tables
+                if schema in params['schemas'] and name in params['names']
+            ]
+            return rows + [(schema, None) for schema in self.schemas if schema in params['schemas']]
+        if not isinstance(statement, str):
+            raise AssertionError('unexpected statement: {}'.format(statement))
+        self.statements.append(statement)
+        return None
+
+
+class TestCreateAll(fixtures.TestBase):
+    def test_existing_tables_are_skipped(self):
+        connection = CatalogConnectionSpy(tables=[('public', 'second')], schemas=['public', 'results'])
+        ddl.create_all(connection, get_metadata())
+        check, batch = connection.statements
+        assert check == 'EXISTING TABLES'
+        assert batch.count('CREATE TABLE') == 3
+        assert 'CREATE TABLE first' in batch
+        assert 'CREATE TABLE second' not in batch
+        assert 'CREATE TABLE results.scores' in batch
+        assert ';\nCREATE TABLE' in batch
+
+    def test_batch_size(self):
+        connection = CatalogConnectionSpy(schemas=['public', 'results'])
+        ddl.create_all(connection, get_metadata(), batch_size=3)
+        assert [statement.count('CREATE TABLE') for statement in connection.statements[1:]] == [3, 1]
+
+    def test_without_checkfirst(self):
+        connection = CatalogConnectionSpy(tables=[('public', 'second')])
+        ddl.create_all(connection, get_metadata(), checkfirst=False)
+        assert len(connection.statements) == 1
+        assert connection.statements[0].count('CREATE TABLE') == 4
+
+    def test_create_schemas(self):
+        connection = CatalogConnectionSpy()
+        ddl.create_all(connection, get_metadata(), create_schemas=True)
+        assert connection.statements[1].startswith('CREATE SCHEMA results;\n')
+
+    def test_events_run_in_order(self):
+        metadata = get_metadata()
+        event.listen(metadata.tables['first'], 'after_create', DDL('ANALYZE first'))
+        event.listen(
+            metadata, 'after_create', lambda target, connection, **kw: connection.execute(text('SELECT 1'))
+        )
+        connection = CatalogConnectionSpy(schemas=['public', 'results'])
+        statements = []
+        connection.execute = lambda statement, *multiparams, **params: statements.append(str(statement))
+        ddl.HawqSchemaGenerator(connection.dialect, connection).traverse_single(metadata)
+        batch, select = statements
+        assert batch.index('CREATE TABLE first') < batch.index('ANALYZE first') < batch.index('CREATE TABLE second')
+        assert select == 'SELECT 1'
+
+
+class TestDropAll(fixtures.TestBase):
+    def test_missing_tables_are_skipped(self):
+        connection = CatalogConnectionSpy(tables=[('public', 'first'), ('public', 'third')])
+        ddl.drop_all(connection, get_metadata())
+        check, batch = connection.statements
+        assert check == 'EXISTING TABLES'
+        assert batch.count('DROP TABLE') == 2
+        assert 'DROP TABLE results.scores' not in batch
+
+    def test_nothing_to_drop(self):
+        connection = CatalogConnectionSpy()
+        ddl.drop_all(connection, get_metadata())
+        assert connection.statements == ['EXISTING TABLES']
+
+
+class TestMetaDataCreateAll(fixtures.TestBase):
+    def test_default_generator_is_kept(self):
+        statements = []
+        engine = create_engine(
+            'hawq://localhost/dummy_user',
+            strategy='mock',
+            executor=lambda statement, *multiparams, **params: statements.append(statement),
+        )
+        metadata = get_metadata()
+        metadata.create_all(engine)
+        assert [type(statement) for statement in statements] == [CreateTable] * 4
+        assert str(statements[0].compile(dialect=engine.dialect)).strip().startswith('CREATE TABLE first')
+        statements.clear()
+        metadata.drop_all(engine)
+        assert [type(statement) for statement in statements] == [DropTable] * 4
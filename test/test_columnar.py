@@ -0,0 +1,47 @@
+"""
+Tests columnar (numpy) result decoding without connecting to live db.
+"""
+import datetime
+import decimal
+
+import pytest
+from sqlalchemy.testing.suite import fixtures
+
+numpy = pytest.importorskip('numpy')
+
+from sqlalchemy_hawq.columnar import arrays_from_rows  # noqa: E402
+
+
+DESCRIPTION = [('id', 23), ('value', 1700), ('loc', 600), ('day', 1082), ('name', 25)]
+
+
+class TestArraysFromRows(fixtures.TestBase):
+    def test_without_nulls(self):
+        rows = [
+            (1, decimal.Decimal('1.5'), '(1,2)', datetime.date(2019, 1, 1), 'a'),
+            (2, decimal.Decimal('2'), '(-3.5,4e2)', datetime.date(2019, 1, 2), 'b'),
+        ]
+        arrays = arrays_from_rows(DESCRIPTION, rows)
+
+        assert arrays['id'].dtype == numpy.int32
+        assert not isinstance(arrays['id'], numpy.ma.MaskedArray)
+        assert arrays['value'].tolist() == [1.5, 2.0]
+        assert arrays['loc'].shape == (2, 2)
+        assert arrays['loc'].tolist() == [[1.0, 2.0], [-3.5, 400.0]]
+        assert arrays['day'].dtype == numpy.dtype('datetime64[D]')
+        assert arrays['name'].tolist() == ['a', 'b']
+
+    def test_nulls_are_masked(self):
+        rows = [(1, None, None, None, None), (None, decimal.Decimal(1), '(1,2)', None, 'x')]
+        arrays = arrays_from_rows(DESCRIPTION, rows)
+
+        assert arrays['id'].mask.tolist() == [False, True]
+        assert arrays['id'].dtype == numpy.int32
+        assert arrays['loc'].mask.tolist() == [[True, True], [False, False]]
+        assert arrays['loc'][1].tolist() == [1.0, 2.0]
+        assert arrays['day'].mask.tolist() == [True, True]
+
+    def test_empty(self):
+        arrays = arrays_from_rows(DESCRIPTION, [])
+        assert arrays['id'].shape == (0,)
+        assert arrays['loc'].shape == (0, 2)
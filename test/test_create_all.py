@@ -15,6 +15,7 @@ from sqlalchemy_hawq.partition import (
     ListSubpartition,
 )
 from sqlalchemy_hawq.point import Point
+from sqlalchemy_hawq.rewrite import view_dependency_check
 
 
 def get_engine_spy():
@@ -326,6 +327,30 @@ WITH (orientation=ROW)'''
         metadata = MockTable.__table__.metadata
         assert_raises(ValueError, metadata.create_all, engine_spy.engine)
 
+    def test_on_commit(self, base=declarative_base(), engine_spy=get_engine_spy()):
+        class MockTable(base):
+            __tablename__ = 'MockTable'
+            __table_args__ = {'prefixes': ['TEMPORARY'], 'hawq_on_commit': 'drop'}
+            chrom = Column('chrom', Text(), primary_key=True)
+
+        metadata = MockTable.__table__.metadata
+        metadata.create_all(engine_spy.engine)
+        expected = '''CREATE TEMPORARY TABLE "MockTable" (
+chrom TEXT NOT NULL
+)
+ON COMMIT DROP'''
+
+        assert normalize_whitespace(expected) == normalize_whitespace(engine_spy.sql).strip()
+
+    def test_on_commit_error(self, base=declarative_base(), engine_spy=get_engine_spy()):
+        class MockTable(base):
+            __tablename__ = 'MockTable'
+            __table_args__ = {'prefixes': ['TEMPORARY'], 'hawq_on_commit': 'bad value'}
+            chrom = Column('chrom', Text(), primary_key=True)
+
+        metadata = MockTable.__table__.metadata
+        assert_raises(ValueError, metadata.create_all, engine_spy.engine)
+
     def test_compresstype(self, engine_spy=get_engine_spy()):
 
         for compresstype in {'ZLIB', 'SNAPPY', 'GZIP', 'NONE'}:
@@ -428,8 +453,20 @@ ptest POINT NOT NULL
         metadata = MockTable.__table__.metadata
         metadata.create_all(engine_spy.engine)
 
-        delete_stmt = MockTable.__table__.delete().where(id == 3)
-        assert_raises(NotImplementedError, delete_stmt.compile, engine_spy.engine)
+        delete_stmt = MockTable.__table__.delete().where(MockTable.id == 3)
+        expected = view_dependency_check('"MockTable"') + ''';
+CREATE TABLE "MockTable__hawq_swap" (
+id SERIAL NOT NULL,
+ptest POINT
+);
+INSERT INTO "MockTable__hawq_swap" SELECT * FROM "MockTable" WHERE NOT coalesce(("MockTable".id = %(id_1)s), false);
+SELECT setval(pg_get_serial_sequence('"MockTable__hawq_swap"', 'id'), coalesce(max(id), 0) + 1, false) FROM "MockTable__hawq_swap";
+DROP TABLE "MockTable";
+ALTER TABLE "MockTable__hawq_swap" RENAME TO "MockTable"'''
+
+        assert normalize_whitespace(expected) == normalize_whitespace(
+            str(delete_stmt.compile(engine_spy.engine))
+        )
 
     def test_delete_statement_bare(self, base=declarative_base(), engine_spy=get_engine_spy()):
         class MockTable(base):
@@ -1,11 +1,33 @@
+from sqlalchemy import Column, Integer, MetaData, Numeric, Table, Text
 from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
 from sqlalchemy.testing.suite import fixtures
 from sqlalchemy.testing import assert_raises
+from collections import OrderedDict
+import psycopg2
+import pytest
 
 
-from sqlalchemy_hawq.partition import format_partition_value
+from sqlalchemy_hawq.ddl import (
+    ClauseCache,
+    cached_partition_clause,
+    cached_with_clause,
+    clear_compile_cache,
+    with_clause,
+)
+from sqlalchemy_hawq.dialect import HawqDialect
+from sqlalchemy_hawq.partition import (
+    ListPartition,
+    ListSubpartition,
+    RangePartition,
+    RangeSubpartition,
+    format_partition_value,
+    partition_clause,
+)
 from sqlalchemy_hawq.point import Point
 from sqlalchemy_hawq.point import SQLAlchemyHawqException
+from sqlalchemy_hawq.point import cast_point, parse_point
+from sqlalchemy_hawq.point import format_points, parse_points, points_to_array
 
 
 class TestFormatPartitionValue(fixtures.TestBase):
@@ -97,3 +119,219 @@ class TestPointSQLConversion(fixtures.TestBase):
     def test_tuple_to_string_incorrect_2(self):
         func = Point.bind_processor(1, 2)
         assert_raises(SQLAlchemyHawqException, func, (2, None))
+
+    def test_list_to_string(self):
+        func = Point.bind_processor(1, 2)
+        assert func([1.5, -2]) == '(1.5, -2)'
+
+    def test_tuple_to_string_incorrect_3(self):
+        func = Point.bind_processor(1, 2)
+        assert_raises(SQLAlchemyHawqException, func, (1, 2, 3))
+
+    def test_string_to_tuple_negative_and_scientific(self):
+        func = Point.result_processor(1, 2, 3)
+        assert func('(-1.5,2.5e-05)') == (-1.5, 2.5e-05)
+        assert func('(1E+20,-3)') == (1e20, -3.0)
+
+    def test_string_to_tuple_incorrect_5(self):
+        func = Point.result_processor(1, 2, 3)
+        assert_raises(SQLAlchemyHawqException, func, '(1,2,3)')
+
+
+class TestPointBatchConversion(fixtures.TestBase):
+    def test_format_points(self):
+        assert format_points([(1, 2), None, (None, None)]) == ['(1, 2)', None, None]
+
+    def test_parse_points(self):
+        assert parse_points(['(1,2)', None, '(-3,4e1)']) == [(1.0, 2.0), None, (-3.0, 40.0)]
+
+    def test_parse_points_incorrect(self):
+        assert_raises(SQLAlchemyHawqException, parse_points, ['(1,2)', '(a,b)'])
+        assert_raises(SQLAlchemyHawqException, parse_points, ['(1,2)', '(1,2,3)'])
+
+    def test_round_trip(self):
+        points = [(0.1, -0.2), (1e-300, 1e300), (-123456.789, 0.0)]
+        assert parse_points(format_points(points)) == points
+
+    def test_format_points_array(self):
+        numpy = pytest.importorskip('numpy')
+        assert format_points(numpy.array([[1.5, -2.0]])) == ['(1.5, -2.0)']
+
+    def test_points_to_array(self):
+        numpy = pytest.importorskip('numpy')
+        array = points_to_array(['(1,2)', '(-3.5,4e2)'])
+        assert array.dtype == numpy.float64
+        assert array.tolist() == [[1.0, 2.0], [-3.5, 400.0]]
+        assert points_to_array([(1, 2)]).tolist() == [[1.0, 2.0]]
+        assert_raises(SQLAlchemyHawqException, points_to_array, ['(1,2,3)'])
+
+
+class TestPointTypecaster(fixtures.TestBase):
+    # without the connection setup of the psycopg2 dialect, which needs a real connection
+    dialect_args = dict(
+        dbapi=psycopg2, use_native_unicode=False, use_native_uuid=False, use_native_hstore=False
+    )
+
+    def test_cast_point(self):
+        assert cast_point('(1.5,-2)', None) == (1.5, -2.0)
+        assert cast_point(None, None) is None
+        assert_raises(SQLAlchemyHawqException, cast_point, '(1,2,3)', None)
+
+    def test_no_result_processor_with_native_point(self):
+        dialect = HawqDialect()
+        assert dialect.use_native_point
+        assert Point().result_processor(dialect, None) is None
+        dialect = HawqDialect(use_native_point=False)
+        assert Point().result_processor(dialect, None) is parse_point
+
+    def test_on_connect_registers_point(self):
+        registered = []
+        dialect = HawqDialect(**self.dialect_args)
+        dialect._register_point = registered.append
+        dialect.on_connect()('connection')
+        assert registered == ['connection']
+
+    def test_register_point_sends_no_query(self):
+        registered = []
+
+        class Extensions:
+            new_type = staticmethod(lambda oids, name, cast: (oids, name, cast))
+            register_type = staticmethod(lambda type_, conn: registered.append((type_, conn)))
+
+        class ConnectionSpy:
+            def cursor(self):
+                raise AssertionError('no cursor should be opened, nor transaction begun, on connect')
+
+        dialect = HawqDialect(**self.dialect_args)
+        dialect._psycopg2_extensions = Extensions
+        connection = ConnectionSpy()
+        dialect._register_point(connection)
+        assert registered == [(((600,), 'POINT', cast_point), connection)]
+
+    def test_on_connect_without_native_point(self):
+        dialect = HawqDialect(use_native_point=False, **self.dialect_args)
+        assert dialect.on_connect() is None
+
+
+def get_options(**options):
+    table_opts = dict.fromkeys(
+        ['appendonly', 'orientation', 'compresstype', 'compresslevel', 'bucketnum', 'distributed_by']
+    )
+    table_opts.update(options)
+    return table_opts
+
+
+def get_partitioned_table(name, partition_type=Integer):
+    return Table(
+        name,
+        MetaData(),
+        Column('id', Integer),
+        Column('chrom', partition_type),
+        hawq_partition_by=ListPartition('chrom', OrderedDict([('chr1', '1'), ('chr2', '2')])),
+    )
+
+
+def get_three_level_table(name='three_levels'):
+    return Table(
+        name,
+        MetaData(),
+        Column('chrom', Text),
+        Column('pos', Integer),
+        Column('strand', Text),
+        hawq_partition_by=ListPartition(
+            'chrom',
+            OrderedDict([('chr1', '1'), ('chr2', '2')]),
+            [
+                RangeSubpartition('pos', 0, 100, 10),
+                ListSubpartition('strand', OrderedDict([('forward', '+'), ('reverse', '-')])),
+            ],
+        ),
+    )
+
+
+class TestLeafPartitions(fixtures.TestBase):
+    def test_leaf_count(self):
+        partition_by = get_three_level_table().dialect_options['hawq']['partition_by']
+        assert partition_by.leaf_count() == 3 * 11 * 3
+
+    def test_three_level_clause(self):
+        sql = str(CreateTable(get_three_level_table()).compile(dialect=HawqDialect()))
+        assert sql.index('SUBPARTITION BY RANGE (pos)') < sql.index('SUBPARTITION BY LIST (strand)')
+        assert "    SUBPARTITION forward VALUES ('+'),\n        SUBPARTITION reverse VALUES ('-')," in sql
+        assert "    PARTITION chr2 VALUES ('2'),\n    DEFAULT PARTITION other\n)" in sql
+
+    def test_long_mapping(self):
+        mapping = OrderedDict(('p{}'.format(i), i) for i in range(1000))
+        table = get_partitioned_table('long')
+        clause = partition_clause(table, ListPartition('chrom', mapping))
+        assert clause.count('\n    PARTITION p') == 1000
+        assert '    PARTITION p999 VALUES (999),\n    DEFAULT PARTITION other' in clause
+
+    def test_max_leaf_partitions(self):
+        table = get_three_level_table()
+        assert 'PARTITION BY LIST' in str(CreateTable(table).compile(dialect=HawqDialect(max_leaf_partitions=99)))
+        assert_raises(
+            ValueError, CreateTable(table).compile, dialect=HawqDialect(max_leaf_partitions=98)
+        )
+
+
+class TestCompileCache(fixtures.TestBase):
+    def setup(self):
+        clear_compile_cache()
+
+    def teardown(self):
+        clear_compile_cache()
+
+    def test_with_clause(self):
+        table_opts = get_options(appendonly=True, compresstype='ZLIB', compresslevel=5)
+        assert cached_with_clause(table_opts) == with_clause(table_opts)
+        assert cached_with_clause(dict(table_opts)) is cached_with_clause(table_opts)
+        assert cached_with_clause(get_options()) == ''
+
+    def test_with_clause_errors(self):
+        assert_raises(ValueError, cached_with_clause, get_options(compresslevel=10))
+        assert_raises(ValueError, cached_with_clause, get_options(bucketnum=8))
+
+    def test_with_clause_value_types(self):
+        # True == 1, but only True is a valid appendonly, and only 1 a valid compresslevel
+        cached_with_clause(get_options(appendonly=True, compresstype='ZLIB', compresslevel=1))
+        assert_raises(
+            ValueError, cached_with_clause, get_options(appendonly=1, compresstype='ZLIB', compresslevel=True)
+        )
+
+    def test_partition_clause_value_types(self):
+        table = Table('sales', MetaData(), Column('id', Integer), Column('amount', Numeric))
+        ints = cached_partition_clause(table, RangePartition('amount', 0, 10, 5))
+        floats = cached_partition_clause(table, RangePartition('amount', 0.0, 10.0, 5.0))
+        assert floats == partition_clause(table, RangePartition('amount', 0.0, 10.0, 5.0))
+        assert floats != ints
+
+    def test_partition_clause(self):
+        first, second = get_partitioned_table('first'), get_partitioned_table('second')
+        clause = cached_partition_clause(first, first.dialect_options['hawq']['partition_by'])
+        assert clause == partition_clause(first, first.dialect_options['hawq']['partition_by'])
+        assert cached_partition_clause(second, second.dialect_options['hawq']['partition_by']) is clause
+
+    def test_partition_clause_by_column_type(self):
+        integers, texts = get_partitioned_table('integers'), get_partitioned_table('texts', Text)
+        assert "VALUES ('1')" not in cached_partition_clause(
+            integers, integers.dialect_options['hawq']['partition_by']
+        )
+        assert "VALUES ('1')" in cached_partition_clause(texts, texts.dialect_options['hawq']['partition_by'])
+
+    def test_partition_clause_missing_column(self):
+        table = get_partitioned_table('missing')
+        assert_raises(ValueError, cached_partition_clause, table, ListPartition('missing', {'a': 'a'}))
+
+    def test_lru(self):
+        cache = ClauseCache(maxsize=2)
+        for key in ['a', 'b', 'a', 'c']:
+            cache.get(key, lambda: key.upper())
+        assert cache.get('a', lambda: 'missed') == 'A'
+        assert cache.get('b', lambda: 'missed') == 'missed'
+
+    def test_same_ddl(self):
+        table = get_partitioned_table('same', Text)
+        cached = str(CreateTable(table).compile(dialect=HawqDialect()))
+        uncached = str(CreateTable(table).compile(dialect=HawqDialect(ddl_compile_cache=False)))
+        assert cached == uncached
@@ -0,0 +1,99 @@
+"""
+Tests partition exchange loading without connecting to live db.
+"""
+from sqlalchemy import Column, Integer, MetaData, Table, Text
+from sqlalchemy.testing import assert_raises
+from sqlalchemy.testing.suite import fixtures
+from collections import OrderedDict
+import contextlib
+
+from sqlalchemy_hawq.dialect import HawqDialect
+from sqlalchemy_hawq.exchange import PartitionExchange
+from sqlalchemy_hawq.partition import ListSubpartition, RangePartition
+
+
+def get_table():
+    return Table(
+        'sales',
+        MetaData(),
+        Column('id', Integer),
+        Column('year', Integer),
+        Column('region', Text),
+        schema='retail',
+        hawq_appendonly=True,
+        hawq_orientation='parquet',
+        hawq_distributed_by='id',
+        hawq_partition_by=RangePartition(
+            'year', 2000, 2010, 2, [ListSubpartition('region', OrderedDict([('east', 'e'), ('west', 'w')]))]
+        ),
+    )
+
+
+class ExchangeConnectionSpy:
+    def __init__(self):
+        self.dialect = HawqDialect()
+        self.statements = []
+        self.transactions = 0
+
+    @contextlib.contextmanager
+    def begin(self):
+        self.transactions += 1
+        yield
+
+    def execute(self, statement, *multiparams):
+        self.statements.append(str(statement.compile(dialect=self.dialect)).strip())
+
+
+class TestPartitionExchange(fixtures.TestBase):
+    def test_partition_path(self):
+        exchange = PartitionExchange(get_table())
+        assert exchange.partition_path({'year': 2005, 'region': 'w'}) == (2, 1)
+
+    def test_default_partition(self):
+        exchange = PartitionExchange(get_table())
+        assert_raises(ValueError, exchange.partition_path, {'year': 2015, 'region': 'w'})
+        assert_raises(ValueError, exchange.partition_path, {'year': 2005, 'region': 'n'})
+        assert_raises(ValueError, exchange.partition_path, {'year': 2005})
+
+    def test_validate(self):
+        exchange = PartitionExchange(get_table())
+        rows = [{'id': 1, 'year': 2004, 'region': 'e'}, {'id': 2, 'year': 2005, 'region': 'e'}]
+        exchange.validate(rows, (2, 0))
+        assert_raises(ValueError, exchange.validate, rows, (2, 1))
+        assert_raises(ValueError, exchange.validate, rows + [{'id': 3, 'year': 2006, 'region': 'e'}], (2, 0))
+
+    def test_staging_table(self):
+        exchange = PartitionExchange(get_table())
+        staging = exchange.staging_table((2, 0))
+        assert staging.name == 'sales_1_prt_4_2_prt_east__hawq_exchange'
+        assert staging.schema == 'retail'
+        assert staging.dialect_options['hawq']['orientation'] == 'parquet'
+        assert staging.dialect_options['hawq']['partition_by'] is None
+
+    def test_load(self):
+        connection = ExchangeConnectionSpy()
+        rows = [{'id': 1, 'year': 2004, 'region': 'e'}]
+        name = PartitionExchange(get_table()).load(
+            connection, {'year': 2004, 'region': 'e'}, rows, analyze=True
+        )
+        assert name == 'sales_1_prt_4_2_prt_east'
+        create, insert, analyze, alter, drop = connection.statements
+        assert create.startswith('CREATE TABLE retail.sales_1_prt_4_2_prt_east__hawq_exchange (')
+        assert 'WITH (appendonly=True, orientation=PARQUET)' in create
+        assert 'DISTRIBUTED BY (id)' in create
+        assert 'PARTITION BY' not in create
+        assert insert.startswith('INSERT INTO retail.sales_1_prt_4_2_prt_east__hawq_exchange')
+        assert analyze == 'ANALYZE retail.sales_1_prt_4_2_prt_east__hawq_exchange'
+        assert alter == (
+            "ALTER TABLE retail.sales ALTER PARTITION FOR (2004) EXCHANGE PARTITION FOR ('e') "
+            'WITH TABLE retail.sales_1_prt_4_2_prt_east__hawq_exchange WITHOUT VALIDATION'
+        )
+        assert drop == 'DROP TABLE retail.sales_1_prt_4_2_prt_east__hawq_exchange'
+        assert connection.transactions == 1
+
+    def test_load_misplaced_rows(self):
+        connection = ExchangeConnectionSpy()
+        rows = [{'id': 1, 'year': 2001, 'region': 'e'}]
+        exchange = PartitionExchange(get_table())
+        assert_raises(ValueError, exchange.load, connection, {'year': 2004, 'region': 'e'}, rows)
+        assert connection.statements == []
@@ -0,0 +1,216 @@
+"""
+Tests the parsing of EXPLAIN plans without connecting to live db.
+"""
+from types import SimpleNamespace
+
+from sqlalchemy import Column, Integer, MetaData, Table, select
+from sqlalchemy.testing.assertions import AssertsCompiledSQL, assert_raises
+from sqlalchemy.testing.suite import fixtures
+
+from sqlalchemy_hawq.dialect import HawqDialect
+from sqlalchemy_hawq.explain import Explain, parse_plan
+
+
+JOIN_PLAN = '''\
+Gather Motion 6:1  (slice3; segments: 6)  (cost=0.00..862.00 rows=10 width=16)
+  Merge Key: s.region_id
+  ->  Hash Join  (cost=0.00..862.00 rows=2 width=16)
+        Hash Cond: s.region_id = r.id
+        ->  Redistribute Motion 6:6  (slice1; segments: 6)  (cost=0.00..431.00 rows=2 width=12)
+              Hash Key: s.region_id
+              ->  Append  (cost=0.00..431.00 rows=2 width=12)
+                    ->  Parquet table Scan on sales_1_prt_2 s  (cost=0.00..215.00 rows=1 width=12)
+                          Filter: amount > 100::numeric
+                    ->  Parquet table Scan on sales_1_prt_3 s  (cost=0.00..215.00 rows=1 width=12)
+        ->  Hash  (cost=431.00..431.00 rows=5 width=8)
+              ->  Broadcast Motion 6:6  (slice2; segments: 6)  (cost=0.00..431.00 rows=5 width=8)
+                    ->  Parquet table Scan on regions r  (cost=0.00..431.00 rows=1 width=8)
+Settings:  default_hash_table_bucket_number=6
+Optimizer status: PQO version 1.684
+'''.splitlines()
+
+SELECTOR_PLAN = '''\
+Gather Motion 6:1  (slice1; segments: 6)  (cost=0.00..431.00 rows=1 width=12)
+  ->  Sequence  (cost=0.00..431.00 rows=1 width=12)
+        ->  Partition Selector for sales (dynamic scan id: 1)  (cost=10.00..100.00 rows=17 width=4)
+              Partitions selected: 3 (out of 3)
+        ->  Dynamic Table Scan on sales (dynamic scan id: 1)  (cost=0.00..431.00 rows=1 width=12)
+'''.splitlines()
+
+ANALYZE_PLAN = '''\
+Gather Motion 6:1  (slice1; segments: 6)  (cost=0.00..431.00 rows=10 width=12)
+  Rows out:  10 rows at destination with 3.1 ms to first row, 5.2 ms to end, start offset by 1.0 ms.
+  ->  Parquet table Scan on regions  (cost=0.00..431.00 rows=2 width=12)
+        Rows out:  Avg 2.0 rows x 5 workers.  Max 3 rows (seg0) with 1.2 ms to first row, 2.4 ms to end.
+Slice statistics:
+  (slice0)    Executor memory: 386K bytes.
+  (slice1)    Executor memory: 221K bytes avg x 6 workers, 221K bytes max (seg0).
+Total runtime: 6.301 ms
+'''.splitlines()
+
+
+def sales_partitions(relation):
+    if relation.startswith('sales_1_prt_'):
+        return 'sales', 2
+    return None
+
+
+class TestParsePlan(fixtures.TestBase):
+    def test_tree(self):
+        plan = parse_plan(JOIN_PLAN)
+        assert [node.node_type for node in plan.nodes()] == [
+            'Gather Motion',
+            'Hash Join',
+            'Redistribute Motion',
+            'Append',
+            'Parquet table Scan',
+            'Parquet table Scan',
+            'Hash',
+            'Broadcast Motion',
+            'Parquet table Scan',
+        ]
+        assert plan.root.children[0].details == ['Hash Cond: s.region_id = r.id']
+        assert plan.root.details == ['Merge Key: s.region_id']
+        assert plan.trailer == ['Settings:  default_hash_table_bucket_number=6', 'Optimizer status: PQO version 1.684']
+
+    def test_estimates(self):
+        plan = parse_plan(JOIN_PLAN)
+        assert plan.total_cost == 862.0
+        assert plan.rows == 10
+        scan = plan.nodes()[4]
+        assert (scan.startup_cost, scan.total_cost, scan.rows, scan.width) == (0.0, 215.0, 1, 12)
+        assert (scan.relation, scan.alias) == ('sales_1_prt_2', 's')
+        assert scan.details == ['Filter: amount > 100::numeric']
+
+    def test_motions_and_slices(self):
+        plan = parse_plan(JOIN_PLAN)
+        gather, redistribute, broadcast = [node for node in plan.nodes() if node.motion]
+        assert (gather.motion, gather.senders, gather.receivers) == ('gather', 6, 1)
+        assert (redistribute.motion, redistribute.slice, redistribute.segments) == ('redistribute', 1, 6)
+        assert broadcast.motion == 'broadcast'
+        assert [node.slice for node in plan.nodes()] == [3, 3, 1, 1, 1, 1, 3, 2, 2]
+        assert plan.slices() == {3: 6, 1: 6, 2: 6}
+
+    def test_partition_selector(self):
+        selector = parse_plan(SELECTOR_PLAN).nodes()[2]
+        assert selector.node_type == 'Partition Selector'
+        assert selector.relation == 'sales'
+        assert (selector.partitions_selected, selector.partitions_total) == (3, 3)
+
+    def test_analyze(self):
+        plan = parse_plan(ANALYZE_PLAN)
+        gather, scan = plan.nodes()
+        assert (gather.actual_rows, gather.actual_ms) == (10, 5.2)
+        assert (scan.actual_rows, scan.actual_ms) == (10, 2.4)
+        assert plan.total_runtime_ms == 6.301
+        assert len(plan.trailer) == 4
+
+    def test_no_plan(self):
+        assert_raises(ValueError, parse_plan, ['Settings:  optimizer=off'])
+
+    def test_unparsable_node(self):
+        assert_raises(ValueError, parse_plan, JOIN_PLAN[:2] + ['  ->  Hash Join'])
+
+
+class TestPlanWarnings(fixtures.TestBase):
+    def test_broadcast_motion(self):
+        warnings = parse_plan(JOIN_PLAN).warnings()
+        assert [(warning.kind, warning.node.node_type) for warning in warnings] == [
+            ('broadcast_motion', 'Broadcast Motion')
+        ]
+        assert 'slice 2' in warnings[0].message
+
+    def test_all_partitions_selected(self):
+        warnings = parse_plan(SELECTOR_PLAN).warnings()
+        assert [(warning.kind, warning.node.node_type) for warning in warnings] == [
+            ('unpruned_partition_scan', 'Partition Selector')
+        ]
+
+    def test_some_partitions_selected(self):
+        lines = [line.replace('3 (out of 3)', '1 (out of 3)') for line in SELECTOR_PLAN]
+        assert parse_plan(lines).warnings() == []
+
+    def test_all_leaf_partitions_scanned(self):
+        warnings = parse_plan(JOIN_PLAN).warnings(sales_partitions)
+        assert [(warning.kind, warning.node.node_type) for warning in warnings] == [
+            ('unpruned_partition_scan', 'Append'),
+            ('broadcast_motion', 'Broadcast Motion'),
+        ]
+        assert warnings[0].message == 'all 2 leaf partitions of sales are scanned'
+
+    def test_pruned_leaf_partitions(self):
+        warnings = parse_plan(JOIN_PLAN).warnings(lambda relation: sales_partitions(relation) and ('sales', 4))
+        assert [warning.kind for warning in warnings] == ['broadcast_motion']
+
+
+class ExplainConnectionSpy:
+    def __init__(self, lines):
+        self.lines = lines
+        self.statements = []
+        self.dialect = SimpleNamespace(default_schema_name='public')
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        return [(line,) for line in self.lines]
+
+
+class PartitionIndexStub:
+    def __init__(self):
+        self.children = {
+            'sales_1_prt_2': SimpleNamespace(schema='public', table='sales', level=0),
+            'sales_1_prt_3': SimpleNamespace(schema='public', table='sales', level=0),
+        }
+        self.lookups = []
+
+    def partition(self, connection, child_name, schema=None):
+        self.lookups.append((child_name, schema))
+        return self.children.get(child_name)
+
+    def partitions(self, connection, table_name, schema=None):
+        return list(self.children.values()) if table_name == 'sales' else []
+
+
+class TestExplain(fixtures.TestBase, AssertsCompiledSQL):
+    __dialect__ = HawqDialect()
+
+    def get_table(self):
+        return Table('regions', MetaData(), Column('id', Integer))
+
+    def test_compile(self):
+        table = self.get_table()
+        self.assert_compile(
+            Explain(select([table]).where(table.c.id == 5)),
+            'EXPLAIN SELECT regions.id FROM regions WHERE regions.id = %(id_1)s',
+            checkparams={'id_1': 5},
+        )
+
+    def test_compile_analyze(self):
+        self.assert_compile(Explain('SELECT 1', analyze=True), 'EXPLAIN ANALYZE SELECT 1')
+
+    def test_rewrite(self):
+        table = self.get_table()
+        compiled = Explain(table.update().where(table.c.id == 5).values(id=table.c.id + 1)).compile(
+            dialect=HawqDialect()
+        )
+        assert str(compiled) == (
+            'EXPLAIN SELECT CASE WHEN coalesce(regions.id = %(id_1)s, false) '
+            'THEN CAST(regions.id + %(id_2)s AS INTEGER) ELSE regions.id END AS id \nFROM regions'
+        )
+        assert not compiled.isupdate
+        assert compiled.hawq_rewrite_query is None
+
+    def test_several_statements(self):
+        table = self.get_table()
+        assert_raises(ValueError, Explain(table.delete()).compile, dialect=HawqDialect())
+        assert_raises(ValueError, Explain('SELECT 1; DROP TABLE regions').compile, dialect=HawqDialect())
+
+    def test_dialect_explain(self):
+        dialect = HawqDialect()
+        dialect.partition_index = PartitionIndexStub()
+        connection = ExplainConnectionSpy(JOIN_PLAN)
+        plan = dialect.explain(connection, 'SELECT * FROM sales', analyze=True)
+        statement, = connection.statements
+        assert isinstance(statement, Explain) and statement.analyze
+        assert [warning.kind for warning in plan.warnings()] == ['unpruned_partition_scan', 'broadcast_motion']
+        # regions is not named like a child table, so the catalog is not consulted for it
+        assert dialect.partition_index.lookups == [('sales_1_prt_2', None), ('sales_1_prt_3', None)]
@@ -0,0 +1,121 @@
+"""
+Tests the COPY TO export API without connecting to live db.
+"""
+from types import SimpleNamespace
+import io
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text, create_engine, select
+from sqlalchemy.testing.suite import fixtures
+from sqlalchemy.testing import assert_raises
+
+from sqlalchemy_hawq.export import (
+    copy_to,
+    copy_to_statement,
+    decode_text_field,
+    iter_copy_chunks,
+    iter_copy_rows,
+)
+from sqlalchemy_hawq.stats import HawqStatsCollector
+
+
+class CopyToCursorSpy:
+    def __init__(self, lines):
+        self.lines = lines
+        self.sql = None
+        self.rowcount = -1
+
+    def mogrify(self, sql, params):
+        return (sql % {k: repr(v) for k, v in params.items()}).encode('utf8')
+
+    def copy_expert(self, sql, sink):
+        self.sql = sql
+        for line in self.lines:
+            sink.write(line)
+        self.rowcount = len(self.lines)
+
+    def close(self):
+        pass
+
+
+def get_connection(lines=()):
+    dialect = create_engine('hawq://localhost/dummy_user', strategy='mock', executor=None).dialect
+    cursors = []
+
+    def cursor():
+        cursors.append(CopyToCursorSpy(lines))
+        return cursors[-1]
+
+    dbapi_connection = SimpleNamespace(cursor=cursor, encoding='UTF8', cancel=lambda: None)
+    return SimpleNamespace(dialect=dialect, connection=dbapi_connection), cursors
+
+
+def get_query():
+    table = Table('exporttable', MetaData(), Column('id', Integer), Column('name', Text))
+    return select([table]).where(table.c.id > 5)
+
+
+class TestCopyToStatement(fixtures.TestBase):
+    def test_csv_header(self):
+        connection, _ = get_connection()
+        sql = copy_to_statement(get_query(), connection, 'csv', header=True)
+        assert sql == (
+            'COPY (SELECT exporttable.id, exporttable.name \nFROM exporttable \n'
+            'WHERE exporttable.id > 5) TO STDOUT WITH CSV HEADER'
+        )
+
+    def test_text(self):
+        connection, _ = get_connection()
+        sql = copy_to_statement(get_query(), connection, 'text')
+        assert sql.endswith(') TO STDOUT')
+
+    def test_invalid_format(self):
+        connection, _ = get_connection()
+        assert_raises(ValueError, copy_to_statement, get_query(), connection, 'json')
+        assert_raises(ValueError, copy_to_statement, get_query(), connection, 'text', True)
+
+
+class TestCopyTo(fixtures.TestBase):
+    def test_sink(self):
+        connection, _ = get_connection([b'1,a\n', b'2,b\n'])
+        sink = io.BytesIO()
+        assert copy_to(connection, get_query(), sink) == 2
+        assert sink.getvalue() == b'1,a\n2,b\n'
+
+    def test_chunks(self):
+        lines = [b'%d,abcdefgh\n' % i for i in range(100)]
+        connection, _ = get_connection(lines)
+        chunks = list(iter_copy_chunks(connection, get_query(), chunk_size=64, max_chunks=2))
+        assert b''.join(chunks) == b''.join(lines)
+        assert len(chunks) > 1
+        assert max(len(chunk) for chunk in chunks) < 64 + len(lines[-1])
+
+    def test_chunks_closed_early(self):
+        lines = [b'%d,abcdefgh\n' % i for i in range(1000)]
+        connection, _ = get_connection(lines)
+        chunks = iter_copy_chunks(connection, get_query(), chunk_size=16, max_chunks=1)
+        next(chunks)
+        chunks.close()
+
+    def test_rows(self):
+        lines = [b'1\tfirst\\tvalue\n', b'2\t\\N\n', b'3\tlast\n']
+        connection, _ = get_connection(lines)
+        batches = list(iter_copy_rows(connection, get_query(), batch_size=2, chunk_size=4))
+        assert batches == [[('1', 'first\tvalue'), ('2', None)], [('3', 'last')]]
+
+    def test_stats(self):
+        connection, _ = get_connection([b'1,a\n', b'2,b\n'])
+        connection.dialect.stats_collector = HawqStatsCollector()
+        copy_to(connection, get_query(), io.BytesIO())
+        list(iter_copy_chunks(connection, get_query()))
+        copy = connection.dialect.stats_collector.snapshot()['kinds']['copy']
+        assert copy['count'] == 2
+        assert copy['bytes_sent'] == 2 * len(copy_to_statement(get_query(), connection))
+        assert copy['bytes_received'] == 16
+
+
+class TestDecodeTextField(fixtures.TestBase):
+    def test_null(self):
+        assert decode_text_field('\\N') is None
+
+    def test_escapes(self):
+        assert decode_text_field('a\\\\b\\nc\\101\\x42') == 'a\\b\ncAB'
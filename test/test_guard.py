@@ -0,0 +1,215 @@
+"""
+Tests the cost-based statement guard without connecting to live db.
+"""
+from sqlalchemy import Column, Integer, MetaData, Table, Text, select, text
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.sql.compiler import DDLCompiler
+from sqlalchemy.testing.assertions import assert_raises
+from sqlalchemy.testing.suite import fixtures
+
+from sqlalchemy_hawq.dialect import HawqDialect, HawqExecutionContext
+from sqlalchemy_hawq.guard import CostGuard, CostLimitExceeded, Estimate, RoutedCursor
+
+
+PLAN = [
+    'Gather Motion 6:1  (slice1; segments: 6)  (cost=0.00..5000.00 rows=200000 width=12)',
+    '  ->  Parquet table Scan on sales  (cost=0.00..4000.00 rows=33334 width=12)',
+]
+
+SALES = Table('sales', MetaData(), Column('id', Integer), Column('region', Text))
+
+
+class CursorSpy:
+    def __init__(self, name=None):
+        self.name = name
+        self.statements = []
+        self.closed = False
+
+    def execute(self, statement, parameters=None):
+        if parameters is not None:
+            # as psycopg2 does for any parameters, even none: %% is read as %, and a lone % fails
+            statement = statement % parameters
+        self.statements.append(statement)
+
+    def fetchall(self):
+        return [(line,) for line in PLAN]
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionSpy:
+    def __init__(self):
+        self.cursors = []
+        self.closed = False
+
+    def cursor(self, name=None):
+        cursor = CursorSpy(name)
+        self.cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        self.closed = True
+
+    def explained(self):
+        return [statement for cursor in self.cursors for statement in cursor.statements]
+
+
+class EngineStub:
+    def __init__(self):
+        self.connections = []
+
+    def raw_connection(self):
+        connection = ConnectionSpy()
+        self.connections.append(connection)
+        return connection
+
+
+def get_context(guard, statement, server_side=False, **execution_options):
+    dialect = HawqDialect()
+    compiled = statement.compile(dialect=dialect)
+    context = object.__new__(HawqExecutionContext)
+    context.dialect = dialect
+    context.compiled = compiled
+    context.execution_options = dict(execution_options, hawq_cost_guard=guard)
+    context.statement = str(compiled)
+    context.parameters = [compiled.construct_params()]
+    context.isddl = isinstance(compiled, DDLCompiler)
+    context.isinsert = getattr(compiled, 'isinsert', False)
+    context.isupdate = getattr(compiled, 'isupdate', False)
+    context.isdelete = getattr(compiled, 'isdelete', False)
+    context.executemany = False
+    context._is_server_side = server_side
+    context._dbapi_connection = ConnectionSpy()
+    context.cursor = CursorSpy()
+    return context
+
+
+class TestCostGuard(fixtures.TestBase):
+    def test_actions(self):
+        assert_raises(ValueError, CostGuard, action='drop')
+        assert_raises(ValueError, CostGuard, action='route')
+
+    def test_violations(self):
+        guard = CostGuard(max_cost=1000, max_rows=100)
+        assert guard.violations(Estimate(500.0, 10)) == []
+        assert guard.violations(Estimate(5000.0, 200000)) == [
+            'estimated cost 5000.0 over 1000',
+            'estimated rows 200000 over 100',
+        ]
+
+    def test_within_limits(self):
+        context = get_context(CostGuard(max_cost=10000), select([SALES]).where(SALES.c.id == 5))
+        context.pre_exec()
+        assert context._dbapi_connection.explained() == [
+            'EXPLAIN SELECT sales.id, sales.region \nFROM sales \nWHERE sales.id = 5'
+        ]
+        assert not context.cursor.closed
+
+    def test_literal_percent(self):
+        for statement, explained in [
+            (text("SELECT * FROM sales WHERE region LIKE 'x%'"), "EXPLAIN SELECT * FROM sales WHERE region LIKE 'x%'"),
+            (text('SELECT id % 2 FROM sales'), 'EXPLAIN SELECT id % 2 FROM sales'),
+        ]:
+            context = get_context(CostGuard(max_cost=10000), statement)
+            context.pre_exec()
+            assert context._dbapi_connection.explained() == [explained]
+
+    def test_no_parameters(self):
+        # the statement is then executed as it is, so it is explained as it is
+        context = get_context(CostGuard(max_cost=10000), text('SELECT id % 2 FROM sales'), no_parameters=True)
+        context.pre_exec()
+        assert context._dbapi_connection.explained() == ['EXPLAIN ' + context.statement]
+
+    def test_reject(self):
+        context = get_context(CostGuard(max_rows=1000), select([SALES]))
+        cursor = context.cursor
+        assert_raises(CostLimitExceeded, context.pre_exec)
+        assert cursor.closed
+
+    def test_log(self):
+        context = get_context(CostGuard(max_cost=1000, action='log'), select([SALES]))
+        context.pre_exec()
+        assert not context.cursor.closed
+
+    def test_estimates_are_cached(self):
+        guard = CostGuard(max_cost=10000)
+        first = get_context(guard, select([SALES]).where(SALES.c.id == 5))
+        second = get_context(guard, select([SALES]).where(SALES.c.id == 6))
+        first.pre_exec()
+        second.pre_exec()
+        assert len(first._dbapi_connection.explained()) == 1
+        assert second._dbapi_connection.explained() == []
+        guard.clear()
+        second.pre_exec()
+        assert len(second._dbapi_connection.explained()) == 1
+
+    def test_rewrite(self):
+        # only the query of the rewrite is explained, the rewrite is not run
+        update = SALES.update().where(SALES.c.id == 5).values(region='e')
+        context = get_context(CostGuard(max_cost=10000), update)
+        context.pre_exec()
+        explained, = context._dbapi_connection.explained()
+        assert explained.startswith('EXPLAIN SELECT sales.id, CASE WHEN coalesce(sales.id = 5, false)')
+        assert ';' not in explained
+        sent = context.statement % context.parameters[0]
+        assert 'INSERT INTO sales__hawq_swap ' + explained[len('EXPLAIN '):] in sent
+
+    def test_rewrite_is_not_routed(self):
+        fallback = EngineStub()
+        update = SALES.update().values(id=SALES.c.id + 1)
+        context = get_context(CostGuard(max_cost=1000, action='route', fallback=fallback), update)
+        assert_raises(CostLimitExceeded, context.pre_exec)
+        assert fallback.connections == []
+        assert all(statement.startswith('EXPLAIN SELECT') for statement in context._dbapi_connection.explained())
+
+    def test_unguarded_statements(self):
+        guard = CostGuard(max_cost=0)
+        for statement in [
+            CreateTable(SALES),
+            SALES.delete(),
+            text('TRUNCATE TABLE sales'),
+            text('ANALYZE sales'),
+            text('SELECT 1; DROP TABLE sales'),
+        ]:
+            context = get_context(guard, statement)
+            context.pre_exec()
+            assert context._dbapi_connection.explained() == []
+
+    def test_no_guard(self):
+        context = get_context(None, select([SALES]))
+        context.pre_exec()
+        assert context._dbapi_connection.explained() == []
+
+
+class TestRouting(fixtures.TestBase):
+    def test_route(self):
+        fallback = EngineStub()
+        context = get_context(CostGuard(max_cost=1000, action='route', fallback=fallback), select([SALES]))
+        cursor = context.cursor
+        context.pre_exec()
+        assert cursor.closed
+        assert isinstance(context.cursor, RoutedCursor)
+        connection, = fallback.connections
+        context.cursor.execute('SELECT * FROM sales', {})
+        assert connection.cursors[0].statements == ['SELECT * FROM sales']
+        context.cursor.close()
+        assert connection.cursors[0].closed and connection.closed
+
+    def test_route_server_side(self):
+        fallback = EngineStub()
+        context = get_context(
+            CostGuard(max_cost=1000, action='route', fallback=fallback), select([SALES]), server_side=True
+        )
+        context.pre_exec()
+        assert fallback.connections[0].cursors[0].name.startswith('c_routed_')
+
+    def test_writes_are_not_routed(self):
+        fallback = EngineStub()
+        archive = Table('archive', MetaData(), Column('id', Integer), Column('region', Text))
+        context = get_context(
+            CostGuard(max_cost=1000, action='route', fallback=fallback),
+            archive.insert().from_select(['id', 'region'], select([SALES])),
+        )
+        assert_raises(CostLimitExceeded, context.pre_exec)
+        assert fallback.connections == []
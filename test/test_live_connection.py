@@ -2,11 +2,12 @@
 Defines tests that require a live db connection.
 """
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer
+from sqlalchemy import Column, Integer, testing
 from sqlalchemy.exc import StatementError
 from sqlalchemy.testing.suite import fixtures
 from sqlalchemy.testing import assert_raises
 from sqlalchemy.orm import Session
+import psycopg2
 
 
 from sqlalchemy_hawq.point import Point
@@ -65,6 +66,40 @@ class TestWithLiveConnection(fixtures.DeclarativeMappedTest):
         expected = str(ins)
         assert expected == 'INSERT INTO test_schema.mocktable (id, test) VALUES (%(id)s, %(test)s)'
 
+    def test_orm_update(self):
+        """
+        Checks that the ORM can flush the update of an object, which is compiled to a
+        rewrite of the table and so reports no rowcount.
+        """
+        mocktable = self.classes.MockTable
+        session = Session()
+        session.add(mocktable(id=100, test=1))
+        session.commit()
+        row = session.query(mocktable).filter_by(id=100).one()
+        row.test = 2
+        session.commit()
+        session.close()
+
+        assert session.query(mocktable).filter_by(id=100).one().test == 2
+        session.close()
+
+    def test_orm_update_many(self):
+        """
+        Checks that the ORM can flush the update of several objects, which it sends as
+        an executemany UPDATE.
+        """
+        mocktable = self.classes.MockTable
+        session = Session()
+        session.add_all([mocktable(id=101, test=1), mocktable(id=102, test=1)])
+        session.commit()
+        for row in session.query(mocktable).filter(mocktable.id.in_([101, 102])):
+            row.test = 3
+        session.commit()
+        session.close()
+
+        assert [row.test for row in session.query(mocktable).filter(mocktable.id.in_([101, 102]))] == [3, 3]
+        session.close()
+
     def test_point_type_insert_select(self):
         """
         Checks that point type data can be inserted and selected.
@@ -152,3 +187,30 @@ class TestWithLiveConnection(fixtures.DeclarativeMappedTest):
                 session.close()
                 raise e
         assert_raises(StatementError, func)
+
+    def test_point_type_yield_per(self):
+        """
+        Checks that point type data is processed when streamed from a server-side cursor.
+        """
+        point_table = self.classes.PointTable
+        session = Session()
+        session.add_all([point_table(id=10 + i, ptest=(i, i + 1)) for i in range(5)])
+        session.commit()
+        session.close()
+
+        res = session.query(point_table).filter(point_table.id >= 10).order_by(point_table.id)
+        expected = [(i, i + 1) for i in range(5)]
+        assert expected == [row.ptest for row in res.yield_per(2)]
+        session.close()
+
+    def test_new_connection_not_in_transaction(self):
+        """
+        Checks that the connection setup (POINT typecaster) leaves new pool connections
+        idle, outside a transaction, so that AUTOCOMMIT can still be set on them.
+        """
+        testing.db.dispose()
+        with testing.db.connect() as first, testing.db.connect() as second:
+            for connection in (first, second):
+                assert connection.connection.connection.status == psycopg2.extensions.STATUS_READY
+            autocommit = second.execution_options(isolation_level='AUTOCOMMIT')
+            assert autocommit.execute('SELECT 1').scalar() == 1
@@ -0,0 +1,119 @@
+"""
+Tests staged merges without connecting to live db.
+"""
+from sqlalchemy import CheckConstraint, Column, Integer, MetaData, Table, Text
+from sqlalchemy.testing import assert_raises
+from sqlalchemy.testing.suite import fixtures
+import contextlib
+
+from sqlalchemy_hawq.dialect import HawqDialect
+from sqlalchemy_hawq.merge import MergeResult, StagedMerge
+from sqlalchemy_hawq.rewrite import view_dependency_check
+
+
+def get_table():
+    return Table(
+        'sales',
+        MetaData(),
+        Column('id', Integer),
+        Column('region', Text),
+        hawq_appendonly=True,
+        hawq_distributed_by='id',
+    )
+
+
+class CountResult:
+    def __init__(self, counts):
+        self.counts = counts
+
+    def first(self):
+        return self.counts
+
+
+class MergeConnectionSpy:
+    def __init__(self, counts):
+        self.counts = counts
+        self.dialect = HawqDialect()
+        self.statements = []
+        self.parameters = []
+        self.transactions = 0
+
+    @contextlib.contextmanager
+    def begin(self):
+        self.transactions += 1
+        yield
+
+    def execute(self, statement, *multiparams):
+        sql = str(statement.compile(dialect=self.dialect))
+        self.statements.append(sql)
+        self.parameters.append(multiparams)
+        if sql.startswith('SELECT count(*)'):
+            return CountResult(self.counts)
+        return None
+
+
+class TestStagedMerge(fixtures.TestBase):
+    def test_staging_table(self):
+        connection = MergeConnectionSpy((1, 0))
+        StagedMerge(get_table(), 'id').execute(connection, [{'id': 1, 'region': 'e'}])
+        create = connection.statements[0]
+        assert create.startswith('\nCREATE TEMPORARY TABLE sales__hawq_staging (')
+        assert 'ON COMMIT DROP' in create
+        assert 'DISTRIBUTED BY (id)' in create
+        assert connection.statements[1].startswith('INSERT INTO sales__hawq_staging (id, region) VALUES')
+        assert connection.statements[-1].strip() == 'DROP TABLE sales__hawq_staging'
+        assert connection.transactions == 1
+
+    def test_new_keys_are_appended(self):
+        connection = MergeConnectionSpy((2, 0))
+        rows = [{'id': 1, 'region': 'e'}, {'id': 2, 'region': 'w'}]
+        assert StagedMerge(get_table(), 'id').execute(connection, rows) == MergeResult(2, 0)
+        assert connection.statements[3].startswith(
+            'INSERT INTO sales (id, region) SELECT sales__hawq_staging.id, sales__hawq_staging.region'
+        )
+
+    def test_existing_keys_rewrite(self):
+        connection = MergeConnectionSpy((2, 1))
+        rows = [{'id': 1, 'region': 'e'}, {'id': 2, 'region': 'w'}]
+        assert StagedMerge(get_table(), 'id').execute(connection, rows) == MergeResult(1, 1)
+        merge = connection.statements[3]
+        assert merge.startswith(view_dependency_check('sales'))
+        assert ';\nCREATE TABLE sales__hawq_swap' in merge
+        assert 'WHERE NOT (EXISTS (SELECT *' in merge
+        assert 'WHERE sales__hawq_staging.id = sales.id)) UNION ALL SELECT' in merge
+        assert merge.endswith('ALTER TABLE sales__hawq_swap RENAME TO sales')
+
+    def test_rewrite_keeps_definition(self):
+        table = Table(
+            'sales',
+            MetaData(),
+            Column('id', Integer, nullable=False),
+            Column('region', Text, CheckConstraint("region <> ''"), server_default='e'),
+            hawq_distributed_by='id',
+        )
+        connection = MergeConnectionSpy((1, 1))
+        StagedMerge(table, 'id').execute(connection, [{'id': 1, 'region': 'w'}])
+        create = connection.statements[3].split(';\n')[1]
+        assert create.startswith('CREATE TABLE sales__hawq_swap (')
+        assert 'id INTEGER NOT NULL' in create
+        assert "region TEXT DEFAULT 'e' CHECK (region <> '')" in create
+        assert connection.statements[3].split(';\n')[2].startswith('INSERT INTO sales__hawq_swap SELECT')
+
+    def test_last_row_of_a_key(self):
+        connection = MergeConnectionSpy((1, 0))
+        rows = [{'id': 1, 'region': 'e'}, {'id': 1, 'region': 'w'}]
+        StagedMerge(get_table(), ['id']).execute(connection, rows)
+        assert connection.parameters[1] == ([{'id': 1, 'region': 'w'}],)
+
+    def test_no_rows(self):
+        connection = MergeConnectionSpy((0, 0))
+        assert StagedMerge(get_table(), 'id').execute(connection, []) == MergeResult(0, 0)
+        assert connection.statements == []
+
+    def test_count_query(self):
+        sql = str(StagedMerge(get_table(), ['id', 'region']).count_query().compile(dialect=HawqDialect()))
+        assert 'SELECT count(*) AS count_1, count(hawq_keys.id) AS count_2' in sql
+        assert 'ON hawq_keys.id = sales__hawq_staging.id AND hawq_keys.region = sales__hawq_staging.region' in sql
+
+    def test_missing_key_column(self):
+        assert_raises(ValueError, StagedMerge, get_table(), 'missing')
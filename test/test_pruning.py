@@ -0,0 +1,209 @@
+"""
+Tests client-side partition pruning without connecting to live db.
+"""
+from sqlalchemy import Column, Integer, MetaData, Table, Text, and_, bindparam, func, or_, select
+from sqlalchemy.testing.suite import fixtures
+from collections import OrderedDict
+import re
+
+from sqlalchemy_hawq.dialect import HawqDialect
+from sqlalchemy_hawq.partition import ListPartition, ListSubpartition, RangePartition
+from sqlalchemy_hawq.pruning import PartitionPruner
+
+
+def get_table():
+    return Table(
+        'sales',
+        MetaData(),
+        Column('id', Integer, primary_key=True, autoincrement=False),
+        Column('year', Integer),
+        Column('region', Text),
+        hawq_partition_by=RangePartition(
+            'year', 2000, 2010, 2, [ListSubpartition('region', OrderedDict([('east', 'e'), ('west', 'w')]))]
+        ),
+    )
+
+
+def years(names):
+    return sorted(set(re.match(r'sales_1_prt_(\w+?)_2_prt', name).group(1) for name in names))
+
+
+class TestRangePruning(fixtures.TestBase):
+    def test_equal(self):
+        table = get_table()
+        assert years(PartitionPruner(table).partitions(table.c.year == 2003)) == ['3']
+
+    def test_equal_outside_range(self):
+        table = get_table()
+        assert years(PartitionPruner(table).partitions(table.c.year == 2010)) == ['extra']
+
+    def test_comparisons(self):
+        table = get_table()
+        pruner = PartitionPruner(table)
+        assert years(pruner.partitions(table.c.year < 2002)) == ['2', 'extra']
+        assert years(pruner.partitions(table.c.year <= 2002)) == ['2', '3', 'extra']
+        assert years(pruner.partitions(table.c.year >= 2008)) == ['6', 'extra']
+        assert years(pruner.partitions(2008 <= table.c.year)) == ['6', 'extra']
+
+    def test_between_and_in(self):
+        table = get_table()
+        pruner = PartitionPruner(table)
+        assert years(pruner.partitions(table.c.year.between(2002, 2005))) == ['3', '4']
+        assert years(pruner.partitions(table.c.year.in_([2000, 2009]))) == ['2', '6']
+
+    def test_is_null(self):
+        table = get_table()
+        assert years(PartitionPruner(table).partitions(table.c.year == None)) == ['extra']  # noqa: E711
+
+    def test_and_or(self):
+        table = get_table()
+        pruner = PartitionPruner(table)
+        expression = or_(table.c.year == 2000, and_(table.c.year > 2001, table.c.year == 2004))
+        assert years(pruner.partitions(expression)) == ['2', '4']
+        assert years(pruner.partitions(and_(table.c.year == 2000, table.c.year == 2004))) == []
+
+    def test_other_columns_match_everything(self):
+        table = get_table()
+        names = PartitionPruner(table).partitions(or_(table.c.year == 2000, table.c.id == 1))
+        assert len(names) == 6 * 3
+
+    def test_parameters(self):
+        table = get_table()
+        pruner = PartitionPruner(table)
+        expression = table.c.year == bindparam('year')
+        assert len(pruner.partitions(expression)) == 6 * 3
+        assert years(pruner.partitions(expression, {'year': 2001})) == ['2']
+
+
+class TestListPruning(fixtures.TestBase):
+    def test_equal(self):
+        table = get_table()
+        names = PartitionPruner(table).partitions(and_(table.c.year == 2001, table.c.region == 'w'))
+        assert names == ['sales_1_prt_2_2_prt_west']
+
+    def test_unmapped_value(self):
+        table = get_table()
+        names = PartitionPruner(table).partitions(and_(table.c.year == 2001, table.c.region == 'n'))
+        assert names == ['sales_1_prt_2_2_prt_other']
+
+    def test_not_equal(self):
+        table = get_table()
+        names = PartitionPruner(table).partitions(and_(table.c.year == 2001, table.c.region != 'w'))
+        assert names == ['sales_1_prt_2_2_prt_east', 'sales_1_prt_2_2_prt_other']
+
+    def test_string_order(self):
+        # strings are ordered by the collation of the database, so no partition is pruned on their order
+        table = get_table()
+        names = PartitionPruner(table).partitions(and_(table.c.year == 2001, table.c.region < 'f'))
+        assert names == ['sales_1_prt_2_2_prt_east', 'sales_1_prt_2_2_prt_west', 'sales_1_prt_2_2_prt_other']
+        assert PartitionPruner(table).aligned_partitions(and_(table.c.year == 2000, table.c.region >= 'a')) is None
+
+    def test_numeric_list_order(self):
+        table = Table(
+            'scores',
+            MetaData(),
+            Column('grade', Integer),
+            hawq_partition_by=ListPartition('grade', OrderedDict([('low', 1), ('high', 9)])),
+        )
+        assert PartitionPruner(table).partitions(table.c.grade > 5) == ['scores_1_prt_high', 'scores_1_prt_other']
+
+    def test_top_level_list(self):
+        table = Table(
+            'regions',
+            MetaData(),
+            Column('region', Text),
+            hawq_partition_by=ListPartition('region', OrderedDict([('east', 'e')])),
+        )
+        pruner = PartitionPruner(table)
+        assert pruner.partitions(table.c.region.in_(['e'])) == ['regions_1_prt_east']
+
+
+class TestAlignedPartitions(fixtures.TestBase):
+    def test_range_boundaries(self):
+        table = get_table()
+        pruner = PartitionPruner(table)
+        assert pruner.aligned_partitions(and_(table.c.year >= 2002, table.c.year < 2006)) == [(1,), (2,)]
+        assert pruner.aligned_partitions(and_(table.c.year >= 2002, table.c.year < 2005)) is None
+
+    def test_default_partition_not_aligned(self):
+        table = get_table()
+        assert PartitionPruner(table).aligned_partitions(table.c.year >= 2002) is None
+
+    def test_subpartitions(self):
+        table = get_table()
+        pruner = PartitionPruner(table)
+        expression = and_(table.c.year >= 2000, table.c.year < 2002, table.c.region == 'w')
+        assert pruner.aligned_partitions(expression) == [(0, 1)]
+        expression = and_(table.c.year >= 2000, table.c.year < 2002, table.c.region.in_(['e', 'w']))
+        assert pruner.aligned_partitions(expression) == [(0, 0), (0, 1)]
+
+    def test_subpartition_of_every_partition(self):
+        table = get_table()
+        assert PartitionPruner(table).aligned_partitions(table.c.region == 'e') == [
+            (index, 0) for index in range(6)
+        ]
+
+    def test_other_columns_not_aligned(self):
+        table = get_table()
+        pruner = PartitionPruner(table)
+        assert pruner.aligned_partitions(table.c.id == 1) is None
+        assert pruner.aligned_partitions(and_(table.c.region == 'e', table.c.id == 1)) is None
+
+
+class TestUnionAll(fixtures.TestBase):
+    def test_union_all(self):
+        table = get_table()
+        query = select([table.c.id]).where(
+            and_(table.c.year == 2001, table.c.region.in_(['e', 'w']))
+        )
+        sql = str(PartitionPruner(table).union_all(query).compile(dialect=HawqDialect()))
+        assert sql.count('UNION ALL') == 1
+        assert 'FROM sales_1_prt_2_2_prt_east' in sql
+        assert 'FROM sales_1_prt_2_2_prt_west' in sql
+        assert 'sales.region IN' in sql
+        assert 'FROM sales ' not in sql
+
+    def compile_union_all(self, query):
+        table = query.froms[0]
+        rewritten = PartitionPruner(table).union_all(query)
+        return str(rewritten.compile(dialect=HawqDialect(), compile_kwargs={'literal_binds': True}))
+
+    def test_count(self):
+        table = get_table()
+        sql = self.compile_union_all(select([func.count()]).select_from(table).where(table.c.year.between(2003, 2004)))
+        # one count, over the rows of all the child tables
+        assert sql.count('count(*)') == 1
+        assert sql.startswith('SELECT count(*) AS count_1 \nFROM (SELECT')
+        assert sql.count('UNION ALL') == 5  # 2 years of 3 regions
+        assert sql.endswith(') AS sales \nWHERE sales.year BETWEEN 2003 AND 2004')
+
+    def test_order_by_limit(self):
+        table = get_table()
+        sql = self.compile_union_all(
+            select([table.c.id]).where(table.c.region == 'e').order_by(table.c.id).limit(5)
+        )
+        assert sql.count('UNION ALL') == 5
+        assert sql.count('ORDER BY') == 1
+        assert sql.count('LIMIT') == 1
+        assert sql.endswith(") AS sales \nWHERE sales.region = 'e' ORDER BY sales.id \n LIMIT 5")
+
+    def test_distinct(self):
+        table = get_table()
+        sql = self.compile_union_all(select([table.c.region]).distinct().where(table.c.year < 2004))
+        assert sql.count('DISTINCT') == 1
+        assert sql.startswith('SELECT DISTINCT sales.region \nFROM (SELECT')
+        assert sql.count('UNION ALL') == 8  # 3 years, with the default partition, of 3 regions
+
+    def test_single_partition(self):
+        table = get_table()
+        query = select([table]).where(and_(table.c.year == 2001, table.c.region == 'e'))
+        sql = str(PartitionPruner(table).union_all(query).compile(dialect=HawqDialect()))
+        assert 'UNION' not in sql
+        assert 'FROM sales_1_prt_2_2_prt_east' in sql
+
+    def test_no_partition(self):
+        table = get_table()
+        query = select([table]).where(and_(table.c.year == 2001, table.c.year == 2002))
+        sql = str(PartitionPruner(table).union_all(query).compile(dialect=HawqDialect()))
+        assert 'FROM sales' in sql
+        assert 'false' in sql.lower()
@@ -0,0 +1,221 @@
+"""
+Tests the shared reflection cache without connecting to live db.
+"""
+from types import SimpleNamespace
+import os
+import tempfile
+
+from sqlalchemy import Column, Integer, MetaData, Table
+from sqlalchemy.dialects.postgresql import VARCHAR
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.testing.suite import fixtures
+
+from sqlalchemy_hawq.dialect import HawqDialect
+from sqlalchemy_hawq.reflection import (
+    ReflectionCache,
+    multi_columns,
+    multi_table_options,
+    shared_cache,
+)
+
+
+class MarkerResult:
+    def __init__(self, marker):
+        self.marker = marker
+
+    def first(self):
+        return self.marker
+
+
+class MarkerConnectionSpy:
+    def __init__(self, marker=(1, 2, 3, 4, 5)):
+        self.marker = marker
+        self.schemas = []
+
+    def execute(self, statement, schema):
+        self.schemas.append(schema)
+        return MarkerResult(self.marker)
+
+
+class ReflectingDialect:
+    default_schema_name = 'public'
+
+    def __init__(self, reflection_cache):
+        self.reflection_cache = reflection_cache
+        self.calls = []
+
+    @shared_cache
+    def get_columns(self, connection, table_name, schema=None, **kw):
+        self.calls.append((table_name, schema))
+        return [{'name': 'id'}]
+
+
+class TestSharedCache(fixtures.TestBase):
+    def test_shared_across_inspectors(self):
+        dialect = ReflectingDialect(ReflectionCache())
+        connection = MarkerConnectionSpy()
+        assert dialect.get_columns(connection, 'sales', info_cache={}) == [{'name': 'id'}]
+        assert dialect.get_columns(MarkerConnectionSpy(), 'sales', info_cache={}) == [{'name': 'id'}]
+        assert dialect.calls == [('sales', None)]
+        assert connection.schemas == ['public']
+
+    def test_marker_read_once_per_inspector(self):
+        dialect = ReflectingDialect(ReflectionCache())
+        connection = MarkerConnectionSpy()
+        info_cache = {}
+        dialect.get_columns(connection, 'sales', info_cache=info_cache)
+        dialect.get_columns(connection, 'orders', 'public', info_cache=info_cache)
+        dialect.get_columns(connection, 'orders', schema='other', info_cache=info_cache)
+        assert connection.schemas == ['public', 'other']
+
+    def test_marker_change(self):
+        dialect = ReflectingDialect(ReflectionCache())
+        dialect.get_columns(MarkerConnectionSpy((1,)), 'sales', info_cache={})
+        dialect.get_columns(MarkerConnectionSpy((2,)), 'sales', info_cache={})
+        assert len(dialect.calls) == 2
+
+    def test_results_are_copied(self):
+        dialect = ReflectingDialect(ReflectionCache())
+        dialect.get_columns(MarkerConnectionSpy(), 'sales', info_cache={})[0]['name'] = 'changed'
+        assert dialect.get_columns(MarkerConnectionSpy(), 'sales', info_cache={}) == [{'name': 'id'}]
+
+    def test_without_info_cache(self):
+        dialect = ReflectingDialect(ReflectionCache())
+        connection = MarkerConnectionSpy()
+        dialect.get_columns(connection, 'sales')
+        dialect.get_columns(connection, 'sales')
+        assert len(dialect.calls) == 2
+        assert connection.schemas == []
+
+    def test_disabled(self):
+        dialect = ReflectingDialect(None)
+        dialect.get_columns(MarkerConnectionSpy(), 'sales', info_cache={})
+        dialect.get_columns(MarkerConnectionSpy(), 'sales', info_cache={})
+        assert len(dialect.calls) == 2
+
+    def test_persisted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'reflection.pickle')
+            dialect = ReflectingDialect(ReflectionCache(path))
+            dialect.get_columns(MarkerConnectionSpy(), 'sales', info_cache={})
+            dialect.reflection_cache.save()
+            dialect = ReflectingDialect(ReflectionCache(path))
+            assert dialect.get_columns(MarkerConnectionSpy(), 'sales', info_cache={}) == [{'name': 'id'}]
+            assert dialect.calls == []
+
+    def test_writable_by_others(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'reflection.pickle')
+            dialect = ReflectingDialect(ReflectionCache(path))
+            dialect.get_columns(MarkerConnectionSpy(), 'sales', info_cache={})
+            dialect.reflection_cache.save()
+            os.chmod(path, 0o666)
+            dialect = ReflectingDialect(ReflectionCache(path))
+            dialect.get_columns(MarkerConnectionSpy(), 'sales', info_cache={})
+            assert len(dialect.calls) == 1
+            dialect.reflection_cache.save()
+            assert os.stat(path).st_mode & 0o777 == 0o600
+
+    def test_dialect_arguments(self):
+        assert HawqDialect().reflection_cache is None
+        assert isinstance(HawqDialect(shared_reflection_cache=True).reflection_cache, ReflectionCache)
+        assert HawqDialect(reflection_cache_path='cache.pickle').reflection_cache.path == 'cache.pickle'
+
+
+class RowsConnectionSpy:
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+        self.dialect = SimpleNamespace(default_schema_name='public')
+
+    def execute(self, statement, **params):
+        self.statements.append((str(statement), params))
+        return list(self.rows)
+
+
+def get_dialect():
+    dialect = HawqDialect(shared_reflection_cache=False)
+    dialect.default_schema_name = 'public'
+    dialect.supports_native_enum = False
+    dialect._load_domains = lambda connection: {}
+    dialect.partition_index.load(RowsConnectionSpy([]))  # no partitioned tables
+    return dialect
+
+
+class TestMultiTableOptions(fixtures.TestBase):
+    def test_options(self):
+        connection = RowsConnectionSpy([
+            ('heap', 'h', None, None, None, None, 'pg_default', []),
+            ('ao', 'a', 'zlib', 5, [2, 1], 6, None, ['1:id', '2:year']),
+            ('parquet', 'p', 'snappy', 0, None, None, 'fast', []),
+        ])
+        options = multi_table_options(connection, 'public')
+        assert options == {
+            'heap': {'hawq_appendonly': False},
+            'ao': {
+                'hawq_appendonly': True,
+                'hawq_orientation': 'ROW',
+                'hawq_compresstype': 'ZLIB',
+                'hawq_compresslevel': 5,
+                'hawq_distributed_by': 'year, id',
+                'hawq_bucketnum': 6,
+            },
+            'parquet': {
+                'hawq_appendonly': True,
+                'hawq_orientation': 'PARQUET',
+                'hawq_compresstype': 'SNAPPY',
+                'hawq_compresslevel': 0,
+                'hawq_tablespace': 'fast',
+            },
+        }
+        assert connection.statements[0][1] == {'schema': 'public'}
+        assert 'c.relname = :table_name' not in connection.statements[0][0]
+
+    def test_round_trip(self):
+        connection = RowsConnectionSpy([('ao', 'a', 'zlib', 5, [1], 6, None, ['1:id'])])
+        options = multi_table_options(connection, 'public')['ao']
+        table = Table('ao', MetaData(), Column('id', Integer), **options)
+        sql = str(CreateTable(table).compile(dialect=HawqDialect()))
+        assert 'WITH (appendonly=True, orientation=ROW, compresstype=ZLIB, compresslevel=5, bucketnum=6)' in sql
+        assert 'DISTRIBUTED BY (id)' in sql
+
+
+class TestMultiColumns(fixtures.TestBase):
+    def test_columns(self):
+        connection = RowsConnectionSpy([
+            ('sales', 'id', 'integer', None, True, 1, None),
+            ('sales', 'name', 'character varying(10)', None, False, 2, 'the name'),
+            ('orders', 'id', 'bigint', None, True, 1, None),
+        ])
+        columns = multi_columns(get_dialect(), connection, 'public')
+        assert sorted(columns) == ['orders', 'sales']
+        assert [column['name'] for column in columns['sales']] == ['id', 'name']
+        assert isinstance(columns['sales'][1]['type'], VARCHAR)
+        assert columns['sales'][1]['type'].length == 10
+        assert columns['sales'][1]['comment'] == 'the name'
+        assert not columns['orders'][0]['nullable']
+
+
+class TestBulkReflection(fixtures.TestBase):
+    def test_single_table_without_listing(self):
+        dialect = get_dialect()
+        connection = RowsConnectionSpy([('ao', 'a', None, None, None, None, None, [])])
+        options = dialect.get_table_options(connection, 'ao', info_cache={})
+        assert options == {'hawq_appendonly': True, 'hawq_orientation': 'ROW'}
+        statement, params = connection.statements[0]
+        assert 'c.relname = :table_name' in statement
+        assert params == {'schema': 'public'}
+
+    def test_bulk_after_listing(self):
+        dialect = get_dialect()
+        info_cache = {}
+        listing = RowsConnectionSpy([('ao',), ('heap',)])
+        assert dialect.get_table_names(listing, info_cache=info_cache) == ['ao', 'heap']
+        connection = RowsConnectionSpy([
+            ('ao', 'a', None, None, None, None, None, []),
+            ('heap', 'h', None, None, None, None, None, []),
+        ])
+        assert dialect.get_table_options(connection, 'ao', info_cache=info_cache)['hawq_appendonly']
+        assert not dialect.get_table_options(connection, 'heap', info_cache=info_cache)['hawq_appendonly']
+        assert len(connection.statements) == 1
+        assert 'c.relname = :table_name' not in connection.statements[0][0]
@@ -0,0 +1,61 @@
+"""
+Tests the adaptive fetch size of server-side cursor results without connecting to live db.
+"""
+import collections
+
+from sqlalchemy.testing.suite import fixtures
+
+from sqlalchemy_hawq.result import AdaptiveBufferedRowResultProxy, estimate_row_width
+
+
+class FetchCursorSpy:
+    def __init__(self, rows):
+        self.rows = collections.deque(rows)
+        self.sizes = []
+
+    def fetchmany(self, size):
+        self.sizes.append(size)
+        return [self.rows.popleft() for _ in range(min(size, len(self.rows)))]
+
+
+def get_result(rows, buffer_bytes=1024 * 1024, fetch_seconds=60, max_row_buffer=None):
+    result = object.__new__(AdaptiveBufferedRowResultProxy)
+    result.cursor = FetchCursorSpy(rows)
+    result._max_row_buffer = max_row_buffer
+    result._buffer_bytes = buffer_bytes
+    result._fetch_seconds = fetch_seconds
+    result._bufsize = 1
+    result._row_cap = None
+    result._rowbuffer = collections.deque()
+    return result
+
+
+class TestAdaptiveFetchSize(fixtures.TestBase):
+    def test_grows_while_fetches_are_fast(self):
+        result = get_result([(i,) for i in range(100)])
+        rows = result._fetchall_impl()
+        assert rows == [(i,) for i in range(100)]
+        assert result.cursor.sizes[:5] == [1, 2, 4, 8, 16]
+
+    def test_shrinks_when_fetches_are_slow(self):
+        result = get_result([(i,) for i in range(100)], fetch_seconds=-1)
+        result._bufsize = 16
+        result._buffer_rows()
+        assert result._bufsize == 8
+
+    def test_capped_by_row_width(self):
+        row = ('x' * 1000,)
+        result = get_result([row] * 100, buffer_bytes=estimate_row_width(row) * 3)
+        result._fetchall_impl()
+        assert max(result.cursor.sizes) == 3
+
+    def test_capped_by_max_row_buffer(self):
+        result = get_result([(i,) for i in range(100)], max_row_buffer=5)
+        assert len(result._fetchmany_impl(12)) == 12
+        assert max(result.cursor.sizes) == 5
+
+    def test_fetchone(self):
+        result = get_result([(1,), (2,)])
+        assert result._fetchone_impl() == (1,)
+        assert result._fetchone_impl() == (2,)
+        assert result._fetchone_impl() is None
@@ -0,0 +1,317 @@
+"""
+Tests the rewrites of DML for append-only tables without connecting to live db.
+"""
+from sqlalchemy import CheckConstraint, Column, Integer, MetaData, Table, Text, and_, bindparam, text
+from sqlalchemy.testing import assert_raises
+from sqlalchemy.testing.suite import fixtures
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from sqlalchemy_hawq.dialect import HawqDialect
+from sqlalchemy_hawq.partition import ListSubpartition, RangePartition
+from sqlalchemy_hawq.rewrite import TableRewrite, swap_table_name, update_values, view_dependency_check
+
+
+def get_table(**kwargs):
+    return Table(
+        'sales',
+        MetaData(),
+        Column('id', Integer),
+        Column('year', Integer),
+        Column('region', Text),
+        **kwargs
+    )
+
+
+def get_partitioned_table():
+    return get_table(
+        hawq_appendonly=True,
+        hawq_distributed_by='id',
+        hawq_partition_by=RangePartition(
+            'year', 2000, 2010, 2, [ListSubpartition('region', OrderedDict([('east', 'e'), ('west', 'w')]))]
+        ),
+    )
+
+
+def compile_statements(statement):
+    sql = str(statement.compile(dialect=HawqDialect(), compile_kwargs={'literal_binds': True}))
+    return sql.split(';\n')
+
+
+class TestDeleteTruncatesPartitions(fixtures.TestBase):
+    def test_partitions(self):
+        table = get_partitioned_table()
+        statements = compile_statements(
+            table.delete().where(and_(table.c.year >= 2002, table.c.year < 2006))
+        )
+        assert statements == [
+            'ALTER TABLE sales TRUNCATE PARTITION FOR (2002)',
+            'ALTER TABLE sales TRUNCATE PARTITION FOR (2004)',
+        ]
+
+    def test_subpartitions(self):
+        table = get_partitioned_table()
+        statements = compile_statements(
+            table.delete().where(and_(table.c.year.in_([2000, 2001]), table.c.region == 'w'))
+        )
+        # equality only covers the partitions of a single integer, not [2000, 2002)
+        assert statements[2].startswith('INSERT INTO sales__hawq_swap')
+        statements = compile_statements(
+            table.delete().where(and_(table.c.year >= 2000, table.c.year < 2002, table.c.region == 'w'))
+        )
+        assert statements == [
+            "ALTER TABLE sales ALTER PARTITION FOR (2000) TRUNCATE PARTITION FOR ('w')"
+        ]
+
+    def test_default_subpartition(self):
+        table = get_partitioned_table()
+        statements = compile_statements(table.delete().where(table.c.region == 'e'))
+        assert statements[-1] == "ALTER TABLE sales ALTER PARTITION extra TRUNCATE PARTITION FOR ('e')"
+        assert len(statements) == 6
+
+
+class TestExecutionParameters(fixtures.TestBase):
+    def test_execution_parameter_is_not_pruned_on(self):
+        table = get_partitioned_table()
+        delete = table.delete().where(table.c.year == bindparam('y', value=2003))
+        # executed with {'y': 2005}: the partition of 2003 must not be truncated
+        compiled = delete.compile(dialect=HawqDialect(), column_keys=['y'])
+        statements = str(compiled).split(';\n')
+        assert not any('TRUNCATE' in statement for statement in statements)
+        assert 'WHERE NOT coalesce((sales.year = %(y)s), false)' in statements[2]
+        assert compiled.construct_params({'y': 2005}) == {'y': 2005}
+
+    def test_compile_time_value_is_pruned_on(self):
+        table = get_partitioned_table()
+        delete = table.delete().where(and_(table.c.year >= bindparam('y', value=2002), table.c.year < 2004))
+        assert str(delete.compile(dialect=HawqDialect())) == 'ALTER TABLE sales TRUNCATE PARTITION FOR (2002)'
+
+    def test_callable_value_is_not_pruned_on(self):
+        table = get_partitioned_table()
+        delete = table.delete().where(table.c.year == bindparam('y', callable_=lambda: 2003))
+        assert 'TRUNCATE' not in str(delete.compile(dialect=HawqDialect()))
+
+
+class TestDeleteRewritesTable(fixtures.TestBase):
+    def test_create_table(self):
+        table = get_table(
+            schema='genomics',
+            hawq_appendonly=True,
+            hawq_orientation='parquet',
+            hawq_compresstype='SNAPPY',
+            hawq_distributed_by='id',
+            hawq_tablespace='fast',
+        )
+        statements = compile_statements(table.delete().where(table.c.year < 2000))
+        assert statements == [
+            view_dependency_check('genomics.sales'),
+            'CREATE TABLE genomics.sales__hawq_swap (\n\tid INTEGER, \n\tyear INTEGER, \n\tregion TEXT\n)\n'
+            'WITH (appendonly=True, orientation=PARQUET, compresstype=SNAPPY)\n'
+            ' TABLESPACE fast\n'
+            'DISTRIBUTED BY (id)',
+            'INSERT INTO genomics.sales__hawq_swap '
+            'SELECT * FROM genomics.sales WHERE NOT coalesce((genomics.sales.year < 2000), false)',
+            'DROP TABLE genomics.sales',
+            'ALTER TABLE genomics.sales__hawq_swap RENAME TO sales',
+        ]
+
+    def test_constraints_are_kept(self):
+        table = Table(
+            'sales',
+            MetaData(),
+            Column('id', Integer, nullable=False),
+            Column('year', Integer, server_default=text('2000')),
+            Column('amount', Integer, CheckConstraint('amount > 0')),
+        )
+        create = compile_statements(table.delete().where(table.c.year < 2000))[1]
+        assert 'id INTEGER NOT NULL' in create
+        assert 'year INTEGER DEFAULT 2000' in create
+        assert 'CHECK (amount > 0)' in create
+
+    def test_temporary_table(self):
+        table = get_table(prefixes=['TEMPORARY'], hawq_on_commit='preserve rows')
+        create = compile_statements(table.delete().where(table.c.year < 2000))[1]
+        assert create.startswith('CREATE TEMPORARY TABLE sales__hawq_swap (')
+        assert 'ON COMMIT PRESERVE ROWS' in create
+
+    def test_partitioned_table(self):
+        table = get_partitioned_table()
+        statements = compile_statements(table.delete().where(table.c.id == 3))
+        assert statements[0] == view_dependency_check('sales')
+        assert statements[1].startswith('CREATE TABLE sales__hawq_swap (')
+        assert 'DISTRIBUTED BY (id)' in statements[1]
+        assert 'PARTITION BY RANGE (year)' in statements[1]
+        assert statements[2:] == [
+            'INSERT INTO sales__hawq_swap SELECT * FROM sales WHERE NOT coalesce((sales.id = 3), false)',
+            'DROP TABLE sales',
+            'ALTER TABLE sales__hawq_swap RENAME TO sales',
+        ]
+
+    def test_unaligned_filter(self):
+        table = get_partitioned_table()
+        statements = compile_statements(table.delete().where(table.c.year >= 2002))
+        assert statements[2].startswith('INSERT INTO sales__hawq_swap')
+
+    def test_view_dependency_check_first(self):
+        table = get_table(schema="o'hara")
+        statements = compile_statements(table.delete().where(table.c.year < 2000))
+        assert statements[0] == view_dependency_check('"o\'hara".sales')
+        assert "d.refobjid = '\"o''hara\".sales'::regclass" in statements[0]
+        assert statements[0].endswith('WHERE array_upper(t.views, 1) > 0')
+
+    def test_comments_are_kept(self):
+        table = Table(
+            'sales',
+            MetaData(),
+            Column('id', Integer, comment='the sale'),
+            Column('year', Integer),
+            comment="sales, by year's end",
+        )
+        statements = compile_statements(table.delete().where(table.c.year < 2000))
+        assert statements[-4:-2] == [
+            "COMMENT ON TABLE sales__hawq_swap IS 'sales, by year''s end'",
+            "COMMENT ON COLUMN sales__hawq_swap.id IS 'the sale'",
+        ]
+        assert statements[-2] == 'DROP TABLE sales'
+
+    def test_swap_table_name(self):
+        assert swap_table_name('sales') == 'sales__hawq_swap'
+        assert len(swap_table_name('x' * 63)) == 63
+
+
+class TestUpdateRewritesTable(fixtures.TestBase):
+    def test_filtered_update(self):
+        table = get_table(hawq_appendonly=True, hawq_distributed_by='id')
+        statements = compile_statements(
+            table.update().where(table.c.year < 2000).values(region='old', year=table.c.year + 1)
+        )
+        assert statements == [
+            view_dependency_check('sales'),
+            'CREATE TABLE sales__hawq_swap (\n\tid INTEGER, \n\tyear INTEGER, \n\tregion TEXT\n)\n'
+            'WITH (appendonly=True)\n'
+            'DISTRIBUTED BY (id)',
+            'INSERT INTO sales__hawq_swap SELECT sales.id, '
+            'CASE WHEN coalesce(sales.year < 2000, false) THEN CAST(sales.year + 1 AS INTEGER) '
+            'ELSE sales.year END AS year, '
+            "CASE WHEN coalesce(sales.year < 2000, false) THEN CAST('old' AS TEXT) "
+            'ELSE sales.region END AS region \n'
+            'FROM sales',
+            'DROP TABLE sales',
+            'ALTER TABLE sales__hawq_swap RENAME TO sales',
+        ]
+
+    def test_unfiltered_update(self):
+        table = get_table()
+        statements = compile_statements(table.update().values(region='all'))
+        assert statements[2].startswith(
+            "INSERT INTO sales__hawq_swap SELECT sales.id, sales.year, CAST('all' AS TEXT) AS region"
+        )
+
+    def test_execution_parameters(self):
+        table = get_table()
+        update = table.update().where(table.c.id == bindparam('b_id'))
+        compiled = update.compile(dialect=HawqDialect(), column_keys=['region', 'b_id'])
+        assert 'CASE WHEN coalesce(sales.id = %(b_id)s, false) THEN CAST(%(region)s AS TEXT)' in str(compiled)
+        assert compiled.construct_params({'region': 'e', 'b_id': 1}) == {'region': 'e', 'b_id': 1}
+
+    def test_partitioned_table(self):
+        table = get_partitioned_table()
+        statements = compile_statements(table.update().values(id=table.c.id * 2))
+        assert 'PARTITION BY RANGE (year)' in statements[1]
+        assert statements[2].startswith(
+            'INSERT INTO sales__hawq_swap SELECT CAST(sales.id * 2 AS INTEGER) AS id, sales.year'
+        )
+
+    def test_definition_is_kept(self):
+        table = Table(
+            'sales',
+            MetaData(),
+            Column('id', Integer, nullable=False),
+            Column('year', Integer, server_default=text('2000')),
+            Column('amount', Integer, CheckConstraint('amount > 0')),
+            prefixes=['TEMPORARY'],
+            hawq_on_commit='delete rows',
+        )
+        statements = compile_statements(table.update().values(amount=table.c.amount + 1))
+        create = statements[1]
+        assert create.startswith('CREATE TEMPORARY TABLE sales__hawq_swap (')
+        assert 'id INTEGER NOT NULL' in create
+        assert 'year INTEGER DEFAULT 2000' in create
+        assert 'CHECK (amount > 0)' in create
+        assert 'ON COMMIT DELETE ROWS' in create
+        assert statements[2].startswith('INSERT INTO sales__hawq_swap SELECT sales.id, sales.year, CAST(')
+
+    def test_unknown_column(self):
+        table = get_table()
+        assert_raises(ValueError, update_values, table, table.update().values({'missing': 1}))
+
+
+class TestTableRewrite(fixtures.TestBase):
+    def test_one_rewrite(self):
+        table = get_table()
+        rewrite = TableRewrite(table, [
+            table.update().where(table.c.year < 2000).values(year=table.c.year + 100),
+            table.delete().where(table.c.year == 2000),
+            table.update().where(table.c.year == 2099).values(region='r'),
+        ])
+        statements = compile_statements(rewrite)
+        assert len(statements) == 5
+        sql = statements[2]
+        assert sql.count('FROM sales') == 1
+        # each statement selects from the rows the previous ones left
+        assert 'THEN CAST(sales.year + 100 AS INTEGER) ELSE sales.year END AS year' in sql
+        assert 'FROM sales) AS anon_2 \nWHERE NOT coalesce(anon_2.year = 2000, false)) AS anon_1' in sql
+        assert 'CASE WHEN coalesce(anon_1.year = 2099, false)' in sql
+
+    def test_only_statements_of_the_table(self):
+        table = get_table()
+        other = Table('other', MetaData(), Column('id', Integer))
+        rewrite = TableRewrite(table)
+        assert_raises(ValueError, rewrite.add, other.update().values(id=1))
+        assert_raises(ValueError, rewrite.add, table.insert().values(id=1))
+        assert_raises(ValueError, rewrite.compile, dialect=HawqDialect())
+
+
+class CursorSpy:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement, parameters):
+        self.statements.append((statement, parameters))
+
+    def executemany(self, statement, parameters):
+        raise AssertionError('executemany of a rewrite')
+
+
+class TestRowcount(fixtures.TestBase):
+    def test_no_sane_rowcount(self):
+        # so that the ORM does not raise StaleDataError on the rowcount of a rewrite
+        dialect = HawqDialect()
+        assert not dialect.supports_sane_rowcount
+        assert not dialect.supports_sane_multi_rowcount
+
+    def test_compiled_kind(self):
+        # the execution context takes isupdate and isdelete from the compiled statement
+        table = get_table()
+        assert table.update().values(region='e').compile(dialect=HawqDialect()).isupdate
+        assert table.delete().where(table.c.id == 1).compile(dialect=HawqDialect()).isdelete
+        assert table.delete().compile(dialect=HawqDialect()).isdelete
+
+    def test_executemany_update(self):
+        # as the ORM sends the flush of several changed objects
+        table = get_table()
+        compiled = table.update().where(table.c.id == bindparam('b_id')).compile(
+            dialect=HawqDialect(), column_keys=['region', 'b_id']
+        )
+        context = SimpleNamespace(isupdate=compiled.isupdate, isdelete=compiled.isdelete)
+        statement = str(compiled)
+        parameters = [{'region': 'e', 'b_id': 1}, {'region': 'w', 'b_id': 2}]
+        cursor = CursorSpy()
+        HawqDialect().do_executemany(cursor, statement, parameters, context)
+        assert cursor.statements == [(statement, parameters[0]), (statement, parameters[1])]
+
+    def test_executemany_delete(self):
+        context = SimpleNamespace(isupdate=False, isdelete=True)
+        cursor = CursorSpy()
+        HawqDialect().do_executemany(cursor, 'DELETE', [{'id': 1}, {'id': 2}], context)
+        assert len(cursor.statements) == 2
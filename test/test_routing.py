@@ -0,0 +1,184 @@
+"""
+Tests client-side partition routing without connecting to live db.
+"""
+from sqlalchemy import Column, Integer, MetaData, Table, Text
+from sqlalchemy.testing.suite import fixtures
+from sqlalchemy.testing import assert_raises
+from collections import OrderedDict
+import pytest
+
+from sqlalchemy_hawq import partition, routing
+from sqlalchemy_hawq.dialect import HawqDialect
+from sqlalchemy_hawq.partition import (
+    ListPartition,
+    ListSubpartition,
+    RangePartition,
+    RangeSubpartition,
+)
+from sqlalchemy_hawq.routing import PartitionRouter, child_table_name
+
+
+def get_table(partition_by):
+    return Table(
+        'sales',
+        MetaData(),
+        Column('id', Integer, primary_key=True, autoincrement=False),
+        Column('year', Integer),
+        Column('region', Text),
+        hawq_partition_by=partition_by,
+    )
+
+
+class ConnectionSpy:
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, statement, parameters):
+        self.executed.append((statement.table.name, parameters))
+
+
+class PurePythonMixin:
+    """
+    Runs the tests without the numpy-vectorized paths
+    """
+
+    def setup(self):
+        self.numpy = partition.numpy
+        partition.numpy = routing.numpy = None
+
+    def teardown(self):
+        partition.numpy = routing.numpy = self.numpy
+
+
+class TestPartitionIndexes(fixtures.TestBase):
+    def setup(self):
+        pytest.importorskip('numpy')
+
+    def test_range_names(self):
+        assert RangePartition('year', 2000, 2010, 4).partition_names() == ['2', '3', '4', 'extra']
+
+    def test_range_indexes(self):
+        level = RangePartition('year', 2000, 2010, 4)
+        column = get_table(level).c.year
+        indexes = level.partition_indexes(column, [1999, 2000, 2003, 2004, 2009, 2010])
+        assert list(indexes) == [3, 0, 0, 1, 2, 3]
+
+    def test_range_indexes_null(self):
+        level = RangePartition('year', 2000, 2010, 4)
+        column = get_table(level).c.year
+        assert list(level.partition_indexes(column, [None, 2005])) == [3, 1]
+
+    def test_list_names(self):
+        level = ListPartition('region', OrderedDict([('east', 'e'), ('west', 'w')]))
+        assert level.partition_names() == ['east', 'west', 'other']
+
+    def test_list_indexes(self):
+        level = ListPartition('region', OrderedDict([('east', 'e'), ('west', 'w')]))
+        column = get_table(level).c.region
+        assert list(level.partition_indexes(column, ['w', 'e', 'n', 'w'])) == [1, 0, 2, 1]
+        assert list(level.partition_indexes(column, ['w', None])) == [1, 2]
+
+    def test_list_indexes_cast(self):
+        level = ListPartition('year', OrderedDict([('y2000', '2000'), ('y2001', '2001')]))
+        column = get_table(level).c.year
+        assert list(level.partition_indexes(column, [2001, 2000, 1999])) == [1, 0, 2]
+
+
+class TestPartitionIndexesPython(PurePythonMixin, TestPartitionIndexes):
+    pass
+
+
+class TestPartitionRouter(fixtures.TestBase):
+    def setup(self):
+        pytest.importorskip('numpy')
+
+    def test_child_table_name(self):
+        assert child_table_name('sales', ['2', 'extra']) == 'sales_1_prt_2_2_prt_extra'
+
+    def test_not_partitioned(self):
+        assert_raises(ValueError, PartitionRouter, get_table(None))
+
+    def test_bucket_range(self):
+        router = PartitionRouter(get_table(RangePartition('year', 2000, 2010, 5)))
+        rows = [{'id': 1, 'year': 2001}, {'id': 2, 'year': 2020}, {'id': 3, 'year': 2000}]
+        assert router.bucket(rows) == {
+            'sales_1_prt_2': [rows[0], rows[2]],
+            'sales_1_prt_extra': [rows[1]],
+        }
+
+    def test_bucket_subpartitions(self):
+        router = PartitionRouter(
+            get_table(
+                ListPartition(
+                    'region',
+                    OrderedDict([('east', 'e'), ('west', 'w')]),
+                    [RangeSubpartition('year', 2000, 2002, 1)],
+                )
+            )
+        )
+        rows = [
+            {'id': 1, 'region': 'w', 'year': 2001},
+            {'id': 2, 'region': 'x', 'year': 2000},
+            {'id': 3, 'region': 'w', 'year': 1999},
+        ]
+        assert router.bucket(rows) == {
+            'sales_1_prt_west_2_prt_3': [rows[0]],
+            'sales_1_prt_other_2_prt_2': [rows[1]],
+            'sales_1_prt_west_2_prt_extra': [rows[2]],
+        }
+
+    def test_leaf_names(self):
+        router = PartitionRouter(
+            get_table(
+                RangePartition(
+                    'year', 2000, 2002, 1, [ListSubpartition('region', OrderedDict([('east', 'e')]))]
+                )
+            )
+        )
+        assert router.leaf_names() == [
+            'sales_1_prt_2_2_prt_east',
+            'sales_1_prt_2_2_prt_other',
+            'sales_1_prt_3_2_prt_east',
+            'sales_1_prt_3_2_prt_other',
+            'sales_1_prt_extra_2_prt_east',
+            'sales_1_prt_extra_2_prt_other',
+        ]
+
+    def test_insert(self):
+        router = PartitionRouter(get_table(RangePartition('year', 2000, 2010, 5)))
+        connection = ConnectionSpy()
+        rows = [{'id': 1, 'year': 2001}, {'id': 2, 'year': 2005}, {'id': 3, 'year': 2002}]
+        counts = router.insert(connection, rows)
+        assert counts == {'sales_1_prt_2': 2, 'sales_1_prt_3': 1}
+        assert sorted(connection.executed) == [
+            ('sales_1_prt_2', [rows[0], rows[2]]),
+            ('sales_1_prt_3', [rows[1]]),
+        ]
+        assert [column.name for column in router.child_table('sales_1_prt_2').columns] == [
+            'id',
+            'year',
+            'region',
+        ]
+
+    def test_child_table_columns(self):
+        table = Table(
+            'sales',
+            MetaData(),
+            Column('id', Integer, primary_key=True, autoincrement=False),
+            Column('year', Integer, nullable=False),
+            Column('region', Text, key='area', default='unknown', onupdate='moved'),
+            hawq_partition_by=RangePartition('year', 2000, 2010, 5),
+        )
+        child = PartitionRouter(table).child_table('sales_1_prt_2')
+        assert [column.name for column in child.primary_key] == ['id']
+        assert not child.c.year.nullable
+        assert child.c.area.default.arg == 'unknown'
+        assert child.c.area.onupdate.arg == 'moved'
+        compiled = child.insert().compile(dialect=HawqDialect(), column_keys=['id', 'year'])
+        assert str(compiled) == (
+            'INSERT INTO sales_1_prt_2 (id, year, region) VALUES (%(id)s, %(year)s, %(area)s)'
+        )
+
+
+class TestPartitionRouterPython(PurePythonMixin, TestPartitionRouter):
+    pass
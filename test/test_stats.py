@@ -0,0 +1,152 @@
+"""
+Tests the statement statistics collector without connecting to live db.
+"""
+from sqlalchemy import create_engine, event
+from sqlalchemy.testing.suite import fixtures
+
+from sqlalchemy_hawq.stats import LATENCY_BUCKETS, OTHER, HawqStatsCollector, fingerprint
+
+
+class ContextStub:
+    def __init__(self, isddl=False):
+        self.isddl = isddl
+
+
+class CursorStub:
+    def __init__(self, rowcount=-1, query=None):
+        self.rowcount = rowcount
+        self.query = query
+
+
+class CopyStreamStub:
+    rows = 3
+    bytes = 42
+
+
+class ExceptionContextStub:
+    def __init__(self, statement, context):
+        self.statement = statement
+        self.execution_context = context
+
+
+def execute(collector, statement, rowcount=-1, parameters=None, context=None, query=None):  # pylint: disable=too-many-arguments
+    context = context or ContextStub()
+    executemany = isinstance(parameters, list)
+    collector.before_cursor_execute(None, None, statement, parameters, context, executemany)
+    collector.after_cursor_execute(None, CursorStub(rowcount, query), statement, parameters, context, executemany)
+
+
+class TestFingerprint(fixtures.TestBase):
+    def test_literals_and_parameters(self):
+        assert fingerprint(
+            "SELECT * FROM sales WHERE region = 'it''s' AND id = %(id_1)s AND price > 1.5e3"
+        ) == 'SELECT * FROM sales WHERE region = ? AND id = ? AND price > ?'
+
+    def test_lists_are_collapsed(self):
+        short = fingerprint('SELECT * FROM sales WHERE id IN (%(id_1)s, %(id_2)s)')
+        long = fingerprint('SELECT * FROM sales WHERE id IN (1, 2, 3, 4)')
+        assert short == long == 'SELECT * FROM sales WHERE id IN (?)'
+
+    def test_multi_row_values(self):
+        assert fingerprint(
+            "INSERT INTO sales (id, region) VALUES (1, 'e'), (2, 'w'),\n (3, $$it's$$)"
+        ) == 'INSERT INTO sales (id, region) VALUES (?)'
+
+    def test_identifiers_are_kept(self):
+        assert fingerprint('TRUNCATE TABLE sales_1_prt_2') == 'TRUNCATE TABLE sales_1_prt_2'
+
+
+class TestHawqStatsCollector(fixtures.TestBase):
+    def test_statement_stats(self):
+        collector = HawqStatsCollector()
+        execute(collector, 'SELECT * FROM sales WHERE id = %(id_1)s', rowcount=2)
+        execute(collector, 'SELECT * FROM sales WHERE id = %(id_2)s', rowcount=3)
+        stats = collector.snapshot()['statements']['SELECT * FROM sales WHERE id = ?']
+        assert stats['count'] == 2
+        assert stats['rows'] == 5
+        assert stats['bytes_sent'] == 2 * len('SELECT * FROM sales WHERE id = %(id_1)s')
+        assert stats['bytes_received'] == 0
+        assert sum(stats['histogram']) == 2
+        assert len(stats['histogram']) == len(LATENCY_BUCKETS) + 1
+        assert stats['min_seconds'] <= stats['mean_seconds'] <= stats['max_seconds']
+
+    def test_bytes_sent(self):
+        collector = HawqStatsCollector()
+        statement = "SELECT * FROM sales WHERE region = %(region_1)s"
+        execute(collector, statement, query="SELECT * FROM sales WHERE region = 'r\u00e9gion'".encode('utf8'))
+        stats = collector.snapshot()['statements']['SELECT * FROM sales WHERE region = ?']
+        assert stats['bytes_sent'] == len("SELECT * FROM sales WHERE region = 'région'") + 1
+
+    def test_executemany_bytes(self):
+        collector = HawqStatsCollector()
+        statement = 'INSERT INTO sales (id) VALUES (%(id)s)'
+        execute(collector, statement, parameters=[{'id': 1}, {'id': 2}], query=b'INSERT INTO sales (id) VALUES (2)')
+        stats = collector.snapshot()['statements']['INSERT INTO sales (id) VALUES (?)']
+        assert stats['bytes_sent'] == 2 * len('INSERT INTO sales (id) VALUES (2)')
+
+    def test_values_executemany_bytes(self):
+        collector = HawqStatsCollector()
+        context = ContextStub()
+        context.hawq_bytes_sent = 100
+        execute(collector, 'INSERT INTO sales (id) VALUES (%(id)s)', parameters=[{'id': 1}], context=context)
+        assert collector.snapshot()['statements']['INSERT INTO sales (id) VALUES (?)']['bytes_sent'] == 100
+
+    def test_kinds(self):
+        collector = HawqStatsCollector()
+        execute(collector, 'TRUNCATE TABLE sales')
+        execute(collector, 'ALTER TABLE sales TRUNCATE PARTITION FOR (2005)')
+        execute(collector, '\nCREATE TABLE sales (id INTEGER)', context=ContextStub(isddl=True))
+        execute(collector, 'DROP TABLE sales')
+        execute(collector, 'SELECT 1')
+        context = ContextStub()
+        context.hawq_copy_stream = CopyStreamStub()
+        execute(collector, 'INSERT INTO sales (id) VALUES (%(id)s)', parameters=[{'id': 1}], context=context)
+        kinds = collector.snapshot()['kinds']
+        assert kinds['truncate']['count'] == 2
+        assert kinds['ddl']['count'] == 2
+        assert kinds['copy']['count'] == 1
+        assert kinds['copy']['rows'] == 3
+        assert kinds['copy']['bytes_sent'] == 42
+
+    def test_errors(self):
+        collector = HawqStatsCollector()
+        context = ContextStub()
+        collector.before_cursor_execute(None, None, 'SELECT 1', {}, context, False)
+        collector.handle_error(ExceptionContextStub('SELECT 1', context))
+        stats = collector.snapshot()['statements']['SELECT ?']
+        assert stats['errors'] == 1
+        assert stats['count'] == 0
+
+    def test_max_fingerprints(self):
+        collector = HawqStatsCollector(max_fingerprints=2)
+        for table in ['first', 'second', 'third', 'fourth']:
+            execute(collector, 'SELECT * FROM {}'.format(table))
+        statements = collector.snapshot()['statements']
+        assert len(statements) == 3
+        assert statements[OTHER]['count'] == 2
+
+    def test_snapshot_reset(self):
+        collector = HawqStatsCollector()
+        execute(collector, 'TRUNCATE TABLE sales')
+        assert collector.snapshot(reset=True)['kinds']['truncate']['count'] == 1
+        assert collector.snapshot()['statements'] == {}
+        execute(collector, 'SELECT 1')
+        collector.reset()
+        assert collector.snapshot()['kinds']['truncate']['count'] == 0
+
+    def test_top(self):
+        collector = HawqStatsCollector()
+        execute(collector, 'SELECT 1', rowcount=1)
+        execute(collector, 'SELECT * FROM sales', rowcount=10)
+        assert [key for key, _ in collector.top(1, by='rows')] == ['SELECT * FROM sales']
+
+    def test_engine(self):
+        collector = HawqStatsCollector()
+        engine = create_engine('hawq://localhost/dummy_user', stats_collector=collector)
+        assert event.contains(engine, 'before_cursor_execute', collector.before_cursor_execute)
+        assert event.contains(engine, 'after_cursor_execute', collector.after_cursor_execute)
+        collector.detach(engine)
+        assert not event.contains(engine, 'after_cursor_execute', collector.after_cursor_execute)
+        assert not event.contains(
+            create_engine('hawq://localhost/dummy_user'), 'after_cursor_execute', collector.after_cursor_execute
+        )